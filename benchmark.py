@@ -0,0 +1,457 @@
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pygame
+from OpenGL.GL import glFinish
+from main import App, DEFAULT_STATE_FORMAT, STATE_FORMATS, TITLE
+from scene import load_scene
+from solvers import CPUSolver, DEFAULT_DT, GPUSolver, SimClock
+
+SCENES = (
+    "single",
+    "sources",
+    "walls",
+    "rotated",
+)  # Canned scenes of the benchmark suite
+BACKENDS = ("gpu", "cpu")  # Simulation backends of the benchmark suite
+# Metrics compared against the baseline, and whether a higher value is better
+METRICS = {
+    "steps_per_sec": True,
+    "latency_p95_ms": False,
+    "peak_host_mb": False,
+}
+MEMORY_FRAMES = 2  # Untimed frames traced to find the peak memory of a frame
+
+
+def gaussian_pulse(size, radius=0.02):
+    """
+    Builds a field holding a single Gaussian pulse in the centre of the grid, used as a
+    deterministic starting state that every backend can be compared against.
+
+    Args:
+        size (tuple): Size of the simulation grid (width, height).
+        radius (float, optional): Radius of the pulse as a fraction of the grid width. Defaults to 0.02.
+
+    Returns:
+        np.ndarray: A (height, width, 3) float32 array of displacement, velocity and material.
+    """
+    width, height = size
+    x = np.arange(width, dtype=np.float32) - width / 2
+    y = np.arange(height, dtype=np.float32) - height / 2
+    r2 = x[np.newaxis, :] ** 2 + y[:, np.newaxis] ** 2
+    field = np.zeros((height, width, 3), dtype=np.float32)
+    field[..., 0] = 0.5 * np.exp(-r2 / (radius * width) ** 2)
+    field[..., 2] = 1
+    return field
+
+
+def reference_field(size, steps):
+    """
+    Runs the CPU solver from the Gaussian pulse to give the float32 reference for accuracy checks.
+
+    Args:
+        size (tuple): Size of the simulation grid (width, height).
+        steps (int): The number of steps to run.
+
+    Returns:
+        np.ndarray: The (height, width) displacement after `steps` steps.
+    """
+    solver = CPUSolver(size)
+    solver.set_field(gaussian_pulse(size))
+    for _ in range(steps):
+        solver.step(0)
+    return solver.disp.copy()
+
+
+def bench_format(size, stateFormat, steps, reference=None):
+    """
+    Measures the stencil throughput of one state texture format on the GPU, starting from the
+    Gaussian pulse with an empty scene.
+
+    Args:
+        size (tuple): Size of the simulation grid (width, height).
+        stateFormat (str): Key into STATE_FORMATS.
+        steps (int): The number of steps to time.
+        reference (np.ndarray, optional): Displacement from reference_field to compare against.
+
+    Returns:
+        dict: The format, grid size, steps/sec, effective bandwidth in GB/s and the maximum
+              displacement error relative to the reference peak (None without a reference).
+    """
+    app = App(TITLE)
+    app.size = app.width, app.height = size
+    app.stateFormat = stateFormat
+    app.on_init(headless=True)
+    solver = GPUSolver(app)
+    solver.set_field(gaussian_pulse(size))
+
+    # Warm up once so driver set up is not timed
+    solver.step(0)
+    solver.set_field(gaussian_pulse(size))
+    glFinish()
+
+    start = time.perf_counter()
+    for _ in range(steps):
+        solver.step(0)
+    glFinish()  # Wait for the queued passes before stopping the timer
+    elapsed = time.perf_counter() - start
+
+    error = None
+    if reference is not None:
+        disp = solver.get_field()[..., 0]
+        error = float(np.abs(disp - reference).max() / np.abs(reference).max())
+    app.on_cleanup()
+
+    # Each step reads and writes every texel of the state once
+    texels = size[0] * size[1]
+    stepsPerSec = steps / elapsed
+    return {
+        "format": stateFormat,
+        "size": f"{size[0]}x{size[1]}",
+        "steps_per_sec": stepsPerSec,
+        "bandwidth_gb": 2 * texels * STATE_FORMATS[stateFormat][2] * stepsPerSec / 1e9,
+        "error": error,
+    }
+
+
+def bench_formats(sizes, formats, steps, accuracy=True):
+    """
+    Benchmarks every state format at every grid size and prints a table of the results.
+
+    Args:
+        sizes (list): The grid widths to test (the grids are square).
+        formats (list): Keys into STATE_FORMATS.
+        steps (int): The number of steps timed for each run.
+        accuracy (bool, optional): Whether to compare against the CPU reference. Defaults to True.
+
+    Returns:
+        list: The result dictionaries from bench_format.
+    """
+    results = []
+    print(f"{'format':>8} {'size':>10} {'steps/s':>10} {'GB/s':>8} {'error':>10}")
+    for n in sizes:
+        size = (n, n)
+        reference = reference_field(size, steps) if accuracy else None
+        for stateFormat in formats:
+            result = bench_format(size, stateFormat, steps, reference)
+            results.append(result)
+            error = "-" if result["error"] is None else f"{result['error']:.2e}"
+            print(
+                f"{result['format']:>8} {result['size']:>10} {result['steps_per_sec']:>10.1f} "
+                f"{result['bandwidth_gb']:>8.2f} {error:>10}"
+            )
+    return results
+
+
+def canned_scene(name, n):
+    """
+    Builds one of the canned benchmark scenes on an n by n grid. Objects are laid out in proportion
+    to the grid, and any randomness uses a fixed seed, so every run simulates the same scene.
+
+    Args:
+        name (str): "single" for one source, "sources" for a 16 by 16 lattice of sources, "walls" for
+                    one source among 128 walls, or "rotated" for one source among 64 rotated mediums
+                    of refractive indices within the stable range.
+        n (int): Width and height of the grid.
+
+    Returns:
+        dict: The scene description, in the form returned by scene.load_scene.
+    """
+    scene = load_scene()
+    scene["size"] = [n, n]
+    scene["sources"] = [{"pos": [n / 2, n / 2], "frequency": 10, "amplitude": 1}]
+    scene["mediums"] = []
+    rng = np.random.default_rng(0)
+    scale = n / 1024  # Objects are sized for a 1024 grid
+
+    if name == "sources":
+        lattice = np.linspace(0.1 * n, 0.9 * n, 16)
+        scene["sources"] = [
+            {"pos": [float(x), float(y)], "frequency": 10, "amplitude": 1}
+            for x in lattice
+            for y in lattice
+        ]
+    elif name == "walls":
+        for _ in range(128):
+            scene["mediums"].append(
+                {
+                    "pos": (rng.uniform(0.05, 0.9, 2) * n).tolist(),
+                    "size": [float(rng.uniform(20, 120) * scale), 10 * scale],
+                    "rotation": float(rng.choice([0, 90])),
+                    "refractive_index": 0,
+                }
+            )
+    elif name == "rotated":
+        for _ in range(64):
+            scene["mediums"].append(
+                {
+                    "pos": (rng.uniform(0.05, 0.85, 2) * n).tolist(),
+                    "size": (rng.uniform(30, 150, 2) * scale).tolist(),
+                    "rotation": float(rng.uniform(0, 360)),
+                    "refractive_index": float(rng.uniform(0.3, 0.9)),
+                }
+            )
+    elif name != "single":
+        raise ValueError(f"Unknown benchmark scene: {name}")
+    return scene
+
+
+def bench_scene(
+    name,
+    n,
+    backend,
+    frames,
+    stepsPerFrame,
+    stateFormat=DEFAULT_STATE_FORMAT,
+    dt=DEFAULT_DT,
+):
+    """
+    Measures one canned scene on one backend: the throughput in steps/sec, the latency of each
+    frame of stepsPerFrame steps, and the peak memory used. The peak memory is traced through set up
+    and MEMORY_FRAMES untimed frames before the timed frames, so tracing never slows the timed loop.
+
+    Args:
+        name (str): The canned scene, from SCENES.
+        n (int): Width and height of the grid.
+        backend (str): "gpu" to step the simulation shaders, or "cpu" for the NumPy solver.
+        frames (int): The number of frames to time.
+        stepsPerFrame (int): The number of steps in each frame.
+        stateFormat (str, optional): Key into STATE_FORMATS for the GPU. Defaults to DEFAULT_STATE_FORMAT.
+        dt (float, optional): The simulation time advanced per step, in milliseconds. Defaults to DEFAULT_DT.
+
+    Returns:
+        dict: The scene, grid size, backend, steps/sec, frame latency percentiles in milliseconds,
+              peak Python and NumPy heap in MB, and an estimate of the texture memory allocated on
+              the GPU in MB, worked out from the texture sizes rather than measured (None for the CPU).
+
+    Raises:
+        FloatingPointError: If the final field is not finite, since the timings of a diverged run
+                            measure inf and NaN arithmetic rather than the simulation.
+    """
+    scene = canned_scene(name, n)
+    app = App(TITLE)
+    app.set_settings(scene)
+    initialised = False  # Whether the GPU was set up, and needs cleaning up
+    try:
+        # Trace the memory of set up and the warm-up frames, never the timed ones
+        tracemalloc.start()
+        try:
+            if backend == "gpu":
+                app.stateFormat = stateFormat
+                app.on_init(headless=True)
+                initialised = True
+                solver = GPUSolver(app)
+                finish = (
+                    glFinish  # Wait for the queued passes before stopping each timer
+                )
+            else:
+                solver = CPUSolver(
+                    app.size,
+                    app.damping,
+                    app.reflective,
+                    app.spongeWidth,
+                    app.spongeStrength,
+                )
+                finish = lambda: None
+            app.load_objects(scene)
+            solver.set_scene(app.sources, app.mediums)
+
+            # Warm up so driver set up is not timed
+            clock = SimClock(dt)
+            for _ in range(MEMORY_FRAMES):
+                solver.run(clock.advance(stepsPerFrame))
+                finish()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()  # Even if set up fails, so later runs are not traced
+
+        latencies = []
+        start = time.perf_counter()
+        for frame in range(frames):
+            times = clock.advance(stepsPerFrame)
+            frameStart = time.perf_counter()
+            solver.run(times)
+            finish()
+            latencies.append(time.perf_counter() - frameStart)
+        elapsed = time.perf_counter() - start
+        finite = np.isfinite(solver.get_field()).all()
+    finally:
+        if initialised:
+            app.on_cleanup()
+    if not finite:
+        raise FloatingPointError(
+            f"The {name} scene diverged on the {backend} backend at {n}x{n}"
+        )
+
+    # Estimated from two state textures, the material and sponge textures (R32F) and the source
+    # map (R16UI), since drivers do not report the memory they allocate
+    gpuBytes = None
+    if backend == "gpu":
+        gpuBytes = n * n * (2 * STATE_FORMATS[stateFormat][2] + 4 + 4 + 2)
+    p50, p95, p99 = np.percentile(np.array(latencies) * 1000, (50, 95, 99))
+    return {
+        "scene": name,
+        "size": f"{n}x{n}",
+        "backend": backend,
+        "steps_per_sec": frames * stepsPerFrame / elapsed,
+        "latency_p50_ms": float(p50),
+        "latency_p95_ms": float(p95),
+        "latency_p99_ms": float(p99),
+        "peak_host_mb": peak / 1e6,
+        "gpu_texture_mb_est": None if gpuBytes is None else gpuBytes / 1e6,
+    }
+
+
+def get_key(result):
+    # Returns the key a result is stored under in a baseline file.
+    return f"{result['scene']}/{result['size']}/{result['backend']}"
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compares results against a baseline, flagging every metric that got worse by more than the
+    tolerance. Results with no matching baseline entry are skipped.
+
+    Args:
+        results (list): The result dictionaries from bench_scene.
+        baseline (dict): Maps each key from get_key to a stored result.
+        tolerance (float): The allowed relative change, such as 0.1 for 10%.
+
+    Returns:
+        list: A description of each regression.
+    """
+    regressions = []
+    for result in results:
+        base = baseline.get(get_key(result))
+        if base is None:
+            continue
+        for metric, higherIsBetter in METRICS.items():
+            old, new = base.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (higherIsBetter and change < -tolerance) or (
+                not higherIsBetter and change > tolerance
+            ):
+                regressions.append(
+                    f"{get_key(result)} {metric}: {old:.3f} -> {new:.3f} ({change:+.1%})"
+                )
+    return regressions
+
+
+def bench_suite(scenes, sizes, backends, frames, stepsPerFrame):
+    """
+    Runs every canned scene at every grid size on every available backend and prints a table of
+    the results. A backend that cannot be set up (such as the GPU with no OpenGL context) is
+    skipped for the rest of the suite.
+
+    Args:
+        scenes (list): Names from SCENES.
+        sizes (list): The grid widths to test (the grids are square).
+        backends (list): Names from BACKENDS.
+        frames (int): The number of frames timed for each run.
+        stepsPerFrame (int): The number of steps in each frame.
+
+    Returns:
+        list: The result dictionaries from bench_scene.
+    """
+    results = []
+    available = list(backends)
+    print(
+        f"{'scene':>8} {'size':>10} {'backend':>8} {'steps/s':>10} {'p50 ms':>8} "
+        f"{'p95 ms':>8} {'p99 ms':>8} {'host MB':>8} {'~gpu MB':>8}"
+    )
+    for n in sizes:
+        for name in scenes:
+            for backend in list(available):
+                try:
+                    result = bench_scene(name, n, backend, frames, stepsPerFrame)
+                except FloatingPointError:
+                    raise  # A diverged scene is a bug, not a missing backend
+                except Exception as error:
+                    print(f"Skipping the {backend} backend: {error}")
+                    available.remove(backend)
+                    continue
+                results.append(result)
+                gpu = result["gpu_texture_mb_est"]
+                print(
+                    f"{name:>8} {result['size']:>10} {backend:>8} {result['steps_per_sec']:>10.1f} "
+                    f"{result['latency_p50_ms']:>8.2f} {result['latency_p95_ms']:>8.2f} "
+                    f"{result['latency_p99_ms']:>8.2f} {result['peak_host_mb']:>8.1f} "
+                    f"{'-' if gpu is None else f'{gpu:.1f}':>8}"
+                )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="State texture format benchmark, or the canned scene suite with --suite"
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=[256, 1024, 4096])
+    parser.add_argument(
+        "--formats", nargs="+", choices=list(STATE_FORMATS), default=list(STATE_FORMATS)
+    )
+    parser.add_argument("--steps", type=int, default=200)
+    parser.add_argument(
+        "--no-accuracy",
+        action="store_true",
+        help="skip the comparison against the CPU reference",
+    )
+    parser.add_argument(
+        "--suite",
+        action="store_true",
+        help="run the canned scenes on every backend instead of comparing state formats",
+    )
+    parser.add_argument("--scenes", nargs="+", choices=SCENES, default=list(SCENES))
+    parser.add_argument(
+        "--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS)
+    )
+    parser.add_argument(
+        "--frames", type=int, default=30, help="frames timed for each suite run"
+    )
+    parser.add_argument(
+        "--steps-per-frame", type=int, default=4, help="steps in each suite frame"
+    )
+    parser.add_argument(
+        "--baseline", help="JSON file of stored suite results to compare against"
+    )
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="write the suite results to the baseline file instead of comparing",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="relative change allowed before a metric is flagged as a regression",
+    )
+    args = parser.parse_args()
+    if not args.suite:
+        bench_formats(args.sizes, args.formats, args.steps, not args.no_accuracy)
+        pygame.quit()
+        sys.exit()
+
+    results = bench_suite(
+        args.scenes, args.sizes, args.backends, args.frames, args.steps_per_frame
+    )
+    pygame.quit()
+    if args.baseline is None:
+        sys.exit()
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump({get_key(result): result for result in results}, file, indent=4)
+        print(f"Saved {len(results)} results to {args.baseline}")
+        sys.exit()
+
+    with open(args.baseline, "r") as file:
+        baseline = json.load(file)
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if regressions:
+        sys.exit(1)
+    print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}")
@@ -0,0 +1,274 @@
+import hashlib
+import json
+import os
+import numpy as np
+from files import write_atomic
+from sim_classes import Medium, Source
+
+CHECKPOINT_VERSION = 1  # Checked on load, so files from an older layout are refused
+# Binary records of the scene, one row per entity or action
+SOURCE_DTYPE = np.dtype(
+    [
+        ("id", np.int64),
+        ("pos", np.float64, 2),
+        ("freq", np.float64),
+        ("amp", np.float64),
+        ("zerot", np.float64),
+        ("phase", np.float64),
+    ]
+)
+MEDIUM_DTYPE = np.dtype(
+    [
+        ("id", np.int64),
+        ("pos", np.float64, 2),
+        ("size", np.float64, 2),
+        ("rot", np.float64),
+        ("n", np.float64),
+    ]
+)
+ACTION_DTYPE = np.dtype(
+    [
+        ("kind", "S1"),  # "m" (move), "c" (create) or "d" (delete)
+        ("id", np.int64),
+        ("start", np.float64, 2),  # Position before a move
+        ("end", np.float64, 2),  # Position after a move
+    ]
+)
+
+
+def pack_sources(sources) -> np.ndarray:
+    """
+    Packs sources into SOURCE_DTYPE records, gathered straight from their SceneStore columns.
+
+    Args:
+        sources (list): Source objects, all in the same store.
+
+    Returns:
+        np.ndarray: One record per source, in order.
+    """
+    records = np.zeros(len(sources), dtype=SOURCE_DTYPE)
+    if len(sources):
+        store = sources[0].hitbox.store
+        slots = store.get_slots(sources)
+        for name in ("pos", "freq", "amp", "zerot", "phase"):
+            records[name] = getattr(store, name)[slots]
+        records["id"] = store.ids[slots]
+    return records
+
+
+def pack_mediums(mediums) -> np.ndarray:
+    """
+    Packs walls and mediums into MEDIUM_DTYPE records, gathered from their SceneStore columns.
+
+    Args:
+        mediums (list): Medium objects, all in the same store.
+
+    Returns:
+        np.ndarray: One record per medium, in order.
+    """
+    records = np.zeros(len(mediums), dtype=MEDIUM_DTYPE)
+    if len(mediums):
+        store = mediums[0].hitbox.store
+        slots = store.get_slots(mediums)
+        for name in ("pos", "size", "rot", "n"):
+            records[name] = getattr(store, name)[slots]
+        records["id"] = store.ids[slots]
+    return records
+
+
+def shuffle(bits) -> np.ndarray:
+    """
+    Splits 32-bit values into four planes of bytes, so that the similar high bytes of neighbouring
+    floats sit next to each other and compress better.
+
+    Args:
+        bits (np.ndarray): A float32 or uint32 array.
+
+    Returns:
+        np.ndarray: A (4, size) uint8 array, one row per byte of each value.
+    """
+    return np.ascontiguousarray(bits.view(np.uint8).reshape(-1, 4).T)
+
+
+def unshuffle(planes, shape) -> np.ndarray:
+    """
+    Reassembles the 32-bit values split up by shuffle.
+
+    Args:
+        planes (np.ndarray): The (4, size) uint8 array from shuffle.
+        shape (tuple): The shape of the original array.
+
+    Returns:
+        np.ndarray: The uint32 values in their original shape.
+    """
+    return np.ascontiguousarray(planes.T).view(np.uint32).reshape(shape)
+
+
+def get_digest(field) -> str:
+    # Returns a hash of the bits of a field, identifying it as the base of delta checkpoints
+    return hashlib.sha256(
+        np.ascontiguousarray(field, dtype=np.float32).tobytes()
+    ).hexdigest()
+
+
+def save_checkpoint(
+    path, field, settings, sources, mediums, actions=(), pointer=0, base=None
+):
+    """
+    Saves the state of a running simulation to a compressed checkpoint file.
+
+    The float32 bits of the field are split into byte planes before compression. Given a base
+    checkpoint, the XOR of its bits with the base field is stored instead. This is lossless, and every
+    texel that has not changed since the base becomes zero, so it pays off when much of the field is
+    still (shielded regions, or a field that has decayed). A field oscillating everywhere gains
+    little from it. Sources, mediums and the undo history are stored as binary records, including
+    items that only the undo history still refers to.
+
+    Args:
+        path (str): The path of the checkpoint file.
+        field (np.ndarray): A (height, width, 2) array of displacement and velocity.
+        settings (dict): The scene settings and simulation clock, stored as JSON.
+        sources (list): The sources in the scene, in order.
+        mediums (list): The walls and mediums in the scene, in order.
+        actions (list, optional): The action stack. Defaults to ().
+        pointer (int, optional): The action stack pointer. Defaults to 0.
+        base (str, optional): A checkpoint of the same grid to delta-encode the field against.
+                              If saving would overwrite the base, or a checkpoint it depends on,
+                              the field is saved in full instead.
+    """
+    field = np.ascontiguousarray(field[..., :2], dtype=np.float32)
+    if base is not None and os.path.realpath(path) in get_chain(base):
+        base = None  # The delta would replace its own base, losing the field for good
+    meta = {
+        "version": CHECKPOINT_VERSION,
+        "settings": settings,
+        "pointer": pointer,
+        "shape": list(field.shape),
+    }
+    arrays = {}
+    if base is None:
+        arrays["field"] = shuffle(field)
+    else:
+        baseField = load_checkpoint(base)["field"]
+        if baseField.shape != field.shape:
+            raise ValueError("The base checkpoint has a different grid size")
+        arrays["delta"] = shuffle(field.view(np.uint32) ^ baseField.view(np.uint32))
+        # Stored relative to this checkpoint, so the pair can be moved together
+        meta["base"] = os.path.relpath(
+            os.path.abspath(base), os.path.dirname(os.path.abspath(path))
+        )
+        meta["base_digest"] = get_digest(baseField)
+
+    # Items that were deleted (or whose creation was undone) only live on in the action stack
+    live = {item.get_id() for item in list(sources) + list(mediums)}
+    detached = {}
+    records = np.zeros(len(actions), dtype=ACTION_DTYPE)
+    for index, action in enumerate(actions):
+        records["kind"][index] = action[0]
+        if action[0] == "m":
+            records["id"][index] = action[3]
+            records["start"][index] = action[1]
+            records["end"][index] = action[2]
+        else:
+            id = action[1].get_id()
+            records["id"][index] = id
+            if id not in live:
+                detached[id] = action[1]
+    detachedSources = [item for item in detached.values() if isinstance(item, Source)]
+    detachedMediums = [item for item in detached.values() if isinstance(item, Medium)]
+
+    arrays.update(
+        meta=np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8),
+        sources=pack_sources(sources),
+        mediums=pack_mediums(mediums),
+        detached_sources=pack_sources(detachedSources),
+        detached_mediums=pack_mediums(detachedMediums),
+        actions=records,
+    )
+
+    write_atomic(path, lambda file: np.savez_compressed(file, **arrays))
+
+
+def read_meta(path) -> dict:
+    # Returns the JSON metadata of a checkpoint file, without decompressing its arrays
+    with np.load(path, allow_pickle=False) as data:
+        return json.loads(data["meta"].tobytes().decode())
+
+
+def get_base(path, meta):
+    # Returns the path of the base checkpoint named in the metadata of a checkpoint, or None
+    if "base" not in meta:
+        return None
+    return os.path.join(os.path.dirname(os.path.abspath(path)), meta["base"])
+
+
+def get_chain(path) -> list:
+    """
+    Follows a checkpoint through the base checkpoints its field is delta-encoded against.
+
+    Args:
+        path (str): The path of the checkpoint file.
+
+    Returns:
+        list: The real paths of the checkpoint and each base it depends on, nearest first.
+
+    Raises:
+        ValueError: If the chain of bases loops back on itself.
+    """
+    chain = []
+    while path is not None:
+        resolved = os.path.realpath(path)
+        if resolved in chain:
+            raise ValueError(f"The base checkpoints of {chain[0]} loop back on {path}")
+        chain.append(resolved)
+        path = get_base(path, read_meta(path))
+    return chain
+
+
+def load_checkpoint(path) -> dict:
+    """
+    Loads a checkpoint file saved by save_checkpoint, undoing any delta encoding.
+
+    Args:
+        path (str): The path of the checkpoint file.
+
+    Returns:
+        dict: The field (a (height, width, 2) float32 array), settings, pointer, and the sources,
+              mediums, detached_sources, detached_mediums and actions as binary records.
+
+    Raises:
+        ValueError: If the file is from another version, its base checkpoint has changed, or its
+                    chain of base checkpoints loops back on itself.
+    """
+    # Decode the field from the furthest base inwards, so each file is read once
+    chain = get_chain(path)
+    field = None
+    for file in reversed(chain):
+        with np.load(file, allow_pickle=False) as data:
+            meta = json.loads(data["meta"].tobytes().decode())
+            if meta["version"] != CHECKPOINT_VERSION:
+                raise ValueError(f"Unsupported checkpoint version {meta['version']}")
+            if "base" in meta:
+                if get_digest(field) != meta["base_digest"]:
+                    raise ValueError(
+                        f"The base checkpoint {get_base(file, meta)} has changed"
+                    )
+                delta = unshuffle(data["delta"], meta["shape"])
+                field = (delta ^ field.view(np.uint32)).view(np.float32)
+            else:
+                field = unshuffle(data["field"], meta["shape"]).view(np.float32)
+            if file == chain[0]:
+                checkpoint = {
+                    name: data[name]
+                    for name in (
+                        "sources",
+                        "mediums",
+                        "detached_sources",
+                        "detached_mediums",
+                        "actions",
+                    )
+                }
+    checkpoint["field"] = field
+    checkpoint["settings"] = meta["settings"]
+    checkpoint["pointer"] = meta["pointer"]
+    return checkpoint
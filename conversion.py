@@ -107,31 +107,135 @@ def thickLinePoints(arr: List[float], thick: float) -> List[float]:
 
     Args:
         arr (List[float]): List of vertex positions in the form [x1, y1, x2, y2, ..., xn, yn].
-        thick (float): The thickness of the line.
+        thick (float): The distance of each edge of the line from its centre.
 
     Returns:
-        List[float]: List of points for the thick line.
+        List[float]: Triangle strip vertices for the thick line, in the same flat form.
     """
-    result = []
-    for i in range(0, len(arr) - 2, 2):
-        dx = arr[i + 2] - arr[i]
-        dy = arr[i + 3] - arr[i + 1]
-        dl = np.sqrt(dx**2 + dy**2)
-
-        if dl > 0:
-            mult = thick / dl
-            ax = mult * dy
-            ay = -mult * dx
-
-        result.append(arr[i] + ax)
-        result.append(arr[i + 1] + ay)
-        result.append(arr[i] - ax)
-        result.append(arr[i + 1] + ay)
-
-    # Add the last two points
-    result.append(arr[i] + ax)
-    result.append(arr[i + 1] + ay)
-    result.append(arr[i] - ax)
-    result.append(arr[i + 1] + ay)
-
-    return result
+    points = np.asarray(arr, dtype=np.float64).reshape(-1, 2)
+    vertices, _, _ = thick_polylines(points, [0, len(points)], thick)
+    return vertices.ravel().tolist()
+
+
+def thick_polylines(
+    points: np.ndarray,
+    offsets: np.ndarray,
+    thick: float,
+    closed: bool = False,
+    miterLimit: float = 4.0,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Generate triangle strips for many thick polylines at once, with mitred joins.
+
+    The polylines are given as one ragged array: the points of polyline i are
+    points[offsets[i]:offsets[i + 1]]. Every point becomes a pair of strip vertices either side of
+    the line, offset along the bisector of the segments meeting there. Zero-length segments are
+    skipped over: each point joins the nearest segments of non-zero length before and after it,
+    so every copy of a repeated point gets the same mitred join. Miters are capped at
+    `miterLimit` times the thickness so sharp corners do not spike.
+
+    Args:
+        points (np.ndarray): (P, 2) points of every polyline, one after another.
+        offsets (np.ndarray): (L + 1,) start of each polyline in points, ending with P.
+        thick (float): The distance of each edge of the line from its centre.
+        closed (bool, optional): Whether each polyline joins back to its first point. Defaults to False.
+        miterLimit (float, optional): The longest miter as a multiple of thick. Defaults to 4.0.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: The float32 strip vertices (V, 2), and the first
+        vertex and vertex count of each strip, ready for glBufferData and glMultiDrawArrays.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    offsets = np.asarray(offsets, dtype=np.intp)
+    counts = np.diff(offsets)
+    index = np.arange(len(points))
+
+    # Previous and next point of every point within its own polyline
+    line = np.repeat(np.arange(len(counts)), counts)
+    first = offsets[:-1][line]
+    last = offsets[1:][line] - 1
+    prev = index - 1
+    next = index + 1
+    if closed:
+        prev = np.where(index == first, last, prev)
+        next = np.where(index == last, first, next)
+    hasPrev = closed | (index != first)
+    hasNext = closed | (index != last)
+
+    def unit(v):
+        # Normalises each row, leaving zero-length rows at zero
+        length = np.linalg.norm(v, axis=1, keepdims=True)
+        return np.divide(v, length, out=np.zeros_like(v), where=length > 0)
+
+    # Directions of the segments arriving at and leaving every point (zero where there is none)
+    dirIn = np.zeros_like(points)
+    dirOut = np.zeros_like(points)
+    dirIn[hasPrev] = unit(points[hasPrev] - points[prev[hasPrev]])
+    dirOut[hasNext] = unit(points[next[hasNext]] - points[hasNext])
+
+    # Across zero-length segments, carry the directions over from the neighbouring points, one
+    # point further each pass, until every run of repeated points is filled
+    for direction, neighbour, has in ((dirIn, prev, hasPrev), (dirOut, next, hasNext)):
+        while True:
+            missing = has & ~direction.any(axis=1)
+            missing[missing] = direction[neighbour[missing]].any(axis=1)
+            if not missing.any():
+                break
+            direction[missing] = direction[neighbour[missing]]
+
+    # A segment direction to fall back on at ends, zero-length segments and reversals
+    outLength = np.linalg.norm(dirOut, axis=1, keepdims=True)
+    segment = np.where(outLength > 0, dirOut, dirIn)
+
+    # Tangent along the bisector of the two segments
+    tangent = unit(dirIn + dirOut)
+    flat = np.linalg.norm(tangent, axis=1) == 0
+    tangent[flat] = segment[flat]
+
+    # Offset along the normal of the tangent, lengthened so each edge stays `thick` from its segment
+    normal = np.stack([-tangent[:, 1], tangent[:, 0]], axis=1)
+    segNormal = np.stack([-segment[:, 1], segment[:, 0]], axis=1)
+    cos = np.maximum(np.sum(normal * segNormal, axis=1), 1 / miterLimit)
+    offset = normal * (thick / cos)[:, np.newaxis]
+
+    # Two vertices per point, repeating the first point of closed polylines to close the strip
+    pairs = np.stack([points + offset, points - offset], axis=1)
+    order = index
+    if closed:
+        order = np.insert(index, offsets[1:], offsets[:-1])
+    vertices = pairs[order].reshape(-1, 2).astype(np.float32)
+
+    stripCounts = 2 * (counts + (1 if closed else 0))
+    stripCounts[counts == 0] = 0
+    firsts = np.concatenate([[0], np.cumsum(stripCounts)[:-1]]).astype(np.int32)
+    return vertices, firsts, stripCounts.astype(np.int32)
+
+
+def rotate_boxes(pos: np.ndarray, size: np.ndarray, rot: np.ndarray) -> np.ndarray:
+    """
+    Rotate many boxes about their centres at once.
+
+    The corners come out in the same order as Medium.get_rotated: top-left, bottom-left,
+    bottom-right, top-right (before rotation). Nothing passed in is modified.
+
+    Args:
+        pos (np.ndarray): (N, 2) top-left positions (x, y) of the unrotated boxes.
+        size (np.ndarray): (N, 2) sizes (width, height) of the boxes.
+        rot (np.ndarray): (N,) rotations in degrees.
+
+    Returns:
+        np.ndarray: An (N, 4, 2) array of the rotated corners.
+    """
+    pos = np.asarray(pos, dtype=np.float64).reshape(-1, 2)
+    half = np.asarray(size, dtype=np.float64).reshape(-1, 2) / 2
+    r = np.radians(np.asarray(rot, dtype=np.float64).reshape(-1))
+
+    # Corners relative to the centre of each box
+    signs = np.array([[-1, -1], [-1, 1], [1, 1], [1, -1]], dtype=np.float64)
+    offsets = signs[np.newaxis, :, :] * half[:, np.newaxis, :]
+
+    # Row vectors times [[cos, -sin], [sin, cos]] for every box in one product
+    c, s = np.cos(r), np.sin(r)
+    mats = np.stack([np.stack([c, -s], axis=-1), np.stack([s, c], axis=-1)], axis=-2)
+    rotated = np.einsum("nki,nij->nkj", offsets, mats)
+    return rotated + (pos + half)[:, np.newaxis, :]
@@ -0,0 +1,25 @@
+import os
+
+
+def write_atomic(path, write):
+    """
+    Writes a file through a temporary file next to it, replacing the file only once writing has
+    finished. A crash never leaves a truncated file behind, and the temporary file is removed if
+    writing fails.
+
+    Args:
+        path (str): The path of the file.
+        write (callable): Called with the temporary file, open for binary writing, to fill it.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp, "wb") as file:
+            write(file)
+        os.replace(temp, path)
+    except BaseException:
+        try:
+            os.remove(temp)
+        except OSError:
+            pass
+        raise
@@ -9,7 +9,6 @@ class Shader:
         vid (int): The vertex shader ID.
         vertexPositionAttribute (int or None): The attribute for the vertex position.
         textureCoordAttribute (int or None): The attribute for the texture coordinates.
-        dampingAttribute (int or None): The attribute for damping.
         colourAttribute (int or None): The attribute for colour information.
         pMatrixUniform (int or None): The uniform for the projection matrix.
         mvMatrixUniform (int or None): The uniform for the model-view matrix.
@@ -30,7 +29,6 @@ class Shader:
         self.vid = v_id
         self.vertexPositionAttribute = None
         self.textureCoordAttribute = None
-        self.dampingAttribute = None
         self.colourAttribute = None
 
         self.pMatrixUniform = None
@@ -53,9 +51,6 @@ class Shader:
     def get_textureCoordAttribute(self) -> int:
         return self.textureCoordAttribute
 
-    def get_dampingAttribute(self) -> int:
-        return self.dampingAttribute
-
     def get_colourAttribute(self) -> int:
         return self.colourAttribute
 
@@ -84,9 +79,6 @@ class Shader:
     def set_textureCoordAttribute(self, textureCoordAttribute: int):
         self.textureCoordAttribute = textureCoordAttribute
 
-    def set_dampingAttribute(self, dampingAttribute: int):
-        self.dampingAttribute = dampingAttribute
-
     def set_colourAttribute(self, colourAttribute: int):
         self.colourAttribute = colourAttribute
 
@@ -108,6 +100,7 @@ class ShaderMain(Shader):
     Attributes:
         brightnessUniform (int or None): The uniform for controlling brightness.
         coloursUniform (int or None): The uniform for controlling colour.
+        materialUniform (int or None): The uniform for the material texture sampler.
     """
 
     def __init__(self, p_id: int, f_id: int = 0, v_id: int = 0):
@@ -122,6 +115,7 @@ class ShaderMain(Shader):
         super().__init__(p_id, f_id, v_id)
         self.brightnessUniform = None
         self.coloursUniform = None
+        self.materialUniform = None
 
 
 class ShaderSimulate(Shader):
@@ -132,6 +126,11 @@ class ShaderSimulate(Shader):
     Attributes:
         stepSizeXUniform (int or None): The uniform for controlling the step size in the X direction.
         stepSizeYUniform (int or None): The uniform for controlling the step size in the Y direction.
+        timeUniform (int or None): The uniform for the simulation time the sources are evaluated at.
+        sourceMapUniform (int or None): The uniform for the source map texture sampler.
+        materialUniform (int or None): The uniform for the material texture sampler.
+        dampingUniform (int or None): The uniform for the global damping factor.
+        spongeUniform (int or None): The uniform for the absorbing layer texture sampler.
     """
 
     def __init__(self, p_id: int, f_id: int = 0, v_id: int = 0):
@@ -146,6 +145,11 @@ class ShaderSimulate(Shader):
         super().__init__(p_id, f_id, v_id)
         self.stepSizeXUniform = None
         self.stepSizeYUniform = None
+        self.timeUniform = None
+        self.sourceMapUniform = None
+        self.materialUniform = None
+        self.dampingUniform = None
+        self.spongeUniform = None
 
 
 # Classes used for buffer setup
@@ -2,11 +2,42 @@ import pygame
 from pygame.locals import *
 from OpenGL.GL import *
 from OpenGL.GLU import *
-from OpenGL.GL.shaders import compileShader
 from conversion import *
 from gl_classes import *
 from sim_classes import *
+from solvers import (
+    CPUSolver,
+    GPUSolver,
+    SPONGE_STRENGTH,
+    SPONGE_WIDTH,
+    DEFAULT_DT,
+    MAX_SOURCES,
+    SimClock,
+    sim_geometry,
+    simulated_sources,
+    source_texels,
+    sponge_profile,
+)
+from scene import load_scene
+from checkpoint import load_checkpoint, save_checkpoint
+from material import MaterialGrid, union_rect
+from spatial import SpatialGrid
+from registry import Registry
+from shader_cache import ProgramCache
+from shader_registry import ShaderRegistry
+from profiler import FrameProfiler, GLCallCounter
+from ui import TextCache
+from pacing import FramePacer, PACING_MODES
+from readback import AsyncReadback
+from recorder import FrameRecorder, RECORD_FORMATS
 import numpy as np
+import argparse
+import contextlib
+import ctypes
+import json
+import os
+import sys
+import time
 
 # Constants
 TITLE = "Wave Sim"  # Window title
@@ -16,7 +47,36 @@ KEYBINDS = {
     "undo": pygame.K_z,  # Keybind for undoing the last action
     "redo": pygame.K_x,  # Keybind for redoing the last undone action
     "delete": pygame.K_d,  # Keybind for deleting selected items
+    "checkpoint": pygame.K_c,  # Keybind for saving a checkpoint of the running simulation
 }
+# Simulation time in milliseconds after which the source phases are taken again on the CPU, keeping
+# the float32 time passed to the simulation shaders small enough to stay precise
+SOURCE_EPOCH_SPAN = 256
+SOURCE_TEXEL_UPLOADS = 8  # Most changed source texels uploaded one at a time
+# Modules besides this one whose OpenGL calls are counted when profiling. The profiler's own
+# timer queries are left out, so the count only covers the work being measured
+GL_CALL_MODULES = ("solvers", "readback", "pacing", "shader_registry", "shader_cache")
+STATE_FORMATS = {
+    "RGBA8": (GL_RGBA8, 4, 4),  # 8-bit unsigned normalised, clamped to [0, 1]
+    "RGBA16F": (GL_RGBA16F, 4, 8),  # Half floats
+    "RGBA32F": (GL_RGBA32F, 4, 16),  # Full floats
+    "RG16F": (GL_RG16F, 2, 4),  # Half floats, displacement and velocity only
+    "RG32F": (GL_RG32F, 2, 8),  # Full floats, displacement and velocity only
+}  # Internal formats for the ping-pong state textures: (format, channels, bytes per texel)
+# The material lives in its own texture, so the state only needs displacement and velocity
+DEFAULT_STATE_FORMAT = "RG32F"
+ATTRIBUTE_LOCATIONS = {
+    "aPos": 0,
+    "aTexCoord": 1,
+    "aCol": 1,
+}  # Vertex attribute locations, fixed by the layout qualifiers in vs.glsl and draw-vs.glsl
+WALL_THICKNESS = (
+    0.75  # Distance of each edge of a wall outline from the wall's edge, in texels
+)
+WALL_VERTICES = (
+    10  # Triangle strip vertices per wall outline: a pair per corner, closed
+)
+PROFILE_REFRESH = 30  # Frames between updates of the timings shown in the input panel
 
 
 class App:
@@ -29,12 +89,33 @@ class App:
             1024,
             1024,
         )  # Dimensions of the application window
-        self.windowOffset = 0.04  # Offset of the window from the screen edge
+        self.spongeWidth = (
+            SPONGE_WIDTH  # Width of the absorbing layer at the grid edge, in texels
+        )
+        self.spongeStrength = (
+            SPONGE_STRENGTH  # Absorption at the outer edge of the layer
+        )
+        self.windowOffset = (
+            self.get_margin()
+        )  # Offset of the window from the screen edge
         self.caption = TITLE  # Title of the window
-        self.dragItems = []  # List of items that can be dragged around in the UI
-        self.sources = []  # List of all sources (wave generators)
-        self.mediums = []  # List of all walls or materials that interact with the wave
+        self.store = (
+            SceneStore()
+        )  # Arrays holding the parameters of every source and medium
+        self.registry = Registry()  # Every source and medium, by id
+        self.dragItems = (
+            {}
+        )  # Rects of the items that can be dragged around in the UI, by id
+        self.sources = self.registry.get_list(
+            "s"
+        )  # Dense list of all sources (wave generators)
+        self.mediums = self.registry.get_list(
+            "w"
+        )  # Dense list of all walls or materials that interact with the wave
         self.numDragItems = 0  # Counter for draggable items
+        self.spatial = (
+            SpatialGrid()
+        )  # Index of the outlines of dragItems for picking with the mouse
 
         # Surfaces for various parts of the application
         self.inputsSurface = None  # Surface for displaying sliders or input elements
@@ -48,6 +129,18 @@ class App:
         self.actionstack = []  # Stack of actions for undo/redo functionality
         self.actionstackpointer = 0  # Pointer to separate undone and done actions
         self.text = None  # Font information for rendering text using pygame
+        self.textCache = None  # Rendered labels of the input panel, by text (TextCache)
+        self.panelTexture = (
+            None  # Texture the input panel is uploaded to whenever it changes
+        )
+        self.panelTexCoordVBO = None  # VBO containing texture coordinates for the panel
+        self.panelVAO = (
+            None  # Vertex array object holding the quad the panel is drawn on
+        )
+        self.panelState = None  # What the panel showed when it was last drawn
+        self.profileLines = (
+            []
+        )  # Timings currently shown in the panel, refreshed every PROFILE_REFRESH frames
 
         # Active/selected item tracking
         self.active = 0  # Index of the most recently interacted with item (default is the first source)
@@ -66,47 +159,104 @@ class App:
         )
 
         # Time and simulation settings
-        self.clock = pygame.time.Clock()  # Pygame clock for frame rate control
+        self.pacer = (
+            None  # Paces the main loop and chooses the steps per frame (FramePacer)
+        )
+        self.pacingMode = "fps"  # Key into PACING_MODES for how the main loop is paced
+        self.targetFPS = 60  # Frame rate aimed for when pacing to a target or to vsync
         self.startTime = (
             0  # Timestamp marking when the simulation started (may be adjusted)
         )
-        self.time = 0  # Current time in the simulation
+        self.simClock = (
+            SimClock()
+        )  # Simulation time, advanced by a fixed dt for every step
+        self.time = 0  # Simulation time of the most recent step
         self.wavelength = 10  # Wavelength used in the wave simulation
         self.damping = (
             1.0  # Damping factor to simulate energy loss over time in the wave
         )
 
-        # Shaders for rendering the simulation
-        self.displayShader = (
-            None  # Shader responsible for displaying the simulation on screen
+        # Shaders for rendering the simulation, each built the first time it is used
+        self.shaders = None  # Registry of the shader programs (ShaderRegistry)
+        self.useShaderCache = (
+            True  # Whether linked programs are cached on disk between runs
         )
-        self.mainShaderAbs = (
-            None  # Shader for calculating wave propagation with absorption by walls
+
+        # Frame profiling
+        self.profiling = (
+            False  # Whether each frame is timed and the timings are shown in the panel
+        )
+        self.profileLog = (
+            None  # JSON-lines file that per-frame timings are streamed to, if any
+        )
+        self.profiler = (
+            None  # Per-phase CPU and GPU timer of each frame (FrameProfiler)
+        )
+        self.glCalls = (
+            None  # Counter of the OpenGL calls made each frame (GLCallCounter)
         )
-        self.mainShaderRef = None  # Shader for calculating wave reflection off walls
-        self.drawShader = None  # Shader for drawing objects onto the screen
 
         # Vertex Buffer Objects (VBOs) used for rendering and simulation calculations
         self.posVBO = None  # VBO containing positions of objects to be displayed
         self.texCoordVBO = None  # VBO containing texture coordinates for the display
-        self.sourceVBO = None  # VBO used for drawing the sources (wave generators)
+        self.sourceUBO = None  # Uniform buffer holding the parameters of every source
+        self.sourceMap = None  # Texture holding the index of the source at each texel
+        self.sourceMapData = None  # CPU copy of sourceMap, edited in place
+        self.sourceTexels = (
+            np.zeros(0, dtype=np.intp),
+            np.zeros(0, dtype=np.intp),
+        )  # The x and y texels marked in sourceMapData
+        self.sourcesDirty = True  # Flag indicating the sources must be uploaded again
+        self.sourceBank = SourceBank()  # Float64 parameters of the simulated sources
+        self.sourceEpoch = None  # Simulation time the phases in sourceUBO were taken at
+        self.wallVBO = None  # VBO holding the outlines of every wall
+        self.wallVAO = None  # Vertex array object for drawing wallVBO
+        self.wallsDirty = True  # Flag indicating wallVBO must be rebuilt
+        self.material = None  # CPU copy of the material of every texel (MaterialGrid)
+        self.materialTexture = None  # Texture holding the material read by the shaders
+        self.spongeTexture = (
+            None  # Texture holding the absorbing layer at the grid edge
+        )
 
         # Simulation VBOs (used for wave propagation calculations)
         self.simPosVBO = (
             None  # VBO containing positions used in simulation calculations
         )
-        self.simPos = []  # List of positions for the simulation calculation
         self.simTexCoordVBO = (
             None  # VBO containing texture coordinates for the simulation
         )
-        self.simTexCoord = []  # List of texture coordinates used in the simulation
-        self.simDampingVBO = (
-            None  # VBO containing damping values at each vertex in the simulation
+        self.simVAO = None  # Vertex array object holding the stencil pass attributes
+        self.fieldReadback = (
+            None  # Ring of pixel buffers the state is read back through (AsyncReadback)
+        )
+        self.fieldListeners = (
+            []
+        )  # [callback, every, next step] of each consumer of the field
+
+        # Recording of the displayed simulation
+        self.recordPath = None  # Directory (png) or file (y4m, raw) the display is recorded to, if any
+        self.recordFormat = "png"  # Key into RECORD_FORMATS for how frames are written
+        self.recordEvery = 1  # Only every Nth displayed frame is recorded
+        self.recorder = (
+            None  # Encodes and writes recorded frames on worker threads (FrameRecorder)
+        )
+        self.recordTexture = (
+            None  # Texture the display pass is drawn into for recording
+        )
+        self.frameReadback = (
+            None  # Ring of pixel buffers recorded frames are read back through
+        )
+
+        # Checkpoints of the running simulation
+        self.checkpointPath = "checkpoint.npz"  # File the checkpoint keybind saves to
+        self.checkpointBase = (
+            None  # Checkpoint that saved fields are delta-encoded against, if any
         )
-        self.simDamping = []  # List of damping values for each vertex in the simulation
 
         # Simulation state
         self.reflective = False  # Flag indicating if the simulation includes reflective behavior (e.g., walls reflecting waves)
+        self.stepsPerFrame = 1  # Fewest simulation steps run for every displayed frame
+        self.stateFormat = DEFAULT_STATE_FORMAT  # Key into STATE_FORMATS for the state
 
         # Matrices for 3D transformations (though the simulation operates in 2D, OpenGL conventions are followed)
         self.mvMatrix = np.matrix(
@@ -152,91 +302,65 @@ class App:
         ]  # Normalized RGB values representing colors for walls, sources, mediums and various displacements (positive, negative, neutral)
         # This color scheme is decoded by the main display shader to visualize wave interactions
 
-    def on_init(self):
+    def on_init(self, headless=False):
         """
         Initializes the simulation environment, setting up the necessary pygame window, shaders,
         buffers, and textures for the simulation.
 
+        Arguments Used:
+            headless (bool): If True, only a hidden window is created to hold the OpenGL context,
+                             and the display surfaces and fonts are skipped. Defaults to False.
+
         Attributes used:
              - masterSurface: The surface representing the entire window.
              - simDisplaySurface: The surface representing the simulation display section of the window.
              - inputsSurface: The surface for the input section of the window.
-             - displayShader, mainShaderAbs, mainShaderRef, drawShader: Various shaders used in rendering and simulation.
-             - vertexPositionBuffer, texCoordVBO, sourceVBO, simPosVBO, simTexCoordVBO, simDampingVBO: Buffers for storing vertex positions, texture coordinates, and simulation data.
+             - shaders: The registry building the shaders used in rendering and simulation.
+             - vertexPositionBuffer, texCoordVBO, simPosVBO, simTexCoordVBO: Buffers for storing vertex positions, texture coordinates, and simulation data.
              - renderTexture1, renderTexture2: Textures used for rendering the simulation frame by frame.
         """
         # Initialize the Pygame library
         pygame.init()
 
-        # Set up the main window with OpenGL, dividing the window into two sections:
-        # The main simulation display and a section for inputs
-        self.masterSurface = pygame.display.set_mode(
-            (self.width + 300, self.height + 200), pygame.OPENGL
-        )
-        pygame.display.set_caption(TITLE)  # Set the window title
-        self.simDisplaySurface = pygame.Surface(
-            self.size
-        )  # Surface for simulation display
-        self.inputsSurface = pygame.Surface(
-            (300, self.height)
-        )  # Surface for input controls
-
-        # Blit (copy) the simulation display and input controls onto the master surface
-        self.masterSurface.blits(
-            [
-                (self.simDisplaySurface, (0, 0)),  # Position simulation on the left
-                (self.inputsSurface, (self.width, 0)),  # Position inputs on the right
-            ]
-        )
-
-        # Set up text rendering using Pygame fonts (used for displaying slider values and other text)
-        pygame.font.init()
-        self.text = pygame.font.SysFont(
-            "calibri", 15
-        )  # Font for drawing text on the screen
-
-        # Initialize shaders used in the simulation process
-
-        # Shader used for displaying the simulation (display the final result)
-        self.displayShader = self.create_shader(
-            "shaders/display-fs.glsl", "shaders/vs.glsl"
-        )
-        # Get the uniform location for controlling brightness in the display shader
-        self.displayShader.brightnessUniform = glGetUniformLocation(
-            self.displayShader.get_pid(), "brightness"
-        )
-        # Get the uniform location for setting colors in the display shader
-        self.displayShader.coloursUniform = glGetUniformLocation(
-            self.displayShader.get_pid(), "colours"
-        )
-
-        # Shader for rendering simulation with absorption (walls absorb waves)
-        self.mainShaderAbs = self.create_shader(
-            "shaders/simulate-absorb-fs.glsl", "shaders/vs.glsl"
-        )
-        # Get uniform locations for the step size in both x and y directions for the absorption shader
-        self.mainShaderAbs.stepSizeXUniform = glGetUniformLocation(
-            self.mainShaderAbs.get_pid(), "stepSizeX"
-        )
-        self.mainShaderAbs.stepSizeYUniform = glGetUniformLocation(
-            self.mainShaderAbs.get_pid(), "stepSizeY"
-        )
-
-        # Shader for rendering simulation with reflection (walls reflect waves)
-        self.mainShaderRef = self.create_shader(
-            "shaders/simulate-reflect-fs.glsl", "shaders/vs.glsl"
+        # Batch runs only need an OpenGL context, so use a hidden window the size of the simulation
+        if headless:
+            self.masterSurface = pygame.display.set_mode(
+                self.size, pygame.OPENGL | pygame.HIDDEN
+            )
+        else:
+            self.init_display()
+
+        # Register the shaders used in the simulation process: the display shader (display the
+        # final result), the simulation shaders with absorption and reflection by walls, and the
+        # shader used for drawing lines to the screen. Only the programs this session needs now are
+        # built, all at once; the other simulation shader is built if the wall mode is switched.
+        self.shaders = ShaderRegistry(
+            ProgramCache() if self.useShaderCache else None, {"Sources": 0}
         )
-        # Get uniform locations for the step size in both x and y directions for the reflection shader
-        self.mainShaderRef.stepSizeXUniform = glGetUniformLocation(
-            self.mainShaderRef.get_pid(), "stepSizeX"
+        self.shaders.register("display", "shaders/display-fs.glsl", "shaders/vs.glsl")
+        self.shaders.register(
+            "absorb", "shaders/simulate-absorb-fs.glsl", "shaders/vs.glsl"
         )
-        self.mainShaderRef.stepSizeYUniform = glGetUniformLocation(
-            self.mainShaderRef.get_pid(), "stepSizeY"
+        self.shaders.register(
+            "reflect", "shaders/simulate-reflect-fs.glsl", "shaders/vs.glsl"
         )
+        self.shaders.register("draw", "shaders/draw-fs.glsl", "shaders/draw-vs.glsl")
+        self.shaders.register("panel", "shaders/panel-fs.glsl", "shaders/vs.glsl")
+        mode = "reflect" if self.reflective else "absorb"
+        self.shaders.build([mode] if headless else ["display", "draw", "panel", mode])
+
+        # Time every phase of each frame, counting the OpenGL calls made by every module
+        if (self.profiling or self.profileLog) and not headless:
+            self.glCalls = GLCallCounter()
+            self.glCalls.install(
+                [sys.modules[__name__]]
+                + [sys.modules[name] for name in GL_CALL_MODULES]
+            )
+            self.profiler = FrameProfiler(path=self.profileLog, calls=self.glCalls)
 
-        # Shader used for drawing lines (used to render lines to the screen)
-        self.drawShader = self.create_shader(
-            "shaders/draw-fs.glsl", "shaders/draw-vs.glsl"
+        # Pace the main loop, running at least stepsPerFrame simulation steps every frame
+        self.pacer = FramePacer(
+            self.pacingMode, self.targetFPS, minSteps=self.stepsPerFrame
         )
 
         # Set up vertex buffer objects (VBOs) for exchanging data between shaders
@@ -279,82 +403,252 @@ class App:
         # Four corners of the texture (top-left, top-right, bottom-left, bottom-right)
         self.texCoordVBO.numItems = 4
 
-        # Set up source VBO (used to represent sources in the simulation)
-        self.sourceVBO = Buffer(glGenBuffers(1))
-        glBindBuffer(GL_ARRAY_BUFFER, self.sourceVBO.id)
-        self.sourceVBO.itemSize = 2  # Two values for the source's position
-        self.sourceVBO.numItems = 2  # Only two items (one source)
-
-        # Set the visible area of the simulation based on window offset
-        self.set_area(
-            self.windowOffset,
-            self.windowOffset,
-            1 - self.windowOffset,
-            1 - self.windowOffset,
+        # Persistent VBO holding the outline of every wall, with the colour of each vertex
+        self.wallVBO = Buffer(glGenBuffers(1))
+        self.wallVBO.itemSize = 6  # x, y and an RGBA colour per vertex
+        self.wallVBO.numItems = 0
+        self.wallsDirty = True
+
+        # Record the interleaved layout of wallVBO once
+        self.wallVAO = glGenVertexArrays(1)
+        glBindVertexArray(self.wallVAO)
+        glBindBuffer(GL_ARRAY_BUFFER, self.wallVBO.get_id())
+        stride = self.wallVBO.itemSize * 4
+        glVertexAttribPointer(
+            ATTRIBUTE_LOCATIONS["aPos"], 2, GL_FLOAT, False, stride, None
         )
-
-        # Define areas representing the sides of the simulation window
-        self.set_area(1, self.windowOffset, self.windowOffset, 1 - self.windowOffset)
-        self.set_area(
-            1 - self.windowOffset,
-            self.windowOffset,
-            -1,
-            1 - self.windowOffset,
+        glEnableVertexAttribArray(ATTRIBUTE_LOCATIONS["aPos"])
+        glVertexAttribPointer(
+            ATTRIBUTE_LOCATIONS["aCol"],
+            4,
+            GL_FLOAT,
+            False,
+            stride,
+            ctypes.c_void_p(8),
         )
-        self.set_area(self.windowOffset, 1, 1 - self.windowOffset, self.windowOffset)
-        self.set_area(
-            self.windowOffset,
-            1 - self.windowOffset,
-            1 - self.windowOffset,
-            -1,
+        glEnableVertexAttribArray(ATTRIBUTE_LOCATIONS["aCol"])
+        glBindVertexArray(0)
+
+        # Uniform buffer for the parameters of every source, read by the simulation shaders
+        self.sourceUBO = Buffer(glGenBuffers(1))
+        glBindBuffer(GL_UNIFORM_BUFFER, self.sourceUBO.get_id())
+        glBufferData(GL_UNIFORM_BUFFER, MAX_SOURCES * 16, None, GL_DYNAMIC_DRAW)
+        glBindBuffer(GL_UNIFORM_BUFFER, 0)
+        self.sourceUBO.itemSize = 4  # One vec4 per source
+        self.sourceUBO.numItems = 0
+
+        # Integer texture marking which source, if any, drives each texel
+        sourceMap = np.empty(1, dtype=np.uint32)
+        glCreateTextures(GL_TEXTURE_2D, 1, sourceMap)
+        self.sourceMap = Texture(int(sourceMap[0]))
+        self.sourceMap.set_width(self.width)
+        self.sourceMap.set_height(self.height)
+        glTextureParameteri(self.sourceMap.get_id(), GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+        glTextureParameteri(self.sourceMap.get_id(), GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+        glTextureStorage2D(
+            self.sourceMap.get_id(), 1, GL_R16UI, self.width, self.height
         )
-
-        # Define areas representing the four corners of the simulation window
-        self.set_area(1, 1, self.windowOffset, self.windowOffset)
-        self.set_area(1 - self.windowOffset, 1, 1 - 2, self.windowOffset)
-        self.set_area(1, 1 - self.windowOffset, self.windowOffset, -1)
-        self.set_area(
-            1 - self.windowOffset,
-            1 - self.windowOffset,
-            -1,
-            -1,
+        self.sourceMapData = np.zeros((self.height, self.width), dtype=np.uint16)
+        self.sourceTexels = (np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp))
+        self.upload_source_map((0, 0, self.width, self.height))
+        self.sourcesDirty = True
+
+        # Single channel float texture holding the wave-speed coefficient of every texel,
+        # rasterised on the CPU and only re-uploaded where the scene changes
+        self.material = MaterialGrid(self.size)
+        materialTexture = np.empty(1, dtype=np.uint32)
+        glCreateTextures(GL_TEXTURE_2D, 1, materialTexture)
+        self.materialTexture = Texture(int(materialTexture[0]))
+        self.materialTexture.set_width(self.width)
+        self.materialTexture.set_height(self.height)
+        for param, value in (
+            (GL_TEXTURE_MAG_FILTER, GL_NEAREST),
+            (GL_TEXTURE_MIN_FILTER, GL_NEAREST),
+            (
+                GL_TEXTURE_WRAP_S,
+                GL_CLAMP_TO_BORDER,
+            ),  # Texels outside the grid read as walls
+            (GL_TEXTURE_WRAP_T, GL_CLAMP_TO_BORDER),
+        ):
+            glTextureParameteri(self.materialTexture.get_id(), param, value)
+        glTextureStorage2D(
+            self.materialTexture.get_id(), 1, GL_R32F, self.width, self.height
+        )
+        self.update_material((0, 0, self.width, self.height))
+
+        # Single channel float texture holding the graded absorbing layer at the edge of the grid,
+        # which the shaders scale by the global damping uniform
+        spongeTexture = np.empty(1, dtype=np.uint32)
+        glCreateTextures(GL_TEXTURE_2D, 1, spongeTexture)
+        self.spongeTexture = Texture(int(spongeTexture[0]))
+        self.spongeTexture.set_width(self.width)
+        self.spongeTexture.set_height(self.height)
+        glTextureParameteri(
+            self.spongeTexture.get_id(), GL_TEXTURE_MAG_FILTER, GL_NEAREST
+        )
+        glTextureParameteri(
+            self.spongeTexture.get_id(), GL_TEXTURE_MIN_FILTER, GL_NEAREST
+        )
+        glTextureStorage2D(
+            self.spongeTexture.get_id(), 1, GL_R32F, self.width, self.height
+        )
+        glTextureSubImage2D(
+            self.spongeTexture.get_id(),
+            0,
+            0,
+            0,
+            self.width,
+            self.height,
+            GL_RED,
+            GL_FLOAT,
+            sponge_profile(self.size, self.spongeWidth, self.spongeStrength),
         )
 
+        # Cover the grid inside its outer ring
+        simPos, simTexCoord = sim_geometry(self.size)
+
         # Set up buffers for exchanging simulation data between shaders
         self.simPosVBO = Buffer(glGenBuffers(1))
         glBindBuffer(GL_ARRAY_BUFFER, self.simPosVBO.id)
-        glBufferData(
-            GL_ARRAY_BUFFER,
-            np.array(self.simPos, dtype=np.float32),
-            GL_STATIC_DRAW,
-        )
+        glBufferData(GL_ARRAY_BUFFER, simPos, GL_STATIC_DRAW)
         self.simPosVBO.itemSize = 2  # Two values per position (x, y)
-        self.simPosVBO.numItems = len(self.simPos) / 2  # Number of positions (vertices)
+        self.simPosVBO.numItems = len(simPos)  # Number of positions (vertices)
 
         self.simTexCoordVBO = Buffer(glGenBuffers(1))
         glBindBuffer(GL_ARRAY_BUFFER, self.simTexCoordVBO.id)
-        glBufferData(
-            GL_ARRAY_BUFFER,
-            np.array(self.simTexCoord, dtype=np.float32),
-            GL_STATIC_DRAW,
-        )
+        glBufferData(GL_ARRAY_BUFFER, simTexCoord, GL_STATIC_DRAW)
         self.simTexCoordVBO.itemSize = 2  # Two values per texture coordinate (u, v)
-        self.simTexCoordVBO.numItems = (
-            len(self.simPos) / 2
-        )  # Number of texture coordinates
+        self.simTexCoordVBO.numItems = len(simTexCoord)  # Number of texture coordinates
+
+        # Record the stencil pass attributes in a vertex array object, so every substep only needs
+        # to bind it (the layout is shared by both simulation shaders through vs.glsl)
+        self.simVAO = glGenVertexArrays(1)
+        glBindVertexArray(self.simVAO)
+        for vbo, attribute in (
+            (self.simPosVBO, ATTRIBUTE_LOCATIONS["aPos"]),
+            (self.simTexCoordVBO, ATTRIBUTE_LOCATIONS["aTexCoord"]),
+        ):
+            glBindBuffer(GL_ARRAY_BUFFER, vbo.get_id())
+            glVertexAttribPointer(attribute, vbo.itemSize, GL_FLOAT, False, 0, None)
+            glEnableVertexAttribArray(attribute)
+        glBindVertexArray(0)
+
+        if not headless:
+            self.init_panel()
+            if self.recordPath:
+                self.init_recorder()
 
-        # Set up the damping VBO to control wave damping at each vertex
-        self.simDampingVBO = Buffer(glGenBuffers(1))
-        glBindBuffer(GL_ARRAY_BUFFER, self.simDampingVBO.id)
-        glBufferData(
-            GL_ARRAY_BUFFER, np.array(self.simDamping, dtype=np.float32), GL_STATIC_DRAW
+        # Set up textures for use in the simulation process (render-to-texture)
+        internalFormat = STATE_FORMATS[self.stateFormat][0]
+        self.renderTexture1 = self.create_texture(internalFormat)
+        self.renderTexture2 = self.create_texture(internalFormat)
+
+    def init_display(self):
+        """
+        Sets up the visible pygame window, the surfaces for the simulation display and inputs,
+        and the font used to draw slider labels.
+        """
+        # Set up the main window with OpenGL, dividing the window into two sections:
+        # The main simulation display and a section for inputs
+        try:
+            self.masterSurface = pygame.display.set_mode(
+                (self.width + 300, self.height + 200),
+                pygame.OPENGL,
+                vsync=int(self.pacingMode == "vsync"),
+            )
+        except pygame.error:
+            print(
+                "Error: vsync is not available, pacing to the target frame rate instead"
+            )
+            self.pacingMode = "fps"
+            self.masterSurface = pygame.display.set_mode(
+                (self.width + 300, self.height + 200), pygame.OPENGL
+            )
+        pygame.display.set_caption(TITLE)  # Set the window title
+        self.simDisplaySurface = pygame.Surface(
+            self.size
+        )  # Surface for simulation display
+        self.inputsSurface = pygame.Surface(
+            (300, self.height)
+        )  # Surface for input controls
+
+        # Blit (copy) the simulation display and input controls onto the master surface
+        self.masterSurface.blits(
+            [
+                (self.simDisplaySurface, (0, 0)),  # Position simulation on the left
+                (self.inputsSurface, (self.width, 0)),  # Position inputs on the right
+            ]
         )
-        self.simDampingVBO.itemSize = 1  # One damping value per vertex
-        self.simDampingVBO.numItems = len(self.simDamping)  # Number of damping values
 
-        # Set up textures for use in the simulation process (render-to-texture)
-        self.renderTexture1 = self.create_texture()
-        self.renderTexture2 = self.create_texture()
+        # Set up text rendering using Pygame fonts (used for displaying slider values and other text)
+        pygame.font.init()
+        self.text = pygame.font.SysFont(
+            "calibri", 15
+        )  # Font for drawing text on the screen
+        self.textCache = TextCache(self.text)
+
+    def init_recorder(self):
+        """
+        Starts recording the output of the display shader. Each recorded frame is drawn into its own
+        texture, read back asynchronously and written to disk by the recorder's worker threads, so
+        recording never waits on the GPU or on encoding.
+        """
+        self.recorder = FrameRecorder(
+            self.recordPath,
+            self.size,
+            self.recordFormat,
+            self.recordEvery,
+            fps=self.targetFPS,
+        )
+        self.recordTexture = self.create_texture(GL_RGBA8)
+        self.frameReadback = AsyncReadback(self.width, self.height, 4, np.uint8)
+
+    def init_panel(self):
+        """
+        Creates the texture the input panel is presented through, and the quad it is drawn on.
+        The pygame surfaces are not composited onto an OpenGL window, so the panel is drawn into
+        inputsSurface and uploaded to this texture only when its contents change.
+        """
+        panelTexture = np.empty(1, dtype=np.uint32)
+        glCreateTextures(GL_TEXTURE_2D, 1, panelTexture)
+        self.panelTexture = Texture(int(panelTexture[0]))
+        self.panelTexture.set_width(self.inputsSurface.get_width())
+        self.panelTexture.set_height(self.inputsSurface.get_height())
+        glTextureParameteri(
+            self.panelTexture.get_id(), GL_TEXTURE_MAG_FILTER, GL_NEAREST
+        )
+        glTextureParameteri(
+            self.panelTexture.get_id(), GL_TEXTURE_MIN_FILTER, GL_NEAREST
+        )
+        glTextureStorage2D(
+            self.panelTexture.get_id(),
+            1,
+            GL_RGBA8,
+            self.panelTexture.get_width(),
+            self.panelTexture.get_height(),
+        )
+        self.panelState = None  # Nothing has been uploaded yet
+
+        # The corners of the viewport, with texture coordinates covering the whole panel
+        self.panelTexCoordVBO = Buffer(glGenBuffers(1))
+        glBindBuffer(GL_ARRAY_BUFFER, self.panelTexCoordVBO.get_id())
+        glBufferData(
+            GL_ARRAY_BUFFER,
+            np.array([0, 1, 1, 1, 0, 0, 1, 0], dtype=np.float32),
+            GL_STATIC_DRAW,
+        )
+        self.panelTexCoordVBO.itemSize = 2
+        self.panelTexCoordVBO.numItems = 4
+        self.panelVAO = glGenVertexArrays(1)
+        glBindVertexArray(self.panelVAO)
+        for vbo, attribute in (
+            (self.vertexPositionBuffer, ATTRIBUTE_LOCATIONS["aPos"]),
+            (self.panelTexCoordVBO, ATTRIBUTE_LOCATIONS["aTexCoord"]),
+        ):
+            glBindBuffer(GL_ARRAY_BUFFER, vbo.get_id())
+            glVertexAttribPointer(attribute, vbo.itemSize, GL_FLOAT, False, 0, None)
+            glEnableVertexAttribArray(attribute)
+        glBindVertexArray(0)
 
     def on_event(self, event):
 
@@ -363,43 +657,35 @@ class App:
             self.running = False
             # exit the program
 
-        # on click, use collision detection to determine which, if any, object from dragItems is selected
+        # on click, use the spatial index to determine which, if any, object from dragItems is selected
         elif event.type == pygame.MOUSEBUTTONDOWN:
-            for index, item in enumerate(self.dragItems):
-                try:
-                    if item.collidepoint(event.pos):
-                        for source in self.sources:
-                            if source.hitbox.get_id() == index:
-                                self.sliders = self.get_sliders(source)
-                        for wall in self.walls:
-                            if wall.hitbox.get_id() == index:
-                                self.sliders = self.get_sliders(wall)
-
-                        if event.button == 1:
-                            # if left clicked, select item and get its initial coordinates
-                            self.selected = index
-                            self.active = index
-                            self.add_action(
-                                ["m", (item.x, item.y), (0, 0), self.selected]
-                            )
-
-                            mouse_x, mouse_y = event.pos
-                            self.offset[0] = item.x - mouse_x
-                            self.offset[1] = item.y - mouse_y
-                except:
-                    pass
+            index = self.spatial.pick(event.pos)
+            if index is not None:
+                item = self.dragItems[index]
+                self.sliders = self.get_sliders(self.registry.get(index))
+
+                if event.button == 1:
+                    # if left clicked, select item and get its initial coordinates
+                    self.selected = index
+                    self.active = index
+                    self.add_action(["m", (item.x, item.y), (0, 0), self.selected])
+
+                    mouse_x, mouse_y = event.pos
+                    self.offset[0] = item.x - mouse_x
+                    self.offset[1] = item.y - mouse_y
 
         # on click stop, deselect item
         elif event.type == pygame.MOUSEBUTTONUP:
             # deselects item
             if event.button == 1:
                 self.selected = None
-                try:
-                    self.actionstack[self.actionstackpointer - 1][2] = tuple(
-                        [x + y for x, y in zip(event.pos, self.offset)]
-                    )
-                except:
-                    pass
+                # record where the item was dropped in its move action
+                if self.actionstackpointer > 0:
+                    action = self.actionstack[self.actionstackpointer - 1]
+                    if action[0] == "m":
+                        action[2] = tuple(
+                            [x + y for x, y in zip(event.pos, self.offset)]
+                        )
 
         # while mouse moving, if an item from dragItems is selected, move it along with the mouse
         elif event.type == pygame.MOUSEMOTION:
@@ -420,140 +706,201 @@ class App:
 
         elif event.type == pygame.KEYDOWN:
             if event.key == KEYBINDS["addSource"]:
-                self.add_source(self.offset, len(self.dragItems), 10, 1)
-                self.add_action(
-                    ["c", [self.offset], "s", self.sources[-1:][0].hitbox.get_id()]
-                )
+                self.add_source(self.offset, self.registry.new_id(), 10, 1)
+                self.add_action(["c", self.sources[-1]])
             elif event.key == KEYBINDS["undo"]:
                 self.undo()
             elif event.key == KEYBINDS["redo"]:
                 self.redo()
             elif event.key == KEYBINDS["addWall"]:
-                self.add_wall(self.offset, (100, 50), 0, len(self.dragItems))
-                self.add_action(
-                    ["c", [self.offset], "w", self.mediums[-1:][0].hitbox.get_id()]
-                )
+                self.add_wall(self.offset, (100, 50), 0, self.registry.new_id())
+                self.add_action(["c", self.mediums[-1]])
             elif event.key == KEYBINDS["delete"]:
-                self.dragItems[self.active] = None
-                typing = ""
-                pos = [0, 0]
-                for id, source in enumerate(self.sources):
-                    if source.hitbox.get_id() == self.active:
-                        pos = source.hitbox.get_pos()
-                        self.sources.pop(id)
-                        typing = "s"
-
-                for id, med in enumerate(self.mediums):
-                    if med.hitbox.get_id() == self.active:
-                        pos = med.hitbox.get_pos()
-                        self.mediums.pop(id)
-                        typing = "w"
-                self.add_action(["d", typing, pos])
+                if self.active in self.registry:
+                    # keep the removed item in the action so it can be restored as it was
+                    self.add_action(["d", self.remove_item(self.active)])
+            elif event.key == KEYBINDS["checkpoint"]:
+                self.save_state(
+                    self.checkpointPath,
+                    GPUSolver(self).get_field(),
+                    self.checkpointBase,
+                )
+                print(f"Saved checkpoint to {self.checkpointPath}")
 
             else:
                 pass
 
     def on_loop(self):
         """
-        Executes the main simulation loop. Updates the simulation at an uncapped framerate, processes wave behavior,
-        swaps textures for display, and renders sources and walls to the screen.
+        Executes the main simulation loop. Waits until the next frame is due, then runs the
+        simulation steps back-to-back before the frame is presented. When the loop is paced, as many
+        steps as the measured cost of a step allows are fitted into each frame, so wave propagation
+        scales with GPU throughput rather than with the display overhead of on_render.
+
+        Attributes used:
+            pacer: The pacer deciding when each frame starts and how many steps it runs.
+            simClock: The simulation clock, used to calculate wave displacement.
+            stepsPerFrame: The fewest simulation steps run for every displayed frame.
+        """
+        # Sleep until the frame is due (or not at all when uncapped or waiting on vsync)
+        with self.profile("tick"):
+            self.pacer.tick()
+
+        # Upload any edited sources before the stencil passes, so they are timed on their own
+        with self.profile("sources"):
+            self.update_sources()
+
+        # Each step advances the simulation clock by its fixed dt, however long the frame took
+        steps = self.pacer.get_steps()
+        with self.profile("simulate"):
+            self.pacer.begin_steps()
+            self.simulate(steps)
+            self.pacer.end_steps(steps)
+
+        # Start reading the field back for any listener that is due, and pass on finished readbacks
+        with self.profile("readback"):
+            self.read_field()
+
+    def add_field_listener(self, callback, every=1):
+        """
+        Registers a consumer of the simulated field, such as a recorder or a probe. The field is read
+        back asynchronously, so the callback is called a frame or two after the step it shows.
+
+        Arguments Used:
+            callback (callable): Called as callback(step, field), where field is a read-only
+                                 (height, width, 2) float32 view of the displacement and velocity
+                                 that is only valid until the callback returns.
+            every (int): The number of steps between readbacks. Since a frame runs several steps,
+                         the field is read at the end of the first frame at or after each one.
+        """
+        self.fieldListeners.append([callback, every, self.simClock.step + every])
+
+    def read_field(self):
+        """
+        Requests a readback of the most recent state if any field listener is due, then passes each
+        readback the GPU has finished to the listeners it was requested for.
+        """
+        if not self.fieldListeners:
+            return
+        if self.fieldReadback is None:
+            self.fieldReadback = AsyncReadback(self.width, self.height)
+        step = self.simClock.step
+        due = [listener for listener in self.fieldListeners if step >= listener[2]]
+        # A dropped request is tried again next frame, since the listeners are still due
+        if due and self.fieldReadback.request(
+            self.renderTexture1.get_id(), (step, due)
+        ):
+            for listener in due:
+                listener[2] = step + listener[1]
+        self.fieldReadback.collect(self.send_field)
+
+    def send_field(self, tag, field):
+        # Passes a finished readback to the listeners it was requested for
+        step, listeners = tag
+        for callback, _, _ in listeners:
+            callback(step, field)
+
+    def profile(self, name):
+        """
+        Times a phase of the current frame when profiling is on.
+
+        Arguments Used:
+            name (str): The name of the phase.
+
+        Returns:
+            A context manager timing the with block, which does nothing when profiling is off.
+        """
+        if self.profiler is None:
+            return contextlib.nullcontext()
+        return self.profiler.phase(name)
+
+    def simulate(self, steps=1, times=None):
+        """
+        Advances the wave field on the GPU by running the stencil pass of the selected simulation shader
+        into the ping-pong textures `steps` times. Walls and mediums are read from the material texture
+        and sources are injected by the shader, so nothing else is drawn between passes. The stencil
+        state (program, vertex arrays, uniforms, viewport) is set up once and reused by every pass.
+
+        This is the GPU half of the common stepping interface used by solvers.GPUSolver.
+
+        Arguments Used:
+            steps (int): The number of simulation steps to run. Defaults to 1.
+            times (np.ndarray, optional): The simulation time of each step. Defaults to None, which
+                                          takes the next `steps` steps of simClock.
 
         Attributes used:
-            clock: The clock used to control the frame rate of the simulation.
-            time: The current time in the simulation, used to calculate wave displacement.
             renderTexture1, renderTexture2: The textures used for rendering the simulation.
             sources: A list of wave sources that emit waves in the simulation.
             mediums: A list of walls or objects that interact with waves.
             reflective: A boolean flag indicating whether the simulation should reflect waves off walls.
         """
-        # Update the simulation at an uncapped framerate
-        self.clock.tick_busy_loop()  # Ensure the loop runs at the maximum speed possible
-        self.time += self.clock.get_time()  # Update the time elapsed in the simulation
-
-        # Swap textures to display the current frame while overwriting the previous frame for the next step
-        rt = self.renderTexture1  # Temporary swap variable
-        self.renderTexture1 = self.renderTexture2  # Swap texture1 with texture2
-        self.renderTexture2 = rt  # Swap texture2 with texture1
+        # Determine the shader to use based on the reflection setting (reflective or absorbent walls)
+        prog = self.get_sim_shader()
+
+        # Upload any edited sources, then set up the stencil pass once for all of the substeps
+        self.update_sources()
+        self.use_stencil(prog)
+
+        if times is None:
+            times = self.simClock.advance(steps)
+
+        for stepTime in times:
+            self.time = float(
+                stepTime
+            )  # The time the sources are injected at in this step
+            # Epochs fall on multiples of SOURCE_EPOCH_SPAN, so the phases of a step do not depend
+            # on where the run started
+            epoch = self.time - self.time % SOURCE_EPOCH_SPAN
+            if epoch != self.sourceEpoch:
+                self.set_source_epoch(epoch)
+
+            # Swap textures to display the current frame while overwriting the previous frame for the next step
+            rt = self.renderTexture1  # Temporary swap variable
+            self.renderTexture1 = self.renderTexture2  # Swap texture1 with texture2
+            self.renderTexture2 = rt  # Swap texture2 with texture1
+
+            # Set the render-to-texture target to texture1 and its framebuffer
+            self.rtt = self.renderTexture1  # Set the render target to texture1
+            glBindFramebuffer(
+                GL_FRAMEBUFFER, self.renderTexture1.framebuffer.get_id()
+            )  # Bind the framebuffer for rendering
+            # No clear is needed: every simulated texel is overwritten, and the outer ring is never
+            # drawn so it keeps its zero displacement
+
+            # Sample pixels from the previous frame to use as input for rendering the new frame
+            glBindTexture(
+                GL_TEXTURE_2D, self.renderTexture2.get_id()
+            )  # Bind texture2 as the sampler input
+
+            # Draw the simulation with the provided shader program, injecting the sources at this time
+            glUniform1f(prog.timeUniform, self.time - self.sourceEpoch)
+            glDrawArrays(
+                GL_TRIANGLES, 0, int(self.simPosVBO.numItems)
+            )  # Draw the simulation as triangles
 
-        # Set the render-to-texture target to texture1 and its framebuffer
-        rttFramebuffer = (
-            self.renderTexture1.framebuffer
-        )  # Get the framebuffer of texture1
-        self.rtt = self.renderTexture1  # Set the render target to texture1
-        glBindFramebuffer(
-            GL_FRAMEBUFFER, rttFramebuffer.get_id()
-        )  # Bind the framebuffer for rendering
+        # Unbind the stencil state and the framebuffer (render to screen instead)
+        glBindVertexArray(0)
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
 
-        # Determine the shader to use based on the reflection setting (reflective or absorbent walls)
-        if self.reflective:
-            prog = self.mainShaderRef  # Use reflective shader if the wall is reflective
-        else:
-            prog = (
-                self.mainShaderAbs
-            )  # Use absorbing shader if the wall absorbs the waves
+    def use_stencil(self, prog):
+        """
+        Binds the program, vertex arrays, uniforms and viewport shared by every stencil pass.
 
-        # Use the appropriate shader and clear the display to prepare for the next frame
+        Arguments Used:
+            prog (ShaderSimulate): The simulation shader to run.
+        """
+        # Use the appropriate shader and set the viewport to the size of the state textures
         glUseProgram(prog.get_pid())  # Activate the shader program
         glViewport(
-            0, 0, rttFramebuffer.get_width(), rttFramebuffer.get_height()
+            0, 0, self.renderTexture1.get_width(), self.renderTexture1.get_height()
         )  # Set the viewport
         glClearColor(0.0, 0.0, 0.0, 1.0)  # Set the clear color (black)
-        glClear(
-            GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT
-        )  # Clear the color and depth buffers
-
-        # Send data to the shaders using the vertex buffer objects (VBOs)
-        glBindBuffer(
-            GL_ARRAY_BUFFER, self.simPosVBO.get_id()
-        )  # Bind the simulation positions VBO
-        glVertexAttribPointer(
-            prog.vertexPositionAttribute,  # Vertex position attribute in the shader
-            self.simPosVBO.itemSize,  # Number of items (coordinates per vertex)
-            GL_FLOAT,  # Data type
-            True,  # Normalize the data
-            0,  # Stride (0 means tightly packed)
-            0,  # Offset (start at the beginning of the buffer)
-        )
 
-        glBindBuffer(
-            GL_ARRAY_BUFFER, self.simTexCoordVBO.get_id()
-        )  # Bind the texture coordinates VBO
-        glVertexAttribPointer(
-            prog.textureCoordAttribute,  # Texture coordinate attribute in the shader
-            self.simTexCoordVBO.itemSize,  # Number of items (coordinates per vertex)
-            GL_FLOAT,  # Data type
-            True,  # Normalize the data
-            0,  # Stride
-            0,  # Offset
-        )
-
-        # Enable attributes for damping, position, and texture coordinates
-        glEnableVertexAttribArray(
-            prog.dampingAttribute
-        )  # Enable damping attribute in the shader
-        glEnableVertexAttribArray(
-            prog.vertexPositionAttribute
-        )  # Enable position attribute
-        glEnableVertexAttribArray(
-            prog.textureCoordAttribute
-        )  # Enable texture coordinates attribute
-
-        # Bind the damping VBO and send damping data to the shader
-        glBindBuffer(GL_ARRAY_BUFFER, self.simDampingVBO.get_id())
-        glVertexAttribPointer(
-            prog.dampingAttribute,  # Damping attribute in the shader
-            self.simDampingVBO.itemSize,  # Number of items (damping values per vertex)
-            GL_FLOAT,  # Data type
-            True,  # Normalize
-            0,  # Stride
-            0,  # Offset
-        )
+        # Bind the position and texture coordinate attributes recorded in simVAO
+        glBindVertexArray(self.simVAO)
 
-        # Sample pixels from the previous frame to use as input for rendering the new frame
+        # Sample the previous state from texture unit 0
         glActiveTexture(GL_TEXTURE0)  # Activate texture unit 0
-        glBindTexture(
-            GL_TEXTURE_2D, self.renderTexture2.get_id()
-        )  # Bind texture2 as the sampler input
         glUniform1i(
             prog.samplerUniform, 0
         )  # Set the texture unit for the sampler in the shader
@@ -564,130 +911,336 @@ class App:
             prog.stepSizeYUniform, 1 / self.height
         )  # Pass the step size in the Y direction
 
+        # Read the sources from the source map on texture unit 1 and the Sources uniform block
+        glActiveTexture(GL_TEXTURE1)
+        glBindTexture(GL_TEXTURE_2D, self.sourceMap.get_id())
+        glActiveTexture(GL_TEXTURE0)
+        glUniform1i(prog.sourceMapUniform, 1)
+        glBindBufferBase(GL_UNIFORM_BUFFER, 0, self.sourceUBO.get_id())
+
+        # Read the walls and mediums from the material texture on texture unit 2
+        glActiveTexture(GL_TEXTURE2)
+        glBindTexture(GL_TEXTURE_2D, self.materialTexture.get_id())
+        glActiveTexture(GL_TEXTURE0)
+        glUniform1i(prog.materialUniform, 2)
+
+        # Read the absorbing layer from texture unit 3, scaled by the current global damping
+        glActiveTexture(GL_TEXTURE3)
+        glBindTexture(GL_TEXTURE_2D, self.spongeTexture.get_id())
+        glActiveTexture(GL_TEXTURE0)
+        glUniform1i(prog.spongeUniform, 3)
+        glUniform1f(prog.dampingUniform, self.damping)
+
         # Set up the uniform matrices for the shader
         self.set_u_matrices(prog)
 
-        # Draw the simulation with the provided shader program
-        glDrawArrays(
-            GL_TRIANGLES, 0, int(self.simPosVBO.numItems)
-        )  # Draw the simulation as triangles
-
-        # Disable vertex attribute arrays once done
-        glDisableVertexAttribArray(prog.dampingAttribute)
-        glDisableVertexAttribArray(prog.vertexPositionAttribute)
-        glDisableVertexAttribArray(prog.textureCoordAttribute)
-
-        # Now draw the sources (points emitting waves)
-        for source in self.sources:
-            source.set_zerot(self.startTime)  # Reset the time for the source
-            srcCoords = []  # List to store source coordinates
-            self.prep_draw(False)  # Prepare the screen for drawing
-
-            # Calculate the displacement (d) of the wave from the source
-            d = source.get_disp(self.time)  # Get the displacement at the current time
-
-            # Use the drawing shader to draw the source
-            glUseProgram(self.drawShader.get_pid())
-            glVertexAttrib4f(
-                self.drawShader.colourAttribute, d, 0.0, 1.0, 1.0
-            )  # Set color based on displacement
-            glBindBuffer(
-                GL_ARRAY_BUFFER, self.sourceVBO.get_id()
-            )  # Bind the source VBO
-
-            # Determine the position of the source and adjust for the screen resolution
-            srcCoords = derectify(source.hitbox.get_centre(), self.size)
-            srcCoords.append(
-                srcCoords[0]
-            )  # Close the loop for the line (first and last point same)
-            srcCoords.append(
-                (srcCoords[1]) + 1 / self.height
-            )  # Adjust for vertical positioning
-            srcCoords = np.array(
-                srcCoords, dtype=np.float32
-            )  # Convert to numpy array for VBO
-
-            # Update the VBO with the new source coordinates
-            glBufferData(GL_ARRAY_BUFFER, srcCoords, GL_STATIC_DRAW)
-            glVertexAttribPointer(
-                self.drawShader.vertexPositionAttribute,  # Position attribute in the drawing shader
-                self.sourceVBO.itemSize,  # Number of items per vertex (2 for x, y)
-                GL_FLOAT,  # Data type
-                True,  # Normalize
-                0,  # Stride
-                0,  # Offset
-            )
-            glEnableVertexAttribArray(
-                self.drawShader.vertexPositionAttribute
-            )  # Enable vertex position attribute
-
-            # Set the uniform matrices for the drawing shader
-            self.set_u_matrices(self.drawShader)
-
-            # Draw the source as a line (from start to end)
-            glDrawArrays(GL_LINES, 0, 4)
-
-            # Disable the vertex attribute array once done
-            glDisableVertexAttribArray(self.drawShader.vertexPositionAttribute)
-
-        # Now draw the walls (objects that block or reflect the waves)
-        for wall in self.mediums:
-            self.prep_draw(True)  # Prepare screen for drawing walls
-            glBindBuffer(
-                GL_ARRAY_BUFFER, self.sourceVBO.get_id()
-            )  # Bind the source VBO
-
-            # Draw the wall by drawing a line between the two ends
-            WallCoords = derectify(
-                wall.hitbox.collide(), self.size
-            )  # Get wall's coordinates
-            glLineWidth(1.5)  # Set line width for wall
-
-            # Update the VBO with the new wall coordinates
-            glBufferData(
-                GL_ARRAY_BUFFER, np.array(WallCoords, dtype=np.float32), GL_STATIC_DRAW
-            )
-            glVertexAttribPointer(
-                self.drawShader.vertexPositionAttribute,  # Position attribute in the drawing shader
-                self.sourceVBO.itemSize,  # Number of items per vertex (2 for x, y)
-                GL_FLOAT,  # Data type
-                False,  # Don't normalize
-                0,  # Stride
-                True,  # Offset
+    def update_sources(self):
+        """
+        Gathers the parameters of every source into sourceBank, and marks the texel of each source in
+        the sourceMap texture. Only runs after a source has been added, moved or removed, so
+        unchanged scenes upload nothing. The map is edited in place on the CPU and only the texels
+        that changed are uploaded, so dragging a source uploads two texels rather than the whole map.
+        The parameters reach sourceUBO at the next epoch.
+
+        Attributes used:
+            sources: A list of wave sources that emit waves in the simulation.
+            sourcesDirty: Flag set whenever the sources are edited.
+        """
+        if not self.sourcesDirty:
+            return
+        self.sourcesDirty = False
+
+        sources = simulated_sources(self.sources)
+
+        # Gathered in float64, and uploaded with their phases at the next epoch
+        self.sourceBank.set_sources(sources)
+        self.sourceEpoch = None
+        self.sourceUBO.numItems = len(sources)
+
+        # Clear the texels of the old sources and mark the new ones, keeping the texels that changed
+        sourceMap = self.sourceMapData
+        oldXs, oldYs = self.sourceTexels
+        xs, ys = source_texels(sources, self.size)
+        texels = (np.concatenate([oldYs, ys]), np.concatenate([oldXs, xs]))
+        before = sourceMap[texels]
+        sourceMap[oldYs, oldXs] = 0  # 0 marks texels without a source
+        sourceMap[ys, xs] = np.arange(1, len(sources) + 1)
+        self.sourceTexels = (xs, ys)
+        changed = sourceMap[texels] != before
+        changedYs, changedXs = texels[0][changed], texels[1][changed]
+        if not len(changedXs):
+            return
+
+        # Upload a few changed texels one by one, or the box around them when there are many
+        if len(changedXs) <= SOURCE_TEXEL_UPLOADS:
+            for x, y in set(zip(changedXs.tolist(), changedYs.tolist())):
+                self.upload_source_map((x, y, x + 1, y + 1))
+        else:
+            self.upload_source_map(
+                (
+                    int(changedXs.min()),
+                    int(changedYs.min()),
+                    int(changedXs.max()) + 1,
+                    int(changedYs.max()) + 1,
+                )
             )
 
-            # Set the uniform matrices for the drawing shader
-            self.set_u_matrices(self.drawShader)
+    def upload_source_map(self, rect):
+        """
+        Uploads a rectangle of sourceMapData to the sourceMap texture.
 
-            # Enable vertex attribute array and draw the wall as a line strip
-            glEnableVertexAttribArray(self.drawShader.vertexPositionAttribute)
-            glDrawArrays(
-                GL_LINE_STRIP, 0, 6
-            )  # Draw the wall as a line strip (between two points)
+        Parameters:
+            rect (tuple): The rectangle (x0, y0, x1, y1) to upload, in texels.
+        """
+        x0, y0, x1, y1 = rect
+        glPixelStorei(
+            GL_UNPACK_ALIGNMENT, 2
+        )  # Rows of 16-bit texels may have an odd width
+        glTextureSubImage2D(
+            self.sourceMap.get_id(),
+            0,
+            x0,
+            y0,
+            x1 - x0,
+            y1 - y0,
+            GL_RED_INTEGER,
+            GL_UNSIGNED_SHORT,
+            np.ascontiguousarray(self.sourceMapData[y0:y1, x0:x1]),
+        )
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 4)
 
-            # Disable the vertex attribute array once done
-            glDisableVertexAttribArray(self.drawShader.vertexPositionAttribute)
+    def set_source_epoch(self, epoch):
+        """
+        Packs the frequency, amplitude and phase at an epoch of every source into sourceUBO. The
+        phases are taken in float64 and wrapped to [0, 2pi), and the shaders are given the time since
+        the epoch, so the precision of the float32 sines does not degrade as the simulation runs.
 
-            # Restore color mask (so we can draw over the framebuffer)
-            glColorMask(True, True, True, True)
+        Parameters:
+            epoch (float): The simulation time the phases are taken at.
+        """
+        self.sourceEpoch = epoch
+        bank = self.sourceBank
+        if not len(bank):
+            return
+        # One vec4 (frequency, amplitude, phase at the epoch, unused) per source
+        params = np.zeros((len(bank), 4), dtype=np.float32)
+        params[:, 0] = bank.freq
+        params[:, 1] = bank.amp
+        params[:, 2] = bank.get_phases(epoch)
+        glBindBuffer(GL_UNIFORM_BUFFER, self.sourceUBO.get_id())
+        glBufferSubData(GL_UNIFORM_BUFFER, 0, params.nbytes, params)
+        glBindBuffer(GL_UNIFORM_BUFFER, 0)
+
+    def update_material(self, rect):
+        """
+        Rasterises the walls and mediums inside a rectangle of texels into the material grid, and
+        uploads only that rectangle to the material texture. Called with the bounds of every medium
+        that was added, moved, resized or removed, so editing one medium never touches the rest.
 
-        # Unbind the framebuffer (stop rendering to texture, render to screen instead)
-        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+        Parameters:
+            rect (tuple): The rectangle (x0, y0, x1, y1) to rebuild, in texels.
+        """
+        if self.material is None or rect is None:
+            return  # No GL context yet, on_init rasterises the whole scene
+        rect = self.material.update(self.mediums, rect)
+        if rect is None:
+            return
+        x0, y0, x1, y1 = rect
+        glTextureSubImage2D(
+            self.materialTexture.get_id(),
+            0,
+            x0,
+            y0,
+            x1 - x0,
+            y1 - y0,
+            GL_RED,
+            GL_FLOAT,
+            self.material.get_region(rect),
+        )
+
+    def get_bounds(self, medium):
+        """
+        Returns the rectangle of texels covered by a medium, or None before on_init.
+
+        Parameters:
+            medium (Medium): The wall or medium.
+        """
+        if self.material is None:
+            return None
+        return self.material.get_bounds(medium)
+
+    def draw_walls(self):
+        """
+        Draws the outline of every wall and medium over the displayed simulation, so that the
+        objects can be seen and dragged. The outlines are only an overlay; the simulation reads
+        the walls from the material texture.
+
+        Attributes used:
+            mediums: A list of walls or objects that interact with waves.
+        """
+        # Rebuild the wall outlines if walls were added or removed since the last frame
+        self.update_walls()
+        if not self.wallVBO.numItems:
+            return
+
+        # Outlines are in simulation space, so scale them to match the cropped display
+        scale = 1 / (1 - 2 * self.windowOffset)
+        mvMatrix = np.matrix(np.diag([scale, scale, 1, 1]), np.float32)
+
+        # Draw every wall outline with a single call
+        count = self.wallVBO.numItems // WALL_VERTICES
+        firsts = np.arange(count, dtype=np.int32) * WALL_VERTICES
+        counts = np.full(count, WALL_VERTICES, dtype=np.int32)
+        glUseProgram(self.drawShader.get_pid())
+        glUniformMatrix4fv(self.drawShader.pMatrixUniform, 1, False, self.pMatrix)
+        glUniformMatrix4fv(self.drawShader.mvMatrixUniform, 1, False, mvMatrix)
+        glBindVertexArray(self.wallVAO)
+        glMultiDrawArrays(GL_TRIANGLE_STRIP, firsts, counts, count)
+        glBindVertexArray(0)
+
+    def wall_vertices(self, walls):
+        """
+        Builds the outlines of walls as closed thick lines around their rotated corners, rotating
+        and outlining every wall in one batched call. Each outline is a triangle strip of
+        WALL_VERTICES vertices, and each vertex holds an (x, y) position in normalized device space
+        followed by an RGBA colour, grey for mediums and darker for walls.
+
+        Parameters:
+            walls (list): The walls or mediums to outline.
+
+        Returns:
+            np.ndarray: A (WALL_VERTICES * len(walls), 6) float32 array of vertices.
+        """
+        slots = self.store.get_slots(walls)
+        corners = self.store.get_corners(slots).reshape(-1, 2)
+        strips, _, _ = thick_polylines(
+            corners, np.arange(0, len(corners) + 1, 4), WALL_THICKNESS, closed=True
+        )
+        strips = 2 * strips / np.array(self.size, dtype=np.float32) - 1
+        vertices = np.zeros((len(walls), WALL_VERTICES, 6), dtype=np.float32)
+        vertices[:, :, :2] = strips.reshape(len(walls), WALL_VERTICES, 2)
+        shade = 0.4 + 0.4 * np.minimum(self.store.n[slots], 1)
+        vertices[:, :, 2:5] = shade[:, np.newaxis, np.newaxis]
+        vertices[:, :, 5] = 1.0
+        return vertices.reshape(-1, 6)
+
+    def update_walls(self):
+        """
+        Rebuilds wallVBO from every wall if walls have been added or removed.
+        Runs only when wallsDirty is set, so unchanged scenes upload nothing.
+
+        Attributes used:
+            mediums: A list of walls or objects that interact with waves.
+            wallsDirty: Flag set whenever walls are added or removed.
+        """
+        if not self.wallsDirty:
+            return
+        self.wallsDirty = False
+
+        vertices = self.wall_vertices(self.mediums)
+
+        glBindBuffer(GL_ARRAY_BUFFER, self.wallVBO.get_id())
+        glBufferData(GL_ARRAY_BUFFER, vertices, GL_DYNAMIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        self.wallVBO.numItems = len(vertices)
+
+    def set_wall(self, wall, bounds=None):
+        """
+        Updates the outline of a single wall in wallVBO and its texels in the material texture after
+        it has been moved, resized or rotated.
+
+        Parameters:
+            wall (Medium): The wall that changed.
+            bounds (tuple, optional): The rectangle of texels the wall covered before the change, so
+                                      the texels it uncovered are rebuilt too.
+        """
+        self.update_material(union_rect(bounds, self.get_bounds(wall)))
+        self.upload_wall(wall)
+
+    def upload_wall(self, wall):
+        """
+        Writes the outline of a single wall into its slot of wallVBO, which matches its index in
+        the dense mediums list.
+
+        Parameters:
+            wall (Medium): The wall to upload.
+        """
+        if self.wallsDirty:
+            return  # The whole buffer is rebuilt before the next draw anyway
+
+        index = self.registry.get_index(wall.get_id())
+        vertices = self.wall_vertices([wall])
+        glBindBuffer(GL_ARRAY_BUFFER, self.wallVBO.get_id())
+        glBufferSubData(
+            GL_ARRAY_BUFFER, index * vertices.nbytes, vertices.nbytes, vertices
+        )
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def remove_wall(self, moved):
+        """
+        Drops the last outline from wallVBO after a wall has been removed, rewriting the slot of
+        the wall that the registry moved into the gap.
+
+        Parameters:
+            moved (Medium or None): The wall moved into the removed slot, or None if there was none.
+        """
+        if self.wallsDirty:
+            return  # The whole buffer is rebuilt before the next draw anyway
+        self.wallVBO.numItems -= WALL_VERTICES
+        if moved is not None:
+            self.upload_wall(moved)
 
     def on_render(self):
         """
         Renders the simulation by drawing the final output to the screen.
         """
+        with self.profile("display"):
+            self.draw_display()
+
+        # Outline the walls and mediums over the simulation
+        with self.profile("walls"):
+            self.draw_walls()
+
+        if self.recorder is not None:
+            with self.profile("record"):
+                self.record_frame()
+
+        # Redraw the input panel if anything on it changed, then draw it beside the simulation
+        with self.profile("ui"):
+            self.update_panel()
+            self.draw_panel()
+
+        # Update the display
+        with self.profile("flip"):
+            pygame.display.flip()
+
+    def draw_display(self, framebuffer=0):
+        """
+        Draws the most recently simulated state to the screen through the display shader.
+
+        Arguments Used:
+            framebuffer (int): A framebuffer the size of the simulation to draw into instead.
+                               Defaults to 0, the visible window.
+        """
         glUseProgram(self.displayShader.get_pid())
 
-        # Set render target to the main context (visible window)
-        glBindFramebuffer(GL_FRAMEBUFFER, 0)
-        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        # Set render target to the main context (visible window), with the simulation in the top
+        # left corner where the mouse is mapped to it
+        glBindFramebuffer(GL_FRAMEBUFFER, framebuffer)
+        if framebuffer == 0:
+            glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+            glViewport(0, 200, self.width, self.height)
+        else:
+            glViewport(0, 0, self.width, self.height)
 
-        # Bind texture and set shader uniforms for rendering
+        # Bind the most recently simulated state and set shader uniforms for rendering
         glActiveTexture(GL_TEXTURE0)
-        glBindTexture(GL_TEXTURE_2D, 0)  # Unbind any previous texture
+        glBindTexture(GL_TEXTURE_2D, self.renderTexture1.get_id())
         glUniform1i(self.displayShader.samplerUniform, 0)  # Set texture unit 0
+        glActiveTexture(GL_TEXTURE2)
+        glBindTexture(GL_TEXTURE_2D, self.materialTexture.get_id())
+        glActiveTexture(GL_TEXTURE0)
+        glUniform1i(self.displayShader.materialUniform, 2)  # Set texture unit 2
         glUniform1f(self.displayShader.brightnessUniform, 1)  # Set brightness level
         glUniform3fv(
             self.displayShader.coloursUniform,
@@ -698,6 +1251,26 @@ class App:
         # Set transformation matrices for the shader
         self.set_u_matrices(self.displayShader)
 
+        # Send the corners of the display window and their texture coordinates to the shader
+        glBindBuffer(GL_ARRAY_BUFFER, self.vertexPositionBuffer.get_id())
+        glVertexAttribPointer(
+            self.displayShader.vertexPositionAttribute,
+            self.vertexPositionBuffer.itemSize,
+            GL_FLOAT,
+            False,
+            0,
+            None,
+        )
+        glBindBuffer(GL_ARRAY_BUFFER, self.texCoordVBO.get_id())
+        glVertexAttribPointer(
+            self.displayShader.textureCoordAttribute,
+            self.texCoordVBO.itemSize,
+            GL_FLOAT,
+            False,
+            0,
+            None,
+        )
+
         # Enable attributes for rendering
         glEnableVertexAttribArray(self.displayShader.vertexPositionAttribute)
         glEnableVertexAttribArray(self.displayShader.textureCoordAttribute)
@@ -709,60 +1282,448 @@ class App:
         glDisableVertexAttribArray(self.displayShader.vertexPositionAttribute)
         glDisableVertexAttribArray(self.displayShader.textureCoordAttribute)
 
-        # Blit simulation output onto the main surface
-        self.masterSurface.blit(self.simDisplaySurface, (0, 0))
+    def record_frame(self):
+        """
+        Draws the display pass into recordTexture and starts reading it back if the recorder wants
+        this frame, then hands every finished readback to the recorder. Frames are dropped, never
+        waited for, when the recorder or the readback buffers are busy.
+        """
+        number = self.recorder.want()
+        if number is not None:
+            self.draw_display(self.recordTexture.framebuffer.get_id())
+            glBindFramebuffer(GL_FRAMEBUFFER, 0)
+            if not self.frameReadback.request(self.recordTexture.get_id(), number):
+                self.recorder.dropped += 1
+        self.frameReadback.collect(self.recorder.submit)
+
+    def update_panel(self):
+        """
+        Redraws the input panel and uploads it to panelTexture, but only if a slider value, the
+        selection or the timings shown have changed since it was last drawn.
+        """
+        if (
+            self.profiler is not None
+            and self.profiling
+            and self.profiler.frame % PROFILE_REFRESH == 0
+        ):
+            self.profileLines = self.profiler.get_summary() + self.pacer.get_summary()
+        state = (
+            self.active,
+            tuple(tuple(slider) for slider in self.sliders),
+            tuple(self.profileLines),
+        )
+        if state == self.panelState:
+            return
+        self.panelState = state
 
         # Clear and draw UI elements
         self.inputsSurface.fill(Color(220, 220, 220))
         self.draw_sliders()
+        self.draw_profile()
+
+        # Rows are flipped so that the first row uploaded is the bottom of the panel
+        glTextureSubImage2D(
+            self.panelTexture.get_id(),
+            0,
+            0,
+            0,
+            self.panelTexture.get_width(),
+            self.panelTexture.get_height(),
+            GL_RGBA,
+            GL_UNSIGNED_BYTE,
+            pygame.image.tobytes(self.inputsSurface, "RGBA", True),
+        )
 
-        # Add UI elements to the main display
-        self.masterSurface.blit(self.inputsSurface, (self.width, 0))
+    def draw_panel(self):
+        """
+        Draws the input panel texture to the right of the simulation.
+        """
+        shader = self.shaders.get("panel")
+        glUseProgram(shader.get_pid())
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+        glViewport(
+            self.width,
+            200,
+            self.panelTexture.get_width(),
+            self.panelTexture.get_height(),
+        )
+        glActiveTexture(GL_TEXTURE0)
+        glBindTexture(GL_TEXTURE_2D, self.panelTexture.get_id())
+        glUniform1i(shader.samplerUniform, 0)  # Set texture unit 0
+        self.set_u_matrices(shader)
+        glBindVertexArray(self.panelVAO)
+        glDrawArrays(GL_TRIANGLE_STRIP, 0, self.vertexPositionBuffer.numItems)
+        glBindVertexArray(0)
 
-        # Update the display
-        pygame.display.flip()
+    def draw_profile(self):
+        """
+        Draws the rolling percentiles of each frame phase at the bottom of the input surface.
+        """
+        lines = self.profileLines if self.profiling else []
+        top = self.height - 16 * len(lines) - 10
+        for count, line in enumerate(lines):
+            text = self.textCache.render(line, True, Color(0, 0, 0))
+            self.inputsSurface.blit(text, (10, top + 16 * count))
 
     def on_cleanup(self):
         """
         Cleans up resources and quits the application.
         """
+        if self.profiler is not None:
+            self.profiler.close()
+            self.glCalls.uninstall()
+        if self.pacer is not None:
+            self.pacer.close()
+        if self.fieldReadback is not None:
+            self.fieldReadback.collect(self.send_field, wait=True)
+            self.fieldReadback.close()
+        if self.recorder is not None:
+            self.frameReadback.collect(self.recorder.submit, wait=True)
+            self.frameReadback.close()
+            self.recorder.close()
+            print(
+                f"Recorded {self.recorder.written} frames to {self.recordPath} "
+                f"({self.recorder.dropped} dropped)"
+            )
         pygame.quit()
 
-    def on_execute(self):
+    def on_execute(self, scene=None, checkpoint=None, dt=None):
         """
         Main execution loop for the simulation.
         Initializes, runs, and cleans up the program.
+
+        Parameters:
+            scene (dict, optional): The scene to start with, as returned by scene.load_scene.
+                                    Defaults to None, which loads the default scene.
+            checkpoint (dict, optional): A checkpoint to resume, as returned by
+                                         checkpoint.load_checkpoint. Replaces the scene.
+            dt (float, optional): The simulation time advanced per step, in milliseconds.
+                                  Defaults to None, which keeps the dt of the checkpoint or clock.
         """
+        if checkpoint is not None:
+            scene = checkpoint["settings"]
+        elif scene is None:
+            scene = load_scene()
+        self.set_settings(scene)
+
         if self.on_init() == False:
             self.running = False
 
-        # Add initial objects to the simulation
-        self.add_source([self.width / 2, self.height / 2], 0, 10, 1)  # Center source
-        self.add_source(
-            [(self.width / 2) + 50, (self.height / 2) + 50], 1, 10, 1
-        )  # Offset source
-        self.add_wall([250, 550], [300, 10], 180, 2)  # Static wall
+        # Add initial objects to the simulation, or carry on from the checkpoint
+        if checkpoint is not None:
+            self.restore_state(checkpoint)
+            GPUSolver(self).set_field(checkpoint["field"])
+        else:
+            self.load_objects(scene)
+        if dt is not None:
+            self.simClock.set_dt(dt)
 
         # Main application loop
         while self.running:
-            for event in pygame.event.get():
-                self.on_event(event)  # Handle input events
+            if self.profiler is not None:
+                self.profiler.begin_frame()
+            with self.profile("events"):
+                for event in pygame.event.get():
+                    self.on_event(event)  # Handle input events
             self.on_loop()  # Update simulation logic
             self.on_render()  # Render the updated scene
+            if self.profiler is not None:
+                self.profiler.end_frame()
 
         self.on_cleanup()  # Cleanup before exiting
 
-    def add_drag(self, item):
+    def on_batch(
+        self,
+        steps,
+        backend="gpu",
+        dt=None,
+        output="output",
+        scene=None,
+        checkpoint=None,
+    ):
         """
-        Adds a draggable object to the simulation.
+        Runs the simulation headless for a fixed number of steps as fast as possible, then writes
+        the final field and the measured throughput to disk.
+
+        No events are polled, no sliders are drawn and the display is never flipped, so the run is
+        not tied to the monitor refresh rate or window management.
+
+        Parameters:
+            steps (int): The number of simulation steps to run.
+            backend (str): "gpu" to step the simulation shaders, or "cpu" for the NumPy solver.
+            dt (float, optional): The simulation time advanced per step, in milliseconds. Defaults to
+                                  None, which keeps the dt of the checkpoint or clock.
+            output (str): The directory the results are written to.
+            scene (dict, optional): The scene to simulate. Defaults to None, which loads the default scene.
+            checkpoint (dict, optional): A checkpoint to resume, as returned by
+                                         checkpoint.load_checkpoint. Replaces the scene.
+
+        Returns:
+            dict: The statistics of the run, as written to stats.json.
+        """
+        if checkpoint is not None:
+            scene = checkpoint["settings"]
+        elif scene is None:
+            scene = load_scene()
+        self.set_settings(scene)
+
+        # Set up the requested backend
+        if backend == "cpu":
+            solver = CPUSolver(
+                self.size,
+                self.damping,
+                self.reflective,
+                self.spongeWidth,
+                self.spongeStrength,
+            )
+        else:
+            self.on_init(headless=True)
+            solver = GPUSolver(self)
+
+        if checkpoint is not None:
+            self.restore_state(checkpoint)
+            solver.set_scene(self.sources, self.mediums)
+            solver.set_field(checkpoint["field"])
+        else:
+            self.load_objects(scene)
+            solver.set_scene(self.sources, self.mediums)
+
+        # Step the simulation with no UI work in the loop, at the same times on either backend
+        if dt is not None:
+            self.simClock.set_dt(dt)
+        times = self.simClock.advance(steps)
+        start = time.perf_counter()
+        solver.run(times)
+        if backend != "cpu":
+            glFinish()  # Wait for the queued passes to finish before stopping the timer
+        elapsed = time.perf_counter() - start
+        self.time = self.simClock.time
+
+        stats = {
+            "backend": backend,
+            "size": list(self.size),
+            "steps": steps,
+            "seconds": elapsed,
+            "steps_per_sec": steps / elapsed if elapsed > 0 else 0.0,
+        }
+
+        # Write the final field, a checkpoint to resume from, and the statistics of the run
+        os.makedirs(output, exist_ok=True)
+        field = solver.get_field()
+        np.save(os.path.join(output, "field.npy"), field)
+        self.save_state(
+            os.path.join(output, "checkpoint.npz"), field, self.checkpointBase
+        )
+        with open(os.path.join(output, "stats.json"), "w") as file:
+            json.dump(stats, file, indent=4)
+
+        if backend != "cpu":
+            self.on_cleanup()
+        return stats
+
+    def set_settings(self, scene):
+        """
+        Applies the grid size, damping, absorbing layer and wall behaviour of a scene. Must be called
+        before on_init.
+
+        Parameters:
+            scene (dict): The scene description, as returned by scene.load_scene.
+        """
+        self.size = self.width, self.height = tuple(scene["size"])
+        self.damping = scene["damping"]
+        self.spongeWidth = scene["sponge_width"]
+        self.spongeStrength = scene["sponge_strength"]
+        self.windowOffset = self.get_margin()
+        self.reflective = scene["reflective"]
+
+    def get_margin(self):
+        """
+        Works out the fraction of the grid hidden at each edge of the display, which is just wide
+        enough to hide the outer ring and the absorbing layer.
+
+        Returns:
+            float: The window offset, as a fraction of the grid.
+        """
+        return (self.spongeWidth + 1) / min(self.size)
+
+    def load_objects(self, scene):
+        """
+        Adds the sources and mediums of a scene to the simulation.
+
+        Parameters:
+            scene (dict): The scene description, as returned by scene.load_scene.
+        """
+        for source in scene["sources"]:
+            self.add_source(
+                list(source["pos"]),
+                self.registry.new_id(),
+                source["frequency"],
+                source["amplitude"],
+                source.get("phase", 0),
+            )
+        for med in scene["mediums"]:
+            self.add_medium(
+                list(med["pos"]),
+                list(med["size"]),
+                self.registry.new_id(),
+                med["rotation"],
+                med["refractive_index"],
+            )
+
+    def save_state(self, path, field, base=None):
+        """
+        Saves the running simulation to a checkpoint file: the field, the scene settings, the
+        simulation clock, every source and medium, and the undo history.
+
+        Parameters:
+            path (str): The path of the checkpoint file.
+            field (np.ndarray): The current field, as returned by a solver's get_field.
+            base (str, optional): A checkpoint to delta-encode the field against. Defaults to None.
+        """
+        settings = {
+            "size": list(self.size),
+            "damping": self.damping,
+            "sponge_width": self.spongeWidth,
+            "sponge_strength": self.spongeStrength,
+            "reflective": self.reflective,
+            "dt": self.simClock.dt,
+            "clock_start": self.simClock.start,
+            "clock_step": self.simClock.step,
+            "next_id": self.registry.nextId,
+        }
+        save_checkpoint(
+            path,
+            field,
+            settings,
+            self.sources,
+            self.mediums,
+            self.actionstack,
+            self.actionstackpointer,
+            base,
+        )
+
+    def restore_state(self, checkpoint):
+        """
+        Restores the simulation clock, sources, mediums and undo history of a checkpoint. The
+        settings must already have been applied with set_settings, and the field is set afterwards
+        through the solver, so the same restore serves every backend.
+
+        Parameters:
+            checkpoint (dict): The checkpoint, as returned by checkpoint.load_checkpoint.
+        """
+        settings = checkpoint["settings"]
+        self.simClock = SimClock(settings["dt"], settings["clock_start"])
+        self.simClock.step = settings["clock_step"]
+        self.time = self.simClock.time
+
+        # Rebuild every item under its saved id, registering only those still in the scene
+        items = {}
+        for records, detached in (
+            (checkpoint["sources"], False),
+            (checkpoint["detached_sources"], True),
+        ):
+            for record in records:
+                hitbox = Hitbox(
+                    record["pos"].tolist(), [8, 8], int(record["id"]), self.store
+                )
+                source = Source(hitbox, record["freq"], record["amp"], record["phase"])
+                source.set_zerot(record["zerot"])
+                items[int(record["id"])] = source
+                if not detached:
+                    self.add_item(source)
+        for records, detached in (
+            (checkpoint["mediums"], False),
+            (checkpoint["detached_mediums"], True),
+        ):
+            for record in records:
+                hitbox = Hitbox(
+                    record["pos"].tolist(),
+                    record["size"].tolist(),
+                    int(record["id"]),
+                    self.store,
+                )
+                medium = Medium(hitbox, record["rot"], record["n"])
+                items[int(record["id"])] = medium
+                if not detached:
+                    self.add_item(medium)
+        self.registry.nextId = max(self.registry.nextId, settings["next_id"])
+
+        # Actions refer to the same objects as the scene, so undo and redo carry on as before
+        self.actionstack = []
+        for record in checkpoint["actions"]:
+            kind = record["kind"].decode()
+            if kind == "m":
+                self.actionstack.append(
+                    [
+                        kind,
+                        tuple(record["start"]),
+                        tuple(record["end"]),
+                        int(record["id"]),
+                    ]
+                )
+            else:
+                self.actionstack.append([kind, items[int(record["id"])]])
+        self.actionstackpointer = checkpoint["pointer"]
+
+    def add_drag(self, item, id, corners):
+        """
+        Adds a draggable object to the simulation, and indexes its outline so it can be picked.
 
         Parameters:
             item: The object to be made draggable.
+            id (int): The id of the object, used as its key in dragItems.
+            corners (list): The (x, y) corners of the object's outline.
         """
-        # Store the draggable object in the list
-        self.dragItems.append(item)
+        # Store the draggable object by its id
+        self.dragItems[id] = item
+        self.spatial.insert(id, corners)
 
-    def add_source(self, pos, id, frequency, amplitude):
+    def add_item(self, item):
+        """
+        Registers a source or medium with the simulation under its own id. Used both for new items
+        and to restore removed ones exactly as they were.
+
+        Parameters:
+            item (Source or Medium): The item to add.
+        """
+        id = item.get_id()
+        if isinstance(item, Source):
+            self.registry.add(item, "s")
+            self.sourcesDirty = True
+            corners = item.hitbox.get_corners()
+        else:
+            self.registry.add(item, "w")
+            self.wallsDirty = True
+            self.update_material(self.get_bounds(item))
+            corners = item.get_rotated()
+
+        # Make the item draggable by adding its collision hitbox
+        self.add_drag(item.hitbox.collide(), id, corners)
+
+    def remove_item(self, id):
+        """
+        Removes a source or medium in constant time, keeping the lists of sources and mediums dense.
+
+        Parameters:
+            id (int): The id of the item to remove.
+
+        Returns:
+            Source or Medium: The removed item, which add_item can restore.
+        """
+        item = self.registry.get(id)
+        bounds = self.get_bounds(item) if isinstance(item, Medium) else None
+        item, _, moved = self.registry.remove(id)
+        del self.dragItems[id]
+        self.spatial.remove(id)
+
+        if isinstance(item, Source):
+            self.sourcesDirty = True
+        else:
+            self.remove_wall(moved)
+            self.update_material(bounds)
+        return item
+
+    def add_source(self, pos, id, frequency, amplitude, phase=0):
         """
         Adds a wave source at a given position with specified properties.
 
@@ -771,18 +1732,16 @@ class App:
             id (int): Unique identifier for the source.
             frequency (float): Frequency of the wave source.
             amplitude (float): Amplitude of the wave source.
+            phase (float, optional): Phase offset of the wave source in radians. Defaults to 0.
         """
         # Create a hitbox for the wave source with a fixed size of [8, 8]
-        hitbox = Hitbox(pos, [8, 8], id)
+        hitbox = Hitbox(pos, [8, 8], id, self.store)
 
         # Create a Source object using the hitbox
-        source = Source(hitbox, frequency, amplitude)
+        source = Source(hitbox, frequency, amplitude, phase)
 
-        # Store the source in the sources list
-        self.sources.append(source)
-
-        # Make the source draggable by adding its collision hitbox
-        self.add_drag(source.hitbox.collide())
+        # Register the source and make it draggable
+        self.add_item(source)
 
     def add_wall(self, pos, size, rot, id):
         """
@@ -795,16 +1754,13 @@ class App:
             id (int): Unique identifier for the wall.
         """
         # Create a hitbox for the wall
-        hitbox = Hitbox(pos, size, id)
+        hitbox = Hitbox(pos, size, id, self.store)
 
         # Create a Medium object representing the wall (n=0, meaning no refraction)
         wall = Medium(hitbox, rot, 0)
 
-        # Store the wall in the mediums list
-        self.mediums.append(wall)
-
-        # Make the wall draggable by adding its collision hitbox
-        self.add_drag(wall.hitbox.collide())
+        # Register the wall and make it draggable
+        self.add_item(wall)
 
     def add_medium(self, pos, size, id, rot, n):
         """
@@ -818,176 +1774,42 @@ class App:
             n (float): Refractive index of the medium.
         """
         # Create a hitbox for the medium
-        hitbox = Hitbox(pos, size, id)
+        hitbox = Hitbox(pos, size, id, self.store)
 
         # Create a Medium object with the given properties
         med = Medium(hitbox, rot, n)
 
-        # Store the medium in the mediums list
-        self.mediums.append(med)
-
-        # Make the medium draggable by adding its collision hitbox
-        self.add_drag(med.hitbox.collide())
+        # Register the medium and make it draggable
+        self.add_item(med)
 
-    def prep_draw(self, wall):
-        """
-        Configures the OpenGL state, including the color mask, before any drawing happens.
-        The color mask is used to control which color channels are affected by the drawing operation.
-
-        Arguments Used:
-            wall (bool): Flag indicating if the object being drawn is a wall.
-                        - If True, it sets up the color mask for walls (blue channel).
-                        - If False, it sets up the color mask for general drawing.
-        """
-        # Bind the framebuffer to render to the texture
-        rttFramebuffer = self.renderTexture1.framebuffer
-        glBindFramebuffer(GL_FRAMEBUFFER, rttFramebuffer.get_id())
+    @property
+    def displayShader(self):
+        # Shader responsible for displaying the simulation on screen
+        return self.shaders.get("display")
 
-        # Set the viewport size to match the framebuffer dimensions
-        glViewport(0, 0, rttFramebuffer.get_width(), rttFramebuffer.get_height())
+    @property
+    def mainShaderAbs(self):
+        # Shader for calculating wave propagation with absorption by walls
+        return self.shaders.get("absorb")
 
-        # Use the drawing shader program
-        glUseProgram(self.drawShader.get_pid())
+    @property
+    def mainShaderRef(self):
+        # Shader for calculating wave reflection off walls
+        return self.shaders.get("reflect")
 
-        # If drawing a wall, use the blue channel for walls/mediums, else allow all channels
-        if wall:
-            # Blue channel for walls and media
-            glColorMask(False, False, True, False)
-            glVertexAttrib4f(self.drawShader.colourAttribute, 0.0, 0.0, 1.0, 1.0)
-        else:
-            # Allow all color channels except alpha
-            glColorMask(True, True, True, False)
+    @property
+    def drawShader(self):
+        # Shader for drawing objects onto the screen
+        return self.shaders.get("draw")
 
-    def load_shader(self, shader_file):
+    def get_sim_shader(self):
         """
-        Reads the shader file, determines the shader type (fragment or vertex),
-        compiles the shader, and checks for compile errors. If the compilation fails, it prints an error message.
-
-        Arguments Used:
-            shader_file (str): The file path to the shader source file.
+        Returns the simulation shader for the current wall behaviour, building it on first use.
 
         Returns:
-            int or None: Returns the compiled shader object if successful, or None if there was an error.
-        """
-        # Open the shader file and read its contents
-        with open(shader_file, "r") as file:
-            shader_source = file.read()
-
-            # Check if shader source exists
-            if shader_source:
-                # Determine shader type (fragment or vertex) based on file extension
-                if "fs" in shader_file:
-                    shader = compileShader(shader_source, GL_FRAGMENT_SHADER)
-                elif "vs" in shader_file:
-                    shader = compileShader(shader_source, GL_VERTEX_SHADER)
-                else:
-                    return None  # Unknown shader type
-
-                # Compile the shader and check for errors
-                glCompileShader(shader)
-                if not glGetShaderiv(shader, GL_COMPILE_STATUS):
-                    print(
-                        f"Shader compile error in {shader_file}: {glGetShaderInfoLog(shader)}"
-                    )
-                    return None
-
-                return shader
-            else:
-                print("Shader source not found")
-                return None
-
-    def create_shader(self, fs, vs):
-        """
-        Creates a shader program by loading and compiling the corresponding fragment and vertex shaders.
-
-        Arguments Used:
-            fs (str): Path to the fragment shader file.
-            vs (str): Path to the vertex shader file.
-
-        Returns:
-            Shader: Returns a Shader object containing the compiled shader program, or None if creation fails.
-
-        This function loads both the fragment and vertex shaders, compiles them, and creates a shader program.
-        It then retrieves the program's attribute and uniform locations.
-        """
-        # Load and compile the fragment shader
-        try:
-            frag_shader = self.load_shader(fs)
-        except:
-            print("Error: Fragment shader not found")
-            return None
-
-        # Load and compile the vertex shader
-        try:
-            vert_shader = self.load_shader(vs)
-        except:
-            print("Error: Vertex shader not found")
-            return None
-
-        # Create the appropriate shader class based on the fragment shader
-        match fs:
-            case "shaders/display-fs.glsl":
-                shader = ShaderMain(glCreateProgram(), frag_shader, vert_shader)
-            case "shaders/simulate-stat-fs.glsl" | "shaders/simulate-prog-fs.glsl":
-                shader = ShaderSimulate(glCreateProgram(), frag_shader, vert_shader)
-            case _:
-                shader = Shader(glCreateProgram(), frag_shader, vert_shader)
-
-        program = shader.get_pid()
-
-        # Attach the vertex and fragment shaders to the program
-        glAttachShader(program, vert_shader)
-        glAttachShader(program, frag_shader)
-
-        # Link the shader program
-        glLinkProgram(program)
-        glUseProgram(program)
-
-        # Retrieve and store attribute locations
-        shader.vertexPositionAttribute = glGetAttribLocation(program, "aPos")
-        shader.textureCoordAttribute = glGetAttribLocation(program, "aTexCoord")
-        shader.dampingAttribute = glGetAttribLocation(program, "aDamping")
-        shader.colourAttribute = glGetAttribLocation(program, "aCol")
-
-        # Retrieve and store uniform locations
-        shader.pMatrixUniform = glGetUniformLocation(program, "pMatrix")
-        shader.mvMatrixUniform = glGetUniformLocation(program, "mvMatrix")
-        shader.samplerUniform = glGetUniformLocation(program, "sampler")
-
-        return shader
-
-    def set_area(self, x1, y1, x2, y2):
-        """
-        Adjusts the coordinates to fit within the simulation space and sets the texture coordinates
-        and damping values for the rectangular area, storing the results in the simulation buffers.
-        Damping is adjusted at the boundaries of the simulation area to reduce wave intensity at the edges.
-
-        Arguments Used:
-            x1 (float): The x-coordinate of the first corner of the rectangle.
-            y1 (float): The y-coordinate of the first corner of the rectangle.
-            x2 (float): The x-coordinate of the opposite corner of the rectangle.
-            y2 (float): The y-coordinate of the opposite corner of the rectangle.
+            Shader: The reflective shader if walls reflect waves, or the absorbing shader otherwise.
         """
-        # Convert rectangle coordinates to normalized device space
-        points = derectify([x2, y1, x1, y1, x2, y2, x1, y1, x2, y2, x1, y2], self.size)
-
-        for i in range(5):
-            xi = points[i * 2]
-            yi = points[i * 2 + 1]
-
-            # Adjust coordinates to fit into normalized device space [-1, 1]
-            self.simPos.append(-1 + (2 * xi / self.width))
-            self.simPos.append(-1 + (2 * yi / self.height))
-
-            # Set texture coordinates, flipped vertically
-            self.simTexCoord.append(xi / self.width)
-            self.simTexCoord.append(1 - yi / self.height)
-
-            # Set damping value, reduced at boundaries
-            damp = self.damping
-            if xi == 1 or yi == 1 or xi == self.width - 1 or yi == self.height - 1:
-                damp = damp * 0.91
-            self.simDamping.append(damp)
+        return self.mainShaderRef if self.reflective else self.mainShaderAbs
 
     def set_u_matrices(self, shader):
         """
@@ -1000,11 +1822,14 @@ class App:
         glUniformMatrix4fv(shader.pMatrixUniform, 1, False, self.pMatrix)
         glUniformMatrix4fv(shader.mvMatrixUniform, 1, False, self.mvMatrix)
 
-    def create_texture(self):
+    def create_texture(self, internalFormat=GL_RGBA32F):
         """
         Creates a framebuffer and a texture, setting up the necessary parameters for rendering to the texture.
         Also checks if the framebuffer and texture are correctly set up and verifies that no
-        OpenGL errors occurred.
+        OpenGL errors occurred. The texture starts out as free space, with no displacement.
+
+        Arguments Used:
+            internalFormat (int): The OpenGL internal format of the texture, from STATE_FORMATS.
 
         Returns:
             Texture: The created texture object, or None if an error occurred during creation.
@@ -1033,7 +1858,11 @@ class App:
 
         # Allocate storage for the texture
         glTexStorage2D(
-            GL_TEXTURE_2D, 1, GL_RGBA8, self.rtt.get_width(), self.rtt.get_height()
+            GL_TEXTURE_2D,
+            1,
+            internalFormat,
+            self.rtt.get_width(),
+            self.rtt.get_height(),
         )
 
         # Create a renderbuffer for depth/stencil attachment
@@ -1052,6 +1881,10 @@ class App:
             print(f"Framebuffer error: {status}")
             return None
 
+        # Start with no displacement or velocity everywhere
+        glClearColor(0.0, 0.0, 0.0, 1.0)
+        glClear(GL_COLOR_BUFFER_BIT)
+
         # Read a single pixel to check if the framebuffer is correctly set up
         pixels = np.zeros(4, dtype=float)
         glReadPixels(0, 0, 1, 1, GL_RGBA, GL_FLOAT, pixels)
@@ -1100,20 +1933,20 @@ class App:
             )
 
             # Render slider label
-            text_size = [x / 2 for x in self.text.size(name)]
+            text_size = [x / 2 for x in self.textCache.size(name)]
             text_pos = [150 - text_size[0], tall - text_size[1] + 15]
-            text = self.text.render(name, False, Color(0, 0, 0))
+            text = self.textCache.render(name, False, Color(0, 0, 0))
             self.inputsSurface.blit(text, text_pos)
 
             # Render minimum value label
-            min_text = self.text.render(str(min_val), True, Color(0, 0, 0))
-            min_size = [x / 2 for x in self.text.size(str(min_val))]
+            min_text = self.textCache.render(str(min_val), True, Color(0, 0, 0))
+            min_size = [x / 2 for x in self.textCache.size(str(min_val))]
             min_pos = [40 - min_size[0], tall - min_size[1] + 15]
             self.inputsSurface.blit(min_text, min_pos)
 
             # Render maximum value label
-            max_text = self.text.render(str(max_val), True, Color(0, 0, 0))
-            max_size = [x / 2 for x in self.text.size(str(max_val))]
+            max_text = self.textCache.render(str(max_val), True, Color(0, 0, 0))
+            max_size = [x / 2 for x in self.textCache.size(str(max_val))]
             max_pos = [260 - max_size[0], tall - max_size[1] + 15]
             self.inputsSurface.blit(max_text, max_pos)
 
@@ -1136,8 +1969,8 @@ class App:
             ]
         elif isinstance(item, Medium):
             return [
-                ["Width", 1, 300, item.get_size()[0]],
-                ["Height", 1, 300, item.get_size()[1]],
+                ["Width", 1, 300, item.hitbox.get_size()[0]],
+                ["Height", 1, 300, item.hitbox.get_size()[1]],
                 ["Refractive Index", 0, 1, item.get_refractive_index()],
                 ["Rotation", 0, 360, item.get_rot()],
             ]
@@ -1173,6 +2006,41 @@ class App:
                 if 0 < pos[0] - self.width - 40 < 260:
                     # Update slider value based on mouse X position
                     slider[3] = (pos[0] - self.width - 40) * (max_val - min_val) / 220
+                    self.apply_slider(slider[0], slider[3])
+
+    def apply_slider(self, name, value):
+        """
+        Applies the value of a slider to the active item. Sources are re-uploaded on the next step,
+        and a medium only rebuilds the texels it covered before and after the change.
+
+        Parameters:
+            name (str): The label of the slider that changed.
+            value (float): The new value of the slider.
+        """
+        item = self.registry.get(self.active)
+        if isinstance(item, Source):
+            match name:
+                case "Amplitude":
+                    item.set_amp(value)
+                case "Frequency":
+                    item.set_freq(value)
+            self.sourcesDirty = True
+
+        elif isinstance(item, Medium):
+            bounds = self.get_bounds(item)
+            width, height = item.hitbox.get_size()
+            match name:
+                case "Width":
+                    item.set_size([value, height])
+                case "Height":
+                    item.set_size([width, value])
+                case "Refractive Index":
+                    item.set_refractive_index(value)
+                case "Rotation":
+                    item.set_rot(value)
+            self.dragItems[self.active].size = item.hitbox.get_size()
+            self.spatial.update(self.active, item.get_rotated())
+            self.set_wall(item, bounds)
 
     def undo(self):
         """
@@ -1181,10 +2049,10 @@ class App:
         This function moves an item back to its previous position (if moved),
         removes an item (if created), or restores an item (if deleted).
 
-        The action type is determined by the first element in the action tuple:
+        The action type is determined by the first element in the action list:
             - 'm' (move): Moves the item back to its previous position.
-            - 'c' (create): Deletes the most recently created item.
-            - 'd' (delete): Restores the most recently deleted item.
+            - 'c' (create): Removes the created item.
+            - 'd' (delete): Restores the deleted item as it was, with its original id.
         """
         if self.actionstackpointer < 1:
             return  # No actions to undo
@@ -1199,24 +2067,10 @@ class App:
                 self.move_item(action[3], action[1])
 
             case "c":  # Create action: Remove the created item
-                self.dragItems[action[3]] = None
-                match action[2]:
-                    case "s":  # Remove a source
-                        for i, source in enumerate(self.sources):
-                            if source.hitbox.get_id() == action[3]:
-                                self.sources.pop(i)
-                                break
-                    case "w":  # Remove a wall
-                        for i, wall in enumerate(self.mediums):
-                            if wall.hitbox.get_id() == action[3]:
-                                self.mediums.pop(i)
-                                break
+                self.remove_item(action[1].get_id())
 
             case "d":  # Delete action: Restore deleted item
-                if action[1] == "s":
-                    self.add_source(action[2], len(self.dragItems), 10, 1)
-                elif action[1] == "w":
-                    self.add_wall(action[2], [300, 300], 0, len(self.dragItems))
+                self.add_item(action[1])
 
         self.actionstackpointer -= 1  # Update pointer to reflect the undone action
 
@@ -1224,10 +2078,10 @@ class App:
         """
         Redoes the last undone action from the action stack.
 
-        The action type is determined by the first element in the action tuple:
+        The action type is determined by the first element in the action list:
             - 'm' (move): Moves the item back to its final position.
-            - 'c' (create): Re-adds an item that was deleted.
-            - 'd' (delete): Deletes an item again after undoing its removal.
+            - 'c' (create): Restores the created item that was undone.
+            - 'd' (delete): Removes the item again after undoing its removal.
         """
         if self.actionstackpointer == len(self.actionstack):
             return  # No actions to redo
@@ -1242,24 +2096,10 @@ class App:
                 self.move_item(action[3], action[2])
 
             case "c":  # Create action: Restore item that was undone
-                if action[2] == "s":
-                    self.add_source(action[1], action[3], 10, 1)
-                elif action[2] == "w":
-                    self.add_wall(action[1], [300, 300], 0, action[3])
+                self.add_item(action[1])
 
             case "d":  # Delete action: Remove item again
-                self.dragItems[action[3]] = None
-                match action[2]:
-                    case "s":  # Delete a source again
-                        for i, source in enumerate(self.sources):
-                            if source.hitbox.get_id() == action[3]:
-                                self.sources.pop(i)
-                                break
-                    case "w":  # Delete a wall again
-                        for i, wall in enumerate(self.mediums):
-                            if wall.hitbox.get_id() == action[3]:
-                                self.mediums.pop(i)
-                                break
+                self.remove_item(action[1].get_id())
 
         self.actionstackpointer += 1  # Update pointer to reflect the redone action
 
@@ -1289,19 +2129,137 @@ class App:
             item (int): The ID of the item to be moved.
             position (tuple): The new (x, y) coordinates for the item.
         """
-        self.dragItems[item].x, self.dragItems[item].y = position
+        entity = self.registry.get(item)
+        if entity is None:
+            return  # The item has been removed
 
-        for source in self.sources:
-            if source.hitbox.get_id() == item:
-                source.set_pos(position)
-
-        for wall in self.mediums:
-            if wall.hitbox.get_id() == item:
-                wall.set_pos(position)
+        self.dragItems[item].x, self.dragItems[item].y = position
+        if isinstance(entity, Source):
+            entity.hitbox.set_pos(list(position))
+            self.spatial.update(item, entity.hitbox.get_corners())
+            self.sourcesDirty = True
+        else:
+            bounds = self.get_bounds(entity)
+            entity.hitbox.set_pos(list(position))
+            self.spatial.update(item, entity.get_rotated())
+            self.set_wall(entity, bounds)
 
 
 # Run the application when this script is executed directly
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=TITLE)
+    parser.add_argument("--scene", help="JSON scene file to load")
+    parser.add_argument(
+        "--headless",
+        action="store_true",
+        help="run a fixed number of steps without a window and write the results to disk",
+    )
+    parser.add_argument(
+        "--steps", type=int, default=1000, help="number of steps for a headless run"
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["gpu", "cpu"],
+        default="gpu",
+        help="simulation backend for a headless run",
+    )
+    parser.add_argument(
+        "--dt",
+        type=float,
+        default=None,
+        help=f"milliseconds of simulation time per step (default: {DEFAULT_DT}, or the dt of the checkpoint with --resume)",
+    )
+    parser.add_argument(
+        "--state-format",
+        choices=list(STATE_FORMATS),
+        default=DEFAULT_STATE_FORMAT,
+        help="internal format of the simulation state textures",
+    )
+    parser.add_argument(
+        "--substeps",
+        type=int,
+        default=1,
+        help="fewest simulation steps run for every displayed frame",
+    )
+    parser.add_argument(
+        "--pacing",
+        choices=PACING_MODES,
+        default="fps",
+        help="run frames back-to-back, at a target frame rate, or in step with the display",
+    )
+    parser.add_argument(
+        "--fps", type=float, default=60, help="target frame rate for --pacing fps"
+    )
+    parser.add_argument(
+        "--output", default="output", help="directory for headless results"
+    )
+    parser.add_argument(
+        "--resume", help="checkpoint file to carry on from instead of loading a scene"
+    )
+    parser.add_argument(
+        "--checkpoint",
+        default="checkpoint.npz",
+        help="file the C key saves a checkpoint of the running simulation to",
+    )
+    parser.add_argument(
+        "--checkpoint-base",
+        help="checkpoint to delta-encode saved checkpoints against, which must be kept with them",
+    )
+    parser.add_argument(
+        "--record",
+        help="directory (png) or file (y4m, raw) to record the displayed simulation to",
+    )
+    parser.add_argument(
+        "--record-format",
+        choices=RECORD_FORMATS,
+        default="png",
+        help="write a PNG sequence, a YUV4MPEG2 video or raw RGBA frames",
+    )
+    parser.add_argument(
+        "--record-every", type=int, default=1, help="record every Nth displayed frame"
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="time each phase of every frame and show the percentiles in the panel",
+    )
+    parser.add_argument(
+        "--profile-log",
+        help="JSON-lines file to stream the timings of every frame to",
+    )
+    parser.add_argument(
+        "--no-shader-cache",
+        action="store_true",
+        help="always compile the shaders instead of loading cached program binaries",
+    )
+    args = parser.parse_args()
+
     global WaveSim
     WaveSim = App(title="WaveSim")
-    WaveSim.on_execute()
+    WaveSim.stepsPerFrame = max(1, args.substeps)
+    WaveSim.pacingMode = args.pacing
+    WaveSim.recordPath = args.record
+    WaveSim.recordFormat = args.record_format
+    WaveSim.recordEvery = max(1, args.record_every)
+    WaveSim.checkpointPath = args.checkpoint
+    WaveSim.checkpointBase = args.checkpoint_base
+    WaveSim.targetFPS = args.fps
+    WaveSim.stateFormat = args.state_format
+    WaveSim.useShaderCache = not args.no_shader_cache
+    WaveSim.profiling = args.profile
+    WaveSim.profileLog = args.profile_log
+    checkpoint = load_checkpoint(args.resume) if args.resume else None
+    if args.headless:
+        stats = WaveSim.on_batch(
+            args.steps,
+            args.backend,
+            args.dt,
+            args.output,
+            load_scene(args.scene),
+            checkpoint,
+        )
+        print(
+            f"{stats['steps']} steps in {stats['seconds']:.3f}s ({stats['steps_per_sec']:.1f} steps/sec)"
+        )
+    else:
+        WaveSim.on_execute(load_scene(args.scene), checkpoint, args.dt)
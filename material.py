@@ -0,0 +1,200 @@
+import numpy as np
+from typing import List, Tuple
+
+
+def polygon_bounds(
+    corners: List[Tuple[float, float]], size: Tuple[int, int]
+) -> Tuple[int, int, int, int]:
+    """
+    Calculate the rectangle of texels covered by a polygon, clipped to the grid.
+
+    Args:
+        corners (List[Tuple[float, float]]): The (x, y) vertices of the polygon in texels.
+        size (Tuple[int, int]): The size of the grid (width, height).
+
+    Returns:
+        Tuple[int, int, int, int]: The rectangle (x0, y0, x1, y1), with x1 and y1 exclusive.
+    """
+    x0, y0, x1, y1 = polygons_bounds(np.asarray(corners)[np.newaxis], size)[0]
+    return int(x0), int(y0), int(x1), int(y1)
+
+
+def polygons_bounds(corners: np.ndarray, size: Tuple[int, int]) -> np.ndarray:
+    """
+    Calculate the rectangle of texels covered by each of many polygons, clipped to the grid.
+
+    Args:
+        corners (np.ndarray): An (N, K, 2) array of the vertices of each polygon in texels.
+        size (Tuple[int, int]): The size of the grid (width, height).
+
+    Returns:
+        np.ndarray: An (N, 4) integer array of rectangles (x0, y0, x1, y1), with x1 and y1 exclusive.
+    """
+    corners = np.asarray(corners, dtype=np.float64)
+    low = np.floor(corners.min(axis=1))
+    high = np.ceil(corners.max(axis=1)) + 1
+    limit = np.array(size, dtype=np.float64)
+    bounds = np.concatenate([low, high], axis=1)
+    return np.clip(bounds, 0, np.concatenate([limit, limit])).astype(np.intp)
+
+
+def union_rect(a, b):
+    """
+    Calculate the smallest rectangle containing two rectangles. Either may be None.
+
+    Args:
+        a (tuple or None): The first rectangle (x0, y0, x1, y1).
+        b (tuple or None): The second rectangle (x0, y0, x1, y1).
+
+    Returns:
+        tuple or None: The combined rectangle, or None if both are None.
+    """
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+
+def rasterise_polygon(out: np.ndarray, corners, value: float, rect=None):
+    """
+    Write a value into every texel whose centre lies inside a convex polygon.
+
+    Args:
+        out (np.ndarray): The (height, width) array to write into.
+        corners (List[Tuple[float, float]]): The (x, y) vertices of the polygon in order, in texels.
+        value (float): The value to write.
+        rect (tuple, optional): Only texels inside this rectangle (x0, y0, x1, y1) are written.
+    """
+    corners = np.asarray(corners, dtype=np.float64)
+    height, width = out.shape
+    x0, y0, x1, y1 = polygon_bounds(corners, (width, height))
+    if rect is not None:
+        x0, y0 = max(x0, rect[0]), max(y0, rect[1])
+        x1, y1 = min(x1, rect[2]), min(y1, rect[3])
+    if x1 <= x0 or y1 <= y0:
+        return
+
+    # The sign of the area tells which side of each edge is inside
+    p = corners
+    q = np.roll(corners, -1, axis=0)
+    area = np.sum(p[:, 0] * q[:, 1] - q[:, 0] * p[:, 1])
+    if area == 0:
+        return  # Zero sized polygons cover no texels
+
+    # Texel centres covered by the bounding rectangle
+    xs = np.arange(x0, x1, dtype=np.float64)[np.newaxis, :] + 0.5
+    ys = np.arange(y0, y1, dtype=np.float64)[:, np.newaxis] + 0.5
+
+    # A centre is inside when it lies on the inner side of every edge
+    inside = np.ones((y1 - y0, x1 - x0), dtype=bool)
+    for (px, py), (qx, qy) in zip(p, q):
+        cross = (qx - px) * (ys - py) - (qy - py) * (xs - px)
+        inside &= cross * area >= 0
+
+    out[y0:y1, x0:x1][inside] = value
+
+
+class MaterialGrid:
+    """
+    A CPU copy of the material texture read by the simulation shaders.
+
+    Each texel holds the wave-speed coefficient of the medium covering it: 1 for free space,
+    the refractive index of a medium (clamped to between 0 and 1 by Medium, since larger
+    coefficients make the stencil diverge), and 0 for walls (which have a refractive index of 0).
+    Mediums are rasterised from their rotated corners, and mediums with higher ids are drawn
+    over lower ones, so the result does not depend on the order of the list. The outermost ring
+    of texels is always a wall, bounding the simulation.
+
+    Attributes:
+        size (tuple): Size of the grid (width, height).
+        mat (np.ndarray): The (height, width) float32 material of each texel.
+    """
+
+    def __init__(self, size):
+        """
+        Initializes the MaterialGrid object as free space.
+
+        Args:
+            size (tuple): Size of the grid (width, height).
+        """
+        self.size = (int(size[0]), int(size[1]))
+        self.mat = np.ones((self.size[1], self.size[0]), dtype=np.float32)
+        self.set_border()
+
+    def set_border(self):
+        # Makes the outermost ring of texels a wall.
+        self.mat[[0, -1], :] = 0
+        self.mat[:, [0, -1]] = 0
+
+    def get_bounds(self, medium):
+        """
+        Calculate the rectangle of texels covered by a medium.
+
+        Args:
+            medium (Medium): The medium.
+
+        Returns:
+            tuple: The rectangle (x0, y0, x1, y1), with x1 and y1 exclusive.
+        """
+        return polygon_bounds(medium.get_rotated(), self.size)
+
+    def rasterise(self, mediums):
+        """
+        Rebuilds the whole grid from a list of mediums.
+
+        Args:
+            mediums (list): The walls and mediums in the scene.
+
+        Returns:
+            tuple: The rectangle covering the whole grid.
+        """
+        return self.update(mediums, (0, 0, self.size[0], self.size[1]))
+
+    def update(self, mediums, rect):
+        """
+        Rebuilds the texels inside a rectangle, redrawing only the mediums that overlap it.
+
+        Args:
+            mediums (list): The walls and mediums in the scene.
+            rect (tuple): The rectangle (x0, y0, x1, y1) to rebuild.
+
+        Returns:
+            tuple or None: The rectangle that changed, clipped to the grid, or None if it is empty.
+        """
+        x0, y0 = max(rect[0], 0), max(rect[1], 0)
+        x1, y1 = min(rect[2], self.size[0]), min(rect[3], self.size[1])
+        if x1 <= x0 or y1 <= y0:
+            return None
+        rect = (x0, y0, x1, y1)
+
+        self.mat[y0:y1, x0:x1] = 1.0
+        if len(mediums):
+            # Rotate every medium at once, then draw the ones overlapping the rectangle in order of id
+            store = mediums[0].hitbox.store
+            slots = store.get_slots(mediums)
+            corners = store.get_corners(slots)
+            bounds = polygons_bounds(corners, self.size)
+            overlapping = np.flatnonzero(
+                (bounds[:, 0] < x1)
+                & (bounds[:, 2] > x0)
+                & (bounds[:, 1] < y1)
+                & (bounds[:, 3] > y0)
+            )
+            overlapping = overlapping[np.argsort(store.ids[slots[overlapping]])]
+            for i in overlapping:
+                rasterise_polygon(self.mat, corners[i], store.n[slots[i]], rect)
+        self.set_border()
+        return rect
+
+    def get_region(self, rect) -> np.ndarray:
+        """
+        Copies a rectangle of the grid into a contiguous array, ready to upload.
+
+        Args:
+            rect (tuple): The rectangle (x0, y0, x1, y1).
+
+        Returns:
+            np.ndarray: The (y1 - y0, x1 - x0) float32 material inside the rectangle.
+        """
+        return np.ascontiguousarray(self.mat[rect[1] : rect[3], rect[0] : rect[2]])
@@ -0,0 +1,222 @@
+import time
+from collections import deque
+import numpy as np
+from OpenGL.GL import (
+    glGetQueryObjecti64v,
+    glQueryCounter,
+    GL_QUERY_RESULT,
+    GL_TIMESTAMP,
+)
+from profiler import QueryPool
+
+PACING_MODES = ("uncapped", "fps", "vsync")  # Ways the main loop can be paced
+SPIN_MS = (
+    1.0  # Time spun rather than slept before each deadline, to absorb sleep overshoot
+)
+STEP_BUDGET = 0.75  # Fraction of each frame period that simulation steps may fill
+JITTER_PERCENTILES = (50, 95, 99)  # Percentiles of the pacing jitter that are reported
+
+
+class FramePacer:
+    """
+    Paces the main loop and decides how many simulation steps fit in each frame.
+
+    There are three modes:
+        uncapped: frames run back-to-back without waiting.
+        fps: each frame starts one period after the last. The pacer sleeps until just before the
+             deadline and spins only for the last SPIN_MS, so an idle loop does not hold a core.
+        vsync: the buffer swap waits for the display, so the pacer never waits itself.
+
+    The GPU time of the simulation steps is measured with GL_TIMESTAMP queries (which, unlike
+    GL_TIME_ELAPSED, can overlap the FrameProfiler queries) and read back a few frames later without
+    waiting. Together with the CPU time taken to issue the steps, it gives the cost of one step, and
+    in the fps and vsync modes as many steps are run as fit in STEP_BUDGET of the frame period.
+
+    Attributes:
+        mode (str): One of PACING_MODES.
+        period (float): The target time between frames, in seconds.
+        spin (float): The time spun before each deadline, in seconds.
+        minSteps (int): The fewest simulation steps run each frame.
+        maxSteps (int): The most simulation steps run each frame.
+        last (float or None): The perf_counter time at which the last frame started.
+        deadline (float): The perf_counter time at which the next frame should start.
+        intervals (deque): Rolling times between frame starts, in milliseconds.
+        cpuStep (float or None): Smoothed CPU time to issue one step, in milliseconds.
+        gpuStep (float or None): Smoothed GPU time of one step, in milliseconds.
+        steps (int): The number of steps chosen for the current frame.
+        pool (QueryPool): The timestamp queries, with step timings waiting for GPU results as
+                          (steps, [start query, end query]).
+    """
+
+    def __init__(
+        self, mode="fps", fps=60, spin=SPIN_MS, minSteps=1, maxSteps=64, window=240
+    ):
+        """
+        Initializes the FramePacer object. Needs a current OpenGL context.
+
+        Args:
+            mode (str, optional): One of PACING_MODES. Defaults to "fps".
+            fps (float, optional): The target frame rate, also the assumed refresh rate for vsync
+                                   until frames have been measured. Defaults to 60.
+            spin (float, optional): Milliseconds spun before each deadline. Defaults to SPIN_MS.
+            minSteps (int, optional): The fewest steps run each frame. Defaults to 1.
+            maxSteps (int, optional): The most steps run each frame. Defaults to 64.
+            window (int, optional): The number of frames the jitter is measured over. Defaults to 240.
+        """
+        if mode not in PACING_MODES:
+            raise ValueError(f"Unknown pacing mode: {mode}")
+        self.mode = mode
+        self.period = 1 / fps
+        self.spin = spin / 1000
+        self.minSteps = minSteps
+        self.maxSteps = max(minSteps, maxSteps)
+        self.last = None
+        self.deadline = 0
+        self.intervals = deque(maxlen=window)
+        self.cpuStep = None
+        self.gpuStep = None
+        self.steps = minSteps
+        self.stepStart = 0
+        self.startQuery = None
+        self.pool = QueryPool()
+
+    def tick(self):
+        """
+        Waits until the next frame is due, as set by the mode.
+
+        Returns:
+            float: The milliseconds since the previous tick (0 on the first), as pygame's
+                   Clock.tick would return.
+        """
+        now = time.perf_counter()
+        if self.last is None:
+            self.last = self.deadline = now
+            return 0
+        if self.mode == "fps":
+            # Never try to catch up on missed frames, or a slow frame would cause a burst
+            self.deadline = max(self.deadline + self.period, now)
+            self.wait(self.deadline)
+            now = time.perf_counter()
+        elapsed = now - self.last
+        self.last = now
+        self.intervals.append(elapsed * 1000)
+        self.collect()
+        return elapsed * 1000
+
+    def wait(self, deadline):
+        # Sleeps until just before the deadline, then spins for the rest to hit it precisely
+        remaining = deadline - time.perf_counter()
+        if remaining > self.spin:
+            time.sleep(remaining - self.spin)
+        while time.perf_counter() < deadline:
+            pass
+
+    def get_period(self):
+        # Returns the frame period in seconds, measured from the frames themselves under vsync
+        if self.mode == "vsync" and len(self.intervals) >= 10:
+            return (
+                float(np.median(np.fromiter(self.intervals, dtype=np.float64))) / 1000
+            )
+        return self.period
+
+    def get_steps(self):
+        """
+        Chooses how many simulation steps to run in the current frame.
+
+        Returns:
+            int: minSteps when uncapped or before a step has been timed, otherwise as many steps
+                 as fit in STEP_BUDGET of the frame period, between minSteps and maxSteps.
+        """
+        cost = max(self.cpuStep or 0, self.gpuStep or 0)
+        if self.mode == "uncapped" or cost <= 0:
+            self.steps = self.minSteps
+        else:
+            fit = int(self.get_period() * 1000 * STEP_BUDGET / cost)
+            self.steps = min(max(fit, self.minSteps), self.maxSteps)
+        return self.steps
+
+    def begin_steps(self):
+        # Marks the start of the simulation steps of the current frame
+        self.stepStart = time.perf_counter()
+        self.startQuery = self.pool.get()
+        glQueryCounter(self.startQuery, GL_TIMESTAMP)
+
+    def end_steps(self, steps):
+        """
+        Marks the end of the simulation steps of the current frame.
+
+        Args:
+            steps (int): The number of steps run since begin_steps.
+        """
+        cpu = (time.perf_counter() - self.stepStart) * 1000 / steps
+        self.cpuStep = self.smooth(self.cpuStep, cpu)
+        endQuery = self.pool.get()
+        glQueryCounter(endQuery, GL_TIMESTAMP)
+        self.pool.submit(steps, [self.startQuery, endQuery])
+        self.startQuery = None
+
+    def smooth(self, average, value):
+        # Returns an exponential moving average that follows changes within about ten frames
+        return value if average is None else average + 0.1 * (value - average)
+
+    def collect(self):
+        # Reads the GPU step timings that have become available, oldest first, without waiting
+        self.pool.collect(self.read)
+
+    def read(self, steps, queries):
+        # Adds the GPU time per step of one frame's timestamps to the smoothed cost
+        result = np.zeros(1, dtype=np.int64)
+        times = []
+        for query in queries:
+            glGetQueryObjecti64v(query, GL_QUERY_RESULT, result)
+            times.append(int(result[0]))
+        gpu = (times[1] - times[0]) / 1e6 / steps
+        self.gpuStep = self.smooth(self.gpuStep, gpu)
+
+    def get_jitter(self):
+        """
+        Measures how far the time between frames strays from the frame period.
+
+        Returns:
+            np.ndarray or None: The JITTER_PERCENTILES of the absolute difference between each
+                                interval and the period, in milliseconds, or None before any frames.
+        """
+        if not self.intervals:
+            return None
+        intervals = np.fromiter(self.intervals, dtype=np.float64)
+        if self.mode == "uncapped":
+            reference = np.median(
+                intervals
+            )  # There is no period, so measure the spread
+        else:
+            reference = self.get_period() * 1000
+        return np.percentile(np.abs(intervals - reference), JITTER_PERCENTILES)
+
+    def get_summary(self):
+        """
+        Summarises the pacing as lines of text for the overlay.
+
+        Returns:
+            list: The mode and frame rate, the jitter percentiles, and the steps per frame with
+                  the cost of each step.
+        """
+        if self.mode == "uncapped":
+            rate = 1000 / np.mean(self.intervals) if self.intervals else 0
+            lines = [f"pacing uncapped  {rate:.0f} fps"]
+        else:
+            lines = [f"pacing {self.mode}  {1 / self.get_period():.0f} fps target"]
+        jitter = self.get_jitter()
+        if jitter is not None:
+            label = "/".join(f"p{p}" for p in JITTER_PERCENTILES)
+            lines.append(f"jitter {label}  " + "/".join(f"{v:.2f}" for v in jitter))
+        line = f"steps/frame {self.steps}"
+        if self.cpuStep is not None:
+            line += f"  cpu {self.cpuStep:.3f}"
+        if self.gpuStep is not None:
+            line += f"  gpu {self.gpuStep:.3f} ms/step"
+        lines.append(line)
+        return lines
+
+    def close(self):
+        # Releases the timer queries
+        self.pool.close()
@@ -0,0 +1,306 @@
+import json
+import time
+from collections import deque
+from contextlib import contextmanager
+import numpy as np
+from OpenGL.GL import (
+    glBeginQuery,
+    glDeleteQueries,
+    glEndQuery,
+    glGenQueries,
+    glGetQueryObjectiv,
+    glGetQueryObjectuiv,
+    GL_QUERY_RESULT,
+    GL_QUERY_RESULT_AVAILABLE,
+    GL_TIME_ELAPSED,
+)
+
+PERCENTILES = (50, 95, 99)  # Percentiles shown for every phase
+
+
+class QueryPool:
+    """
+    Recycles OpenGL query objects, and reads back groups of queries without waiting for the GPU.
+
+    Each group is a list of queries issued together, with a payload describing them. Query results
+    become available in the order the queries were issued, so collecting stops at the first group
+    that is not ready, leaving it and every later group for the next collect.
+
+    Attributes:
+        free (list): Query objects ready for reuse.
+        pending (deque): Groups waiting for results, as (payload, queries).
+    """
+
+    def __init__(self):
+        # Initializes an empty QueryPool.
+        self.free = []
+        self.pending = deque()
+
+    def get(self) -> int:
+        # Returns an unused query object, creating one if none are free.
+        return self.free.pop() if self.free else int(glGenQueries(1)[0])
+
+    def submit(self, payload, queries):
+        """
+        Queues a group of issued queries to be read once all of their results are available.
+
+        Args:
+            payload: A value passed back with the queries, such as the record they time.
+            queries (list): The query objects of the group.
+        """
+        self.pending.append((payload, queries))
+
+    def collect(self, read) -> int:
+        """
+        Passes every group whose results are available to a callback, oldest first, then recycles
+        its queries.
+
+        Args:
+            read (callable): Called as read(payload, queries) for each finished group.
+
+        Returns:
+            int: The number of groups read.
+        """
+        count = 0
+        while self.pending:
+            payload, queries = self.pending[0]
+            for query in queries:
+                if not glGetQueryObjectiv(query, GL_QUERY_RESULT_AVAILABLE):
+                    return count
+            self.pending.popleft()
+            read(payload, queries)
+            self.free += queries
+            count += 1
+        return count
+
+    def close(self):
+        # Deletes every query object, free or pending.
+        queries = self.free + [q for _, group in self.pending for q in group]
+        if queries:
+            glDeleteQueries(len(queries), queries)
+        self.free = []
+        self.pending.clear()
+
+
+class GLCallCounter:
+    """
+    Counts calls to the OpenGL functions used by a set of modules.
+
+    Every callable whose name starts with "gl" in each module is replaced with a wrapper that counts
+    the call, so nothing is slowed down unless a counter is installed. Functions called from other
+    modules (such as the timer queries of FrameProfiler) are not counted.
+
+    Attributes:
+        count (int): The number of calls since the last reset.
+        originals (list): The (module, name, function) of every function that was replaced.
+    """
+
+    def __init__(self):
+        # Initializes a GLCallCounter that has not been installed yet.
+        self.count = 0
+        self.originals = []
+
+    def install(self, modules):
+        """
+        Wraps the OpenGL functions of the given modules.
+
+        Args:
+            modules (list): The modules whose OpenGL functions are counted.
+        """
+        for module in modules:
+            for name, function in list(vars(module).items()):
+                if name.startswith("gl") and callable(function):
+                    self.originals.append((module, name, function))
+                    setattr(module, name, self.wrap(function))
+
+    def wrap(self, function):
+        # Returns a wrapper around an OpenGL function that counts each call.
+        def counted(*args, **kwargs):
+            self.count += 1
+            return function(*args, **kwargs)
+
+        return counted
+
+    def uninstall(self):
+        # Restores every function that was wrapped.
+        for module, name, function in self.originals:
+            setattr(module, name, function)
+        self.originals = []
+
+    def reset(self):
+        """
+        Starts counting a new frame.
+
+        Returns:
+            int: The number of calls counted since the last reset.
+        """
+        count = self.count
+        self.count = 0
+        return count
+
+
+class FrameProfiler:
+    """
+    Times each phase of every frame on the CPU and, with GL_TIME_ELAPSED queries, on the GPU.
+
+    A frame is opened with begin_frame, split into phases with `with profiler.phase(name):`, and
+    closed with end_frame. GPU results arrive a few frames later, so queries are never waited on:
+    each end_frame collects the results that are ready, and a frame is finished once all of its
+    queries have been read. Finished frames are added to rolling windows used for the percentiles,
+    and written as one JSON object per line if a log file is given.
+
+    Attributes:
+        window (int): The number of finished frames the percentiles are taken over.
+        gpu (bool): Whether GPU timer queries are issued.
+        calls (GLCallCounter or None): Counter of OpenGL calls per frame, if installed.
+        frame (int): The index of the current frame.
+        record (dict or None): The timings of the current frame.
+        queries (list): The (phase, query) of each phase timed in the current frame.
+        pool (QueryPool): The timer queries, with frames waiting for GPU results as
+                          ((record, phases), queries).
+        cpu (dict): Rolling CPU times of each phase, in milliseconds.
+        gpuTimes (dict): Rolling GPU times of each phase, in milliseconds.
+        frameTimes (deque): Rolling CPU time of whole frames, in milliseconds.
+        callCounts (deque): Rolling number of OpenGL calls per frame.
+        log (file or None): The JSON-lines file finished frames are written to.
+    """
+
+    def __init__(self, window=240, gpu=True, path=None, calls=None):
+        """
+        Initializes the FrameProfiler object.
+
+        Args:
+            window (int, optional): The number of frames the percentiles cover. Defaults to 240.
+            gpu (bool, optional): Whether to time the GPU. Needs a current context. Defaults to True.
+            path (str, optional): A JSON-lines file to stream frame records to. Defaults to None.
+            calls (GLCallCounter, optional): An installed counter of OpenGL calls. Defaults to None.
+        """
+        self.window = window
+        self.gpu = gpu
+        self.calls = calls
+        self.frame = 0
+        self.record = None
+        self.frameStart = 0
+        self.queries = []
+        self.pool = QueryPool()
+        self.cpu = {}
+        self.gpuTimes = {}
+        self.frameTimes = deque(maxlen=window)
+        self.callCounts = deque(maxlen=window)
+        self.log = open(path, "w") if path else None
+
+    def begin_frame(self):
+        # Starts timing a new frame.
+        self.record = {"frame": self.frame, "cpu": {}, "gpu": {}}
+        self.queries = []
+        self.frameStart = time.perf_counter()
+        if self.calls is not None:
+            self.calls.reset()
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Times the work done inside the with block as one phase of the current frame. Phases must
+        not be nested, since only one GL_TIME_ELAPSED query can be active at a time.
+
+        Args:
+            name (str): The name of the phase.
+        """
+        if self.record is None:
+            yield  # Outside a frame, so nothing is recorded
+            return
+        query = None
+        if self.gpu:
+            query = self.pool.get()
+            glBeginQuery(GL_TIME_ELAPSED, query)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            cpu = self.record["cpu"]
+            cpu[name] = cpu.get(name, 0) + elapsed
+            if query is not None:
+                glEndQuery(GL_TIME_ELAPSED)
+                self.queries.append((name, query))
+
+    def end_frame(self):
+        # Finishes the current frame, then collects any GPU results that have become available.
+        if self.record is None:
+            return
+        self.record["frame_ms"] = (time.perf_counter() - self.frameStart) * 1000
+        if self.calls is not None:
+            self.record["gl_calls"] = self.calls.reset()
+        phases = [name for name, _ in self.queries]
+        queries = [query for _, query in self.queries]
+        self.pool.submit((self.record, phases), queries)
+        self.record = None
+        self.frame += 1
+        self.collect()
+
+    def collect(self):
+        # Reads the GPU results of the oldest frames, in order, without waiting for the GPU.
+        self.pool.collect(self.read)
+
+    def read(self, payload, queries):
+        # Adds the GPU time of each phase of a frame whose queries are all available.
+        record, phases = payload
+        gpu = record["gpu"]
+        for name, query in zip(phases, queries):
+            # 32 bits of nanoseconds covers phases of up to 4 seconds
+            nanoseconds = glGetQueryObjectuiv(query, GL_QUERY_RESULT)
+            gpu[name] = gpu.get(name, 0) + int(nanoseconds) / 1e6
+        self.finish(record)
+
+    def finish(self, record):
+        # Adds a frame whose results are all in to the rolling windows and the log.
+        for times, source in (
+            (self.cpu, record["cpu"]),
+            (self.gpuTimes, record["gpu"]),
+        ):
+            for name, ms in source.items():
+                times.setdefault(name, deque(maxlen=self.window)).append(ms)
+        self.frameTimes.append(record["frame_ms"])
+        if "gl_calls" in record:
+            self.callCounts.append(record["gl_calls"])
+        if self.log is not None:
+            self.log.write(json.dumps(record) + "\n")
+
+    def get_percentiles(self, times):
+        # Returns the PERCENTILES of a rolling window, or None if it is empty.
+        if not times:
+            return None
+        return np.percentile(np.fromiter(times, dtype=np.float64), PERCENTILES)
+
+    def get_summary(self):
+        """
+        Summarises the rolling windows as lines of text for the overlay.
+
+        Returns:
+            list: One line per phase, with its CPU and GPU percentiles in milliseconds, followed by
+                  the frame time and the OpenGL calls per frame.
+        """
+        label = "/".join(f"p{p}" for p in PERCENTILES)
+        lines = [f"phase  cpu {label}  gpu {label} (ms)"]
+        for name, times in self.cpu.items():
+            cpu = self.get_percentiles(times)
+            gpu = self.get_percentiles(self.gpuTimes.get(name, ()))
+            line = f"{name}  " + "/".join(f"{v:.2f}" for v in cpu)
+            if gpu is not None:
+                line += "  " + "/".join(f"{v:.2f}" for v in gpu)
+            lines.append(line)
+        frame = self.get_percentiles(self.frameTimes)
+        if frame is not None:
+            lines.append("frame  " + "/".join(f"{v:.2f}" for v in frame))
+        calls = self.get_percentiles(self.callCounts)
+        if calls is not None:
+            lines.append("gl calls  " + "/".join(f"{v:.0f}" for v in calls))
+        return lines
+
+    def close(self):
+        # Releases the timer queries and closes the log file.
+        if self.gpu:
+            self.pool.close()
+        if self.log is not None:
+            self.log.close()
+            self.log = None
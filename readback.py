@@ -0,0 +1,175 @@
+import ctypes
+from collections import deque
+import numpy as np
+from OpenGL.GL import (
+    glBindBuffer,
+    glClientWaitSync,
+    glCreateBuffers,
+    glDeleteBuffers,
+    glDeleteSync,
+    glFenceSync,
+    glGetTextureImage,
+    glMapNamedBufferRange,
+    glNamedBufferStorage,
+    glUnmapNamedBuffer,
+    GL_ALREADY_SIGNALED,
+    GL_CONDITION_SATISFIED,
+    GL_FLOAT,
+    GL_MAP_COHERENT_BIT,
+    GL_MAP_PERSISTENT_BIT,
+    GL_MAP_READ_BIT,
+    GL_PIXEL_PACK_BUFFER,
+    GL_RED,
+    GL_RG,
+    GL_RGB,
+    GL_RGBA,
+    GL_SYNC_FLUSH_COMMANDS_BIT,
+    GL_SYNC_GPU_COMMANDS_COMPLETE,
+    GL_UNSIGNED_BYTE,
+)
+
+PIXEL_FORMATS = {
+    1: GL_RED,
+    2: GL_RG,
+    3: GL_RGB,
+    4: GL_RGBA,
+}  # Read format by channel count
+PIXEL_TYPES = {
+    np.dtype(np.float32): GL_FLOAT,
+    np.dtype(np.uint8): GL_UNSIGNED_BYTE,
+}  # Read type by NumPy dtype
+WAIT_TIMEOUT = (
+    1_000_000_000  # Longest wait for a readback when draining, in nanoseconds
+)
+
+
+class AsyncReadback:
+    """
+    Reads textures back from the GPU without stalling it, through a ring of pixel buffer objects.
+
+    request copies a texture into the next free buffer and places a fence after the copy, then
+    returns at once. A few frames later, once the fence has signalled, collect hands the buffer to a
+    callback as a read-only NumPy view of its persistently mapped memory, so nothing is copied on
+    the CPU unless the consumer copies it. A view is only valid during the callback, since the buffer
+    is reused straight after.
+
+    If every buffer is still waiting when a readback is requested, the request is dropped rather than
+    waiting for the GPU, and counted in `dropped`.
+
+    Attributes:
+        width (int): The width of the textures read, in texels.
+        height (int): The height of the textures read, in texels.
+        channels (int): The number of channels read from each texel.
+        dtype (np.dtype): The type each channel is read as.
+        nbytes (int): The size of each buffer, in bytes.
+        buffers (list): The pixel buffer objects.
+        views (list): The mapped NumPy view of each buffer, of shape (height, width, channels).
+        free (deque): Indices of the buffers ready for a request.
+        pending (deque): Requests waiting for the GPU, as (buffer index, fence, tag).
+        dropped (int): The number of requests dropped because every buffer was busy.
+    """
+
+    def __init__(self, width, height, channels=2, dtype=np.float32, depth=3):
+        """
+        Initializes the AsyncReadback object, allocating and mapping its buffers. Needs a current
+        OpenGL 4.5 context.
+
+        Args:
+            width (int): The width of the textures read, in texels.
+            height (int): The height of the textures read, in texels.
+            channels (int, optional): The channels read from each texel (1 to 4). Defaults to 2.
+            dtype (np.dtype, optional): np.float32 or np.uint8. Defaults to np.float32.
+            depth (int, optional): The number of buffers in the ring. Defaults to 3, so readbacks
+                                   can be requested every frame and collected two frames later.
+        """
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.dtype = np.dtype(dtype)
+        self.format = PIXEL_FORMATS[channels]
+        self.type = PIXEL_TYPES[self.dtype]
+        self.nbytes = width * height * channels * self.dtype.itemsize
+        self.dropped = 0
+
+        # Persistently mapped buffers, so each view is made once and stays valid
+        buffers = np.empty(depth, dtype=np.uint32)
+        glCreateBuffers(depth, buffers)
+        self.buffers = [int(buffer) for buffer in buffers]
+        flags = GL_MAP_READ_BIT | GL_MAP_PERSISTENT_BIT | GL_MAP_COHERENT_BIT
+        self.views = []
+        for buffer in self.buffers:
+            glNamedBufferStorage(buffer, self.nbytes, None, flags)
+            address = glMapNamedBufferRange(buffer, 0, self.nbytes, flags)
+            memory = (ctypes.c_ubyte * self.nbytes).from_address(address)
+            view = np.frombuffer(memory, dtype=self.dtype).reshape(
+                height, width, channels
+            )
+            view.flags.writeable = False
+            self.views.append(view)
+        self.free = deque(range(depth))
+        self.pending = deque()
+
+    def request(self, texture, tag=None) -> bool:
+        """
+        Starts reading a texture back, without waiting for the GPU.
+
+        Args:
+            texture (int): The texture to read. Only the first `channels` channels are read.
+            tag (optional): A value passed back with the result, such as the step it was taken at.
+
+        Returns:
+            bool: True if the readback was queued, False if it was dropped because every buffer was
+                  still in use.
+        """
+        if not self.free:
+            self.dropped += 1
+            return False
+        index = self.free.popleft()
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, self.buffers[index])
+        glGetTextureImage(
+            texture, 0, self.format, self.type, self.nbytes, ctypes.c_void_p(0)
+        )
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        fence = glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+        self.pending.append((index, fence, tag))
+        return True
+
+    def collect(self, callback, wait=False) -> int:
+        """
+        Passes every finished readback to a callback, oldest first.
+
+        Args:
+            callback (callable): Called as callback(tag, view) for each finished readback. The view
+                                 is only valid until the callback returns.
+            wait (bool, optional): Whether to wait for readbacks still on the GPU. Defaults to False.
+
+        Returns:
+            int: The number of readbacks passed to the callback.
+        """
+        count = 0
+        while self.pending:
+            index, fence, tag = self.pending[0]
+            timeout = WAIT_TIMEOUT if wait else 0
+            status = glClientWaitSync(fence, GL_SYNC_FLUSH_COMMANDS_BIT, timeout)
+            if status not in (GL_ALREADY_SIGNALED, GL_CONDITION_SATISFIED):
+                break  # Fences signal in order, so the later readbacks are still running too
+            self.pending.popleft()
+            glDeleteSync(fence)
+            try:
+                callback(tag, self.views[index])
+            finally:
+                self.free.append(index)
+            count += 1
+        return count
+
+    def close(self):
+        # Releases the fences and unmaps and deletes the buffers
+        for _, fence, _ in self.pending:
+            glDeleteSync(fence)
+        self.pending.clear()
+        self.views = []
+        for buffer in self.buffers:
+            glUnmapNamedBuffer(buffer)
+        glDeleteBuffers(len(self.buffers), self.buffers)
+        self.buffers = []
+        self.free.clear()
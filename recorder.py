@@ -0,0 +1,185 @@
+import os
+import queue
+import threading
+from fractions import Fraction
+import numpy as np
+import pygame
+
+RECORD_FORMATS = (
+    "png",
+    "y4m",
+    "raw",
+)  # Image sequence, YUV4MPEG2 video, or raw RGBA frames
+STREAM_FORMATS = ("y4m", "raw")  # Formats written to a single file, in frame order
+# BT.601 full range RGB to YCbCr, as rows of Y, Cb and Cr
+YUV_MATRIX = np.array(
+    [
+        [0.299, 0.587, 0.114],
+        [-0.168736, -0.331264, 0.5],
+        [0.5, -0.418688, -0.081312],
+    ],
+    dtype=np.float32,
+)
+YUV_OFFSET = np.array([0, 128, 128], dtype=np.float32)
+
+
+class FrameRecorder:
+    """
+    Writes frames to disk on background threads, so encoding never holds up the main loop.
+
+    Frames are copied into one of a fixed pool of arrays and put on a bounded queue serviced by
+    worker threads. When every array is in use the recorder is busy: ready returns False so the
+    caller can skip reading the frame back at all, and a frame submitted anyway is dropped rather
+    than waited for. Dropped frames are counted, and frame numbers keep counting through them.
+
+    Image sequences (png) are encoded by several workers at once, one file per frame. Video streams
+    (y4m, raw) go through a single worker so the frames are written in order.
+
+    Attributes:
+        path (str): The directory for image sequences, or the file for video streams.
+        format (str): One of RECORD_FORMATS.
+        size (tuple): The (width, height) of each frame.
+        every (int): Only every Nth frame offered to the recorder is kept.
+        fps (float): The rate frames are offered at. The y4m header gets fps / every.
+        offered (int): The number of frames offered, counting those skipped by `every`.
+        written (int): The number of frames written.
+        dropped (int): The number of frames dropped because the recorder was busy.
+        pool (queue.Queue): Arrays free to hold the next frame.
+        frames (queue.Queue): Frames waiting for a worker, as (number, array), or None to stop.
+        file (file or None): The stream written to for video formats.
+        workers (list): The worker threads.
+    """
+
+    def __init__(self, path, size, format="png", every=1, fps=60, workers=2, depth=8):
+        """
+        Initializes the FrameRecorder object and starts its worker threads.
+
+        Args:
+            path (str): The directory for image sequences, or the file for video streams.
+            size (tuple): The (width, height) of each frame.
+            format (str, optional): One of RECORD_FORMATS. Defaults to "png".
+            every (int, optional): Keep every Nth frame. Defaults to 1.
+            fps (float, optional): The rate frames are offered at, divided by `every` for the y4m
+                                   header. Defaults to 60.
+            workers (int, optional): Encoding threads for image sequences. Defaults to 2.
+            depth (int, optional): The most frames held in memory at once. Defaults to 8.
+        """
+        if format not in RECORD_FORMATS:
+            raise ValueError(f"Unknown record format: {format}")
+        self.path = path
+        self.format = format
+        self.size = (int(size[0]), int(size[1]))
+        self.every = max(1, every)
+        self.fps = fps
+        self.offered = 0
+        self.written = 0
+        self.dropped = 0
+        self.lock = threading.Lock()
+
+        width, height = self.size
+        self.pool = queue.Queue()
+        for _ in range(depth):
+            self.pool.put(np.empty((height, width, 4), dtype=np.uint8))
+        self.frames = queue.Queue()
+
+        self.file = None
+        if format in STREAM_FORMATS:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.file = open(path, "wb")
+            if format == "y4m":
+                # The exact rate of the kept frames as a fraction, and the full range of the colours
+                rate = Fraction(fps).limit_denominator(1001) / self.every
+                header = (
+                    f"YUV4MPEG2 W{width} H{height} F{rate.numerator}:{rate.denominator} "
+                    "Ip A1:1 C444 XCOLORRANGE=FULL\n"
+                )
+                self.file.write(header.encode())
+            workers = 1  # Streams must be written in order
+        else:
+            os.makedirs(path, exist_ok=True)
+        self.workers = [
+            threading.Thread(target=self.work, daemon=True) for _ in range(workers)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def want(self):
+        """
+        Counts a frame as offered, and says whether it should be captured.
+
+        Returns:
+            int or None: The number of the frame in the recording if it is one of every `every`
+                         frames and the recorder is not busy, otherwise None.
+        """
+        self.offered += 1
+        if (self.offered - 1) % self.every:
+            return None
+        if not self.ready():
+            self.dropped += 1
+            return None
+        return (self.offered - 1) // self.every
+
+    def ready(self) -> bool:
+        # Returns whether there is an array free for another frame
+        return not self.pool.empty()
+
+    def submit(self, number, pixels) -> bool:
+        """
+        Copies a frame and queues it for writing, without waiting.
+
+        Args:
+            number (int): The number of the frame, from want.
+            pixels (np.ndarray): A (height, width, 4) uint8 RGBA frame, with its rows bottom-up as
+                                 OpenGL reads them.
+
+        Returns:
+            bool: True if the frame was queued, False if it was dropped because the recorder was busy.
+        """
+        try:
+            frame = self.pool.get_nowait()
+        except queue.Empty:
+            self.dropped += 1
+            return False
+        np.copyto(frame, pixels[::-1])  # Flip to top-down rows
+        self.frames.put((number, frame))
+        return True
+
+    def work(self):
+        # Writes queued frames until told to stop
+        while True:
+            item = self.frames.get()
+            if item is None:
+                return
+            number, frame = item
+            try:
+                self.write(number, frame)
+                with self.lock:
+                    self.written += 1
+            finally:
+                self.pool.put(frame)
+
+    def write(self, number, frame):
+        # Encodes one top-down RGBA frame in the recorder's format
+        if self.format == "png":
+            surface = pygame.image.frombuffer(frame.tobytes(), self.size, "RGBA")
+            pygame.image.save(
+                surface, os.path.join(self.path, f"frame_{number:06d}.png")
+            )
+        elif self.format == "y4m":
+            yuv = frame[..., :3].astype(np.float32) @ YUV_MATRIX.T + YUV_OFFSET
+            planes = np.clip(np.rint(yuv), 0, 255).astype(np.uint8).transpose(2, 0, 1)
+            self.file.write(b"FRAME\n")
+            self.file.write(np.ascontiguousarray(planes).tobytes())
+        else:
+            self.file.write(frame.tobytes())
+
+    def close(self):
+        # Waits for every queued frame to be written, then stops the workers and closes the stream
+        for _ in self.workers:
+            self.frames.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+        if self.file is not None:
+            self.file.close()
+            self.file = None
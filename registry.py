@@ -0,0 +1,100 @@
+class Registry:
+    """
+    A central id -> entity registry for the sources and mediums in a scene.
+
+    Every entity is stored by its id, and also in a dense list for its kind ("s" for sources and
+    "w" for walls and mediums) that is used for drawing and uploading. Removing an entity moves
+    the last entity of the same kind into its slot, so lookups, removals and restores are all
+    constant time, and the dense lists never hold gaps.
+
+    Attributes:
+        entities (dict): Maps each id to its entity.
+        kinds (dict): Maps each id to the kind of its entity.
+        slots (dict): Maps each id to its index in the dense list for its kind.
+        lists (dict): The dense list of entities for each kind.
+        nextId (int): The id given to the next new entity.
+    """
+
+    KINDS = ("s", "w")
+
+    def __init__(self):
+        # Initializes an empty Registry object.
+        self.entities = {}
+        self.kinds = {}
+        self.slots = {}
+        self.lists = {kind: [] for kind in self.KINDS}
+        self.nextId = 0
+
+    def new_id(self):
+        """
+        Reserves an id that no entity has used before.
+
+        Returns:
+            int: The new id.
+        """
+        id = self.nextId
+        self.nextId += 1
+        return id
+
+    def add(self, entity, kind):
+        """
+        Adds an entity under its own id, which may be an id that was used before (a restore).
+
+        Args:
+            entity (Source or Medium): The entity to add.
+            kind (str): "s" for a source, or "w" for a wall or medium.
+        """
+        id = entity.get_id()
+        if id in self.entities:
+            raise KeyError(f"An entity with id {id} is already registered")
+        entities = self.lists[kind]
+        self.entities[id] = entity
+        self.kinds[id] = kind
+        self.slots[id] = len(entities)
+        entities.append(entity)
+        self.nextId = max(self.nextId, id + 1)
+
+    def remove(self, id):
+        """
+        Removes an entity by swapping the last entity of the same kind into its slot.
+
+        Args:
+            id (int): The id of the entity.
+
+        Returns:
+            tuple: The (entity, index, moved) of the removal, where index is the slot the entity
+                   held and moved is the entity now in that slot (None if it was the last one).
+        """
+        entity = self.entities.pop(id)
+        kind = self.kinds.pop(id)
+        index = self.slots.pop(id)
+        entities = self.lists[kind]
+        last = entities.pop()
+        moved = None
+        if last is not entity:
+            entities[index] = last
+            self.slots[last.get_id()] = index
+            moved = last
+        return entity, index, moved
+
+    def get(self, id):
+        # Returns the entity with the given id, or None if there is none.
+        return self.entities.get(id)
+
+    def get_kind(self, id):
+        # Returns the kind of the entity with the given id, or None if there is none.
+        return self.kinds.get(id)
+
+    def get_index(self, id):
+        # Returns the index of the entity with the given id in the dense list for its kind.
+        return self.slots[id]
+
+    def get_list(self, kind):
+        # Returns the dense list of entities of the given kind.
+        return self.lists[kind]
+
+    def __contains__(self, id):
+        return id in self.entities
+
+    def __len__(self):
+        return len(self.entities)
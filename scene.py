@@ -0,0 +1,111 @@
+import json
+from sim_classes import clamp_refractive_index
+
+# The scene loaded when no scene file is given, matching the objects App.on_execute starts with
+DEFAULT_SCENE = {
+    "size": [1024, 1024],  # Size of the simulation grid (width, height)
+    "damping": 1.0,  # Global damping factor
+    "sponge_width": 16,  # Width of the absorbing layer at the edge of the grid, in texels
+    "sponge_strength": 0.3,  # Absorption at the outer edge of the layer
+    "reflective": False,  # Whether walls reflect waves
+    "sources": [
+        {
+            "pos": [512, 512],
+            "frequency": 10,
+            "amplitude": 1,
+            "phase": 0,
+        },  # Center source
+        {
+            "pos": [562, 562],
+            "frequency": 10,
+            "amplitude": 1,
+            "phase": 0,
+        },  # Offset source
+    ],
+    "mediums": [
+        {
+            "pos": [250, 550],
+            "size": [300, 10],
+            "rotation": 180,
+            "refractive_index": 0,
+        },  # Static wall
+    ],
+}
+
+
+def load_scene(path=None):
+    """
+    Loads a scene description from a JSON file.
+
+    The file holds the grid size, damping, absorbing edge layer and wall behaviour, plus a list of sources
+    (pos, frequency, amplitude and an optional phase) and a list of mediums (pos, size, rotation, refractive_index).
+    Any missing setting falls back to DEFAULT_SCENE. Refractive indices are wave-speed factors, and are
+    clamped to between 0 (a wall) and 1 (free space) so the simulation stays stable.
+
+    Args:
+        path (str, optional): The path of the scene file. Defaults to None, returning DEFAULT_SCENE.
+
+    Returns:
+        dict: The scene description.
+    """
+    scene = json.loads(json.dumps(DEFAULT_SCENE))  # Deep copy of the default scene
+    if path is None:
+        return scene
+
+    with open(path, "r") as file:
+        scene.update(json.load(file))
+    for med in scene["mediums"]:
+        med["refractive_index"] = clamp_refractive_index(med["refractive_index"])
+    return scene
+
+
+def save_scene(
+    path,
+    size,
+    damping,
+    reflective,
+    sources,
+    mediums,
+    spongeWidth=DEFAULT_SCENE["sponge_width"],
+    spongeStrength=DEFAULT_SCENE["sponge_strength"],
+):
+    """
+    Saves a scene description to a JSON file that load_scene can read back.
+
+    Args:
+        path (str): The path of the scene file.
+        size (tuple): Size of the simulation grid (width, height).
+        damping (float): Global damping factor.
+        reflective (bool): Whether walls reflect waves.
+        sources (list): The sources in the scene.
+        mediums (list): The walls and mediums in the scene.
+        spongeWidth (float, optional): Width of the absorbing edge layer in texels.
+        spongeStrength (float, optional): Absorption at the outer edge of the layer.
+    """
+    scene = {
+        "size": list(size),
+        "damping": damping,
+        "sponge_width": spongeWidth,
+        "sponge_strength": spongeStrength,
+        "reflective": reflective,
+        "sources": [
+            {
+                "pos": list(source.hitbox.get_pos()),
+                "frequency": source.get_freq(),
+                "amplitude": source.get_amp(),
+                "phase": source.get_phase(),
+            }
+            for source in sources
+        ],
+        "mediums": [
+            {
+                "pos": list(med.hitbox.get_pos()),
+                "size": list(med.hitbox.get_size()),
+                "rotation": med.get_rot(),
+                "refractive_index": med.get_refractive_index(),
+            }
+            for med in mediums
+        ],
+    }
+    with open(path, "w") as file:
+        json.dump(scene, file, indent=4)
@@ -0,0 +1,178 @@
+import hashlib
+import os
+import numpy as np
+from OpenGL.GL import (
+    glGetIntegerv,
+    glGetProgramBinary,
+    glGetProgramiv,
+    glGetString,
+    glProgramBinary,
+    GL_LINK_STATUS,
+    GL_NUM_PROGRAM_BINARY_FORMATS,
+    GL_PROGRAM_BINARY_LENGTH,
+    GL_RENDERER,
+    GL_VENDOR,
+    GL_VERSION,
+)
+from OpenGL.error import GLError
+from OpenGL.GL.KHR.parallel_shader_compile import glMaxShaderCompilerThreadsKHR
+from files import write_atomic
+
+CACHE_VERSION = 1  # Bumped whenever the layout of the cache files changes
+
+
+def default_cache_dir() -> str:
+    """
+    Returns the directory linked programs are cached in, under XDG_CACHE_HOME (or ~/.cache).
+
+    Returns:
+        str: The cache directory. It is created when the first program is saved.
+    """
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(base, "wave-sim", "programs")
+
+
+def set_parallel_compile() -> bool:
+    """
+    Lets the driver compile and link shaders on background threads (KHR_parallel_shader_compile),
+    so programs that are all started before any is used can be built at the same time. Must be
+    called with a current OpenGL context.
+
+    Returns:
+        bool: True if the driver supports parallel compilation.
+    """
+    if not bool(glMaxShaderCompilerThreadsKHR):
+        return False
+    try:
+        glMaxShaderCompilerThreadsKHR(0xFFFFFFFF)  # As many threads as the driver likes
+    except GLError:
+        return False
+    return True
+
+
+class ProgramCache:
+    """
+    An on-disk cache of linked shader program binaries, so startup can skip compiling and linking.
+
+    Each program is stored under a hash of its shader sources and the OpenGL vendor, renderer and
+    version strings, so editing a shader or changing driver gives a new key rather than loading a
+    stale binary. A binary that the driver still rejects is deleted, and the caller compiles the
+    program from source instead.
+
+    Attributes:
+        directory (str): The directory the binaries are stored in.
+        driver (bytes or None): The driver strings, read from the context on first use.
+        supported (bool or None): Whether the driver has any program binary formats.
+    """
+
+    def __init__(self, directory=None):
+        """
+        Initializes the ProgramCache object.
+
+        Args:
+            directory (str, optional): The directory the binaries are stored in. Defaults to
+                                       default_cache_dir().
+        """
+        self.directory = directory or default_cache_dir()
+        self.driver = None
+        self.supported = None
+
+    def is_supported(self) -> bool:
+        # Returns whether the current context can save and load program binaries.
+        if self.supported is None:
+            self.supported = glGetIntegerv(GL_NUM_PROGRAM_BINARY_FORMATS) > 0
+        return self.supported
+
+    def get_key(self, sources) -> str:
+        """
+        Hashes the sources of a program together with the driver it is built by.
+
+        Args:
+            sources (list): The source text of each shader in the program, in a fixed order.
+
+        Returns:
+            str: The hex digest used as the name of the cache file.
+        """
+        if self.driver is None:
+            self.driver = b"\0".join(
+                glGetString(name) or b""
+                for name in (GL_VENDOR, GL_RENDERER, GL_VERSION)
+            )
+        digest = hashlib.sha256(b"%d\0" % CACHE_VERSION + self.driver)
+        for source in sources:
+            digest.update(b"\0" + source.encode())
+        return digest.hexdigest()
+
+    def get_path(self, key) -> str:
+        # Returns the path of the cache file for a key.
+        return os.path.join(self.directory, key + ".bin")
+
+    def load(self, program, key) -> bool:
+        """
+        Loads a cached binary into an empty program.
+
+        Args:
+            program (int): The program to load into, with no shaders attached.
+            key (str): The key from get_key.
+
+        Returns:
+            bool: True if the program was loaded and linked, False if it must be compiled instead.
+        """
+        if not self.is_supported():
+            return False
+        path = self.get_path(key)
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+        except OSError:
+            return False
+
+        # Each file holds the binary format as a little endian uint32, followed by the binary
+        binaryFormat = int.from_bytes(data[:4], "little")
+        binary = np.frombuffer(data, dtype=np.uint8, offset=4)
+        try:
+            glProgramBinary(program, binaryFormat, binary, len(binary))
+            linked = glGetProgramiv(program, GL_LINK_STATUS)
+        except GLError:
+            linked = False
+        if not linked:
+            self.discard(key)  # Rejected by the driver, so it will never load
+        return bool(linked)
+
+    def save(self, program, key):
+        """
+        Saves the binary of a linked program. Failing to write the cache only costs the next startup
+        a compile, so errors are ignored.
+
+        Args:
+            program (int): A linked program, created with GL_PROGRAM_BINARY_RETRIEVABLE_HINT set.
+            key (str): The key from get_key.
+        """
+        if not self.is_supported():
+            return
+        length = glGetProgramiv(program, GL_PROGRAM_BINARY_LENGTH)
+        if not length:
+            return
+        written = np.zeros(1, dtype=np.int32)
+        binaryFormat = np.zeros(1, dtype=np.uint32)
+        binary = np.empty(length, dtype=np.uint8)
+        glGetProgramBinary(program, length, written, binaryFormat, binary)
+
+        def write(file):
+            # The binary format, followed by the binary itself
+            file.write(int(binaryFormat[0]).to_bytes(4, "little"))
+            file.write(binary[: written[0]].tobytes())
+
+        try:
+            write_atomic(self.get_path(key), write)
+        except OSError:
+            pass
+
+    def discard(self, key):
+        # Deletes the cache file for a key, if there is one.
+        try:
+            os.remove(self.get_path(key))
+        except OSError:
+            pass
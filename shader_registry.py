@@ -0,0 +1,285 @@
+from OpenGL.GL import (
+    glAttachShader,
+    glCompileShader,
+    glCreateProgram,
+    glCreateShader,
+    glGetActiveAttrib,
+    glGetActiveUniform,
+    glGetAttribLocation,
+    glGetProgramInfoLog,
+    glGetProgramiv,
+    glGetShaderInfoLog,
+    glGetShaderiv,
+    glGetUniformBlockIndex,
+    glGetUniformLocation,
+    glLinkProgram,
+    glProgramParameteri,
+    glShaderSource,
+    glUniformBlockBinding,
+    GL_ACTIVE_ATTRIBUTES,
+    GL_ACTIVE_UNIFORMS,
+    GL_COMPILE_STATUS,
+    GL_FRAGMENT_SHADER,
+    GL_INVALID_INDEX,
+    GL_LINK_STATUS,
+    GL_PROGRAM_BINARY_RETRIEVABLE_HINT,
+    GL_TRUE,
+    GL_VERTEX_SHADER,
+)
+from gl_classes import Shader, ShaderMain, ShaderSimulate
+from shader_cache import set_parallel_compile
+
+# Names of the Shader attributes that hold the location of each vertex attribute. Any other
+# attribute is stored as <name>Attribute, and every uniform as <name>Uniform.
+ATTRIBUTE_NAMES = {
+    "aPos": "vertexPositionAttribute",
+    "aTexCoord": "textureCoordAttribute",
+    "aCol": "colourAttribute",
+}
+
+# The Shader subclass built for a program, picked by the first of these uniforms it uses
+SHADER_CLASSES = (
+    ("stepSizeX", ShaderSimulate),
+    ("brightness", ShaderMain),
+)
+
+
+def load_shader(shader_file):
+    """
+    Reads the shader file, determines the shader type (fragment or vertex) and starts compiling it.
+    The compile status is not waited on here, so that a driver with parallel shader compilation can
+    work on every shader at once; compile errors are reported when the program is linked.
+
+    Args:
+        shader_file (str): The file path to the shader source file.
+
+    Returns:
+        int or None: The shader object if successful, or None if there was an error.
+    """
+    # Open the shader file and read its contents
+    with open(shader_file, "r") as file:
+        shader_source = file.read()
+
+    # Check if shader source exists
+    if not shader_source:
+        print("Shader source not found")
+        return None
+
+    # Determine shader type (fragment or vertex) based on file extension
+    if "fs" in shader_file:
+        shader = glCreateShader(GL_FRAGMENT_SHADER)
+    elif "vs" in shader_file:
+        shader = glCreateShader(GL_VERTEX_SHADER)
+    else:
+        return None  # Unknown shader type
+
+    glShaderSource(shader, shader_source)
+    glCompileShader(shader)
+    return shader
+
+
+def get_active(program):
+    """
+    Lists the active uniforms and vertex attributes of a linked program.
+
+    Args:
+        program (int): The linked program.
+
+    Returns:
+        tuple: Two dicts mapping the name of each active uniform and attribute to its location.
+               Arrays are listed under their name without the [0], and uniforms inside uniform
+               blocks (which have no location) are left out.
+    """
+    uniforms = {}
+    for index in range(glGetProgramiv(program, GL_ACTIVE_UNIFORMS)):
+        name = glGetActiveUniform(program, index)[0].decode()
+        location = glGetUniformLocation(program, name)
+        if location >= 0:
+            uniforms[name.removesuffix("[0]")] = location
+    attributes = {}
+    for index in range(glGetProgramiv(program, GL_ACTIVE_ATTRIBUTES)):
+        name = glGetActiveAttrib(program, index)[0].decode()
+        attributes[name] = glGetAttribLocation(program, name)
+    return uniforms, attributes
+
+
+class ShaderRegistry:
+    """
+    Builds shader programs by name the first time they are requested, then keeps them.
+
+    Programs are registered with their fragment and vertex shader paths up front, but nothing is
+    compiled until a program is first asked for, so a session only pays for the programs it uses.
+    After linking, the active uniforms and attributes of the program are looked up and stored on
+    a Shader of the matching subclass (see SHADER_CLASSES), and any uniform blocks listed in
+    `blocks` are bound to their binding points.
+
+    Attributes:
+        cache (ProgramCache or None): On-disk cache of linked programs, or None to always compile.
+        blocks (dict): Maps uniform block names to the binding point they are bound to.
+        paths (dict): Maps each registered name to its (fragment shader, vertex shader) paths.
+        programs (dict): Maps each name that has been built to its Shader.
+    """
+
+    def __init__(self, cache=None, blocks=None):
+        """
+        Initializes an empty ShaderRegistry object.
+
+        Args:
+            cache (ProgramCache, optional): On-disk cache of linked programs. Defaults to None.
+            blocks (dict, optional): Uniform block binding points by block name. Defaults to None.
+        """
+        self.cache = cache
+        self.blocks = dict(blocks or {})
+        self.paths = {}
+        self.programs = {}
+
+    def register(self, name, fs, vs):
+        """
+        Registers a program without building it.
+
+        Args:
+            name (str): The name the program is requested by.
+            fs (str): Path to the fragment shader file.
+            vs (str): Path to the vertex shader file.
+        """
+        self.paths[name] = (fs, vs)
+
+    def get(self, name):
+        """
+        Returns a program, building it first if this is the first time it has been requested.
+
+        Args:
+            name (str): The name the program was registered under.
+
+        Returns:
+            Shader or None: The program, or None if it failed to build.
+        """
+        shader = self.programs.get(name)
+        if shader is None:
+            self.build([name])
+            shader = self.programs.get(name)
+        return shader
+
+    def is_built(self, name):
+        # Returns whether a program has already been built.
+        return name in self.programs
+
+    def build(self, names):
+        """
+        Builds several programs that have not been built yet. Every program is started before any
+        of them is waited on, so a driver with parallel shader compilation builds them at once.
+
+        Args:
+            names (list): The names of the programs to build.
+        """
+        names = [name for name in dict.fromkeys(names) if name not in self.programs]
+        if not names:
+            return
+        set_parallel_compile()
+        started = [(name, self.start_program(*self.paths[name])) for name in names]
+        for name, start in started:
+            shader = self.finish_program(*start) if start else None
+            if shader is not None:
+                self.programs[name] = shader
+
+    def start_program(self, fs, vs):
+        """
+        Starts building a program, either from its cached binary or by compiling and linking its
+        shaders, without waiting for the driver to finish.
+
+        Args:
+            fs (str): Path to the fragment shader file.
+            vs (str): Path to the vertex shader file.
+
+        Returns:
+            tuple or None: The (program, fs, vs, frag_shader, vert_shader, key) passed to
+                           finish_program, where key is the cache key to save the program under
+                           (None if it came from the cache or there is no cache), or None if a
+                           shader file could not be read.
+        """
+        try:
+            sources = []
+            for path in (fs, vs):
+                with open(path, "r") as file:
+                    sources.append(file.read())
+        except OSError:
+            print(f"Error: Shader not found ({fs}, {vs})")
+            return None
+
+        program = glCreateProgram()
+
+        # Load the linked program straight from the cache when the sources and driver match
+        key = None
+        if self.cache is not None:
+            key = self.cache.get_key(sources)
+            if self.cache.load(program, key):
+                return program, fs, vs, 0, 0, None
+
+        # Load and compile the fragment and vertex shaders
+        frag_shader = load_shader(fs)
+        vert_shader = load_shader(vs)
+        if frag_shader is None or vert_shader is None:
+            return None
+
+        # Attach the vertex and fragment shaders to the program
+        glAttachShader(program, vert_shader)
+        glAttachShader(program, frag_shader)
+
+        # Link the shader program, keeping its binary retrievable for the cache
+        if key is not None:
+            glProgramParameteri(program, GL_PROGRAM_BINARY_RETRIEVABLE_HINT, GL_TRUE)
+        glLinkProgram(program)
+        return program, fs, vs, frag_shader, vert_shader, key
+
+    def finish_program(self, program, fs, vs, frag_shader, vert_shader, key):
+        """
+        Waits for a program started by start_program, saves it to the cache if it was compiled,
+        and wraps it in a Shader holding the locations of its active uniforms and attributes.
+
+        Args:
+            program (int): The program being built.
+            fs (str): Path to the fragment shader file.
+            vs (str): Path to the vertex shader file.
+            frag_shader (int): The compiled fragment shader, or 0 if loaded from the cache.
+            vert_shader (int): The compiled vertex shader, or 0 if loaded from the cache.
+            key (str or None): The cache key to save the program under, if any.
+
+        Returns:
+            Shader or None: The finished shader, or None if it failed to compile or link.
+        """
+        if not glGetProgramiv(program, GL_LINK_STATUS):
+            for path, shader in ((fs, frag_shader), (vs, vert_shader)):
+                if shader and not glGetShaderiv(shader, GL_COMPILE_STATUS):
+                    print(
+                        f"Shader compile error in {path}: {glGetShaderInfoLog(shader)}"
+                    )
+            print(f"Shader link error in {fs}: {glGetProgramInfoLog(program)}")
+            return None
+        if key is not None:
+            self.cache.save(program, key)
+
+        # Build the subclass matching the uniforms the program uses
+        uniforms, attributes = get_active(program)
+        shaderClass = Shader
+        for uniform, subclass in SHADER_CLASSES:
+            if uniform in uniforms:
+                shaderClass = subclass
+                break
+        shader = shaderClass(program, frag_shader, vert_shader)
+
+        # Locations the program does not use are -1, which glUniform* calls silently ignore
+        for attribute, value in vars(shader).items():
+            if value is None and attribute.endswith(("Uniform", "Attribute")):
+                setattr(shader, attribute, -1)
+        for name, location in uniforms.items():
+            setattr(shader, name + "Uniform", location)
+        for name, location in attributes.items():
+            setattr(shader, ATTRIBUTE_NAMES.get(name, name + "Attribute"), location)
+
+        # Bind the uniform blocks the program uses
+        for block, binding in self.blocks.items():
+            index = glGetUniformBlockIndex(program, block)
+            if index != GL_INVALID_INDEX:
+                glUniformBlockBinding(program, index, binding)
+
+        return shader
@@ -14,6 +14,7 @@ in vec2 vTexCoord;
 in vec4 vPos;
 
 uniform sampler2D sampler;
+uniform sampler2D material;
 uniform float brightness;
 uniform lowp vec3 colours[TS_COL_COUNT];
 
@@ -24,8 +25,8 @@ out vec4 FragColor;
         float alpha = 1.0;
         vec4 texColour = texture2D(sampler, vec2(vTexCoord.s, vTexCoord.t));
 
-		// blue channel used to store walls/media
-		float med = texColour.b;
+		// material texture stores walls/media
+		float med = texture2D(material, vec2(vTexCoord.s, vTexCoord.t)).r;
 		vec3 col;
 		if (med == 0.0)
 			col = colours[TS_COL_WALL];
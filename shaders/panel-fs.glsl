@@ -0,0 +1,13 @@
+#version 330 core
+
+in vec2 vTexCoord;
+in vec4 vPos;
+
+// the input panel, drawn with pygame and uploaded whenever it changes
+uniform sampler2D sampler;
+
+out vec4 FragColor;
+
+void main(void) {
+    FragColor = texture(sampler, vTexCoord);
+}
@@ -1,21 +1,35 @@
 #version 330 core
 
+#define MAX_SOURCES 1024
+
 in vec2 vTexCoord;
 in vec4 vPos;
-in float vDamping;
 
 uniform sampler2D sampler;
 uniform float stepSizeX;
 uniform float stepSizeY;
+// simulation time since the epoch the source phases were taken at
+uniform float time;
+// index+1 of the source at each texel, 0 where there is none
+uniform usampler2D sourceMap;
+// wave-speed coefficient of each texel, 0 for walls
+uniform sampler2D material;
+// global damping factor, and the absorbing layer at the edge of the grid
+uniform float damping;
+uniform sampler2D sponge;
+
+// frequency, amplitude and phase at the epoch of every source
+layout (std140) uniform Sources {
+    vec4 sources[MAX_SOURCES];
+};
 
 out vec4 FragColor;
 
 	highp float getAdjacent(highp vec2 offset)
 	{
         highp vec2 x = offset+vTexCoord;
-		highp vec4 pixelVector = texture2D(sampler, x);
-        if (pixelVector.b > 0.0)
-           return pixelVector.r;
+        if (texture2D(material, x).r > 0.0)
+           return texture2D(sampler, x).r;
         return texture2D(sampler, vTexCoord-offset).r;
     }
 
@@ -24,7 +38,8 @@ void main()
         highp float newVel = 0.;
     	highp float newDisp = 0.;
         highp vec4 pixelVector = texture2D(sampler, vTexCoord);
-        if (pixelVector.b > 0.0) {
+        highp float med = texture2D(material, vTexCoord).r;
+        if (med > 0.0) {
                 highp float disp = pixelVector.r;
                 highp float vel = pixelVector.g;
                 highp float pixel1 = getAdjacent(vec2(stepSizeX, 0.));    
@@ -32,9 +47,16 @@ void main()
                 highp float pixel3 = getAdjacent(vec2(0., stepSizeY));
                 highp float pixel4 = getAdjacent(vec2(0., -stepSizeY));
                 highp float adj = pixel1+pixel2+pixel3+pixel4;
-                highp float mat = pixelVector.b;
-                newVel = mat*(adj-disp)*0.375+vel*vDamping;
+                newVel = med*(adj-4.*disp)*0.375+vel*(damping*texture2D(sponge, vTexCoord).r);
         		newDisp = disp+newVel;
         }
-        FragColor = vec4(newDisp, newVel, pixelVector.b, 1.);
+
+        // sources drive their texel directly
+        uint source = texelFetch(sourceMap, ivec2(gl_FragCoord.xy), 0).r;
+        if (source > 0u) {
+                highp vec4 params = sources[source-1u];
+                newDisp = sin(time*params.x+params.z)*params.y;
+                newVel = 0.;
+        }
+        FragColor = vec4(newDisp, newVel, med, 1.);
 }
\ No newline at end of file
@@ -1,18 +1,157 @@
 import pygame
 import numpy as np
+from conversion import rotate_boxes
+
+# Largest refractive index a medium may have. The index is used directly as the wave-speed
+# coefficient of the stencil, which diverges once 0.375*n passes the 2-D limit of 1/2 (n > 4/3)
+MAX_REFRACTIVE_INDEX = 1.0
+
+
+def clamp_refractive_index(n) -> float:
+    # Clamps a refractive index to the stable range, from 0 (a wall) to MAX_REFRACTIVE_INDEX
+    return min(max(float(n), 0.0), MAX_REFRACTIVE_INDEX)
+
+
+class SceneStore:
+    """
+    Struct-of-arrays storage for every hitbox, source and medium in a scene.
+
+    Each hitbox owns one slot, and the Source or Medium built on it keeps its parameters in the same
+    slot, so whole-scene work (gathering source parameters, rotating every medium) is a single
+    indexed NumPy operation instead of a loop over Python objects. The arrays grow by doubling,
+    and the slots of hitboxes that are no longer referenced anywhere are reused.
+
+    Attributes:
+        pos (np.ndarray): (capacity, 2) positions (x, y).
+        size (np.ndarray): (capacity, 2) sizes (width, height).
+        rot (np.ndarray): Rotation of each medium in degrees.
+        n (np.ndarray): Refractive index of each medium.
+        freq (np.ndarray): Frequency of each source.
+        amp (np.ndarray): Amplitude of each source.
+        zerot (np.ndarray): Start time of each source.
+        phase (np.ndarray): Phase offset of each source in radians.
+        ids (np.ndarray): Id of the hitbox in each slot, -1 for free slots.
+        free (list): Slots released for reuse.
+        count (int): Number of slots handed out so far, including released ones.
+    """
+
+    COLUMNS = ("pos", "size", "rot", "n", "freq", "amp", "zerot", "phase", "ids")
+
+    def __init__(self, capacity=64):
+        """
+        Initializes an empty SceneStore object.
+
+        Args:
+            capacity (int, optional): Number of slots to allocate up front. Defaults to 64.
+        """
+        self.pos = np.zeros((capacity, 2), dtype=np.float64)
+        self.size = np.zeros((capacity, 2), dtype=np.float64)
+        self.rot = np.zeros(capacity, dtype=np.float64)
+        self.n = np.zeros(capacity, dtype=np.float64)
+        self.freq = np.zeros(capacity, dtype=np.float64)
+        self.amp = np.zeros(capacity, dtype=np.float64)
+        self.zerot = np.zeros(capacity, dtype=np.float64)
+        self.phase = np.zeros(capacity, dtype=np.float64)
+        self.ids = np.full(capacity, -1, dtype=np.int64)
+        self.free = []
+        self.count = 0
+
+    def get_capacity(self):
+        # Returns the number of slots the arrays can hold before growing.
+        return len(self.ids)
+
+    def grow(self):
+        # Doubles the capacity of every array, keeping the existing slots.
+        capacity = 2 * self.get_capacity()
+        for name in self.COLUMNS:
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[: len(old)] = old
+            setattr(self, name, new)
+        self.ids[self.count :] = -1
+
+    def allocate(self, id):
+        """
+        Hands out a slot, reusing a released one if there is any.
+
+        Args:
+            id (int): The id of the hitbox taking the slot.
+
+        Returns:
+            int: The slot.
+        """
+        if self.free:
+            slot = self.free.pop()
+        else:
+            if self.count == self.get_capacity():
+                self.grow()
+            slot = self.count
+            self.count += 1
+        for name in self.COLUMNS:
+            getattr(self, name)[slot] = 0
+        self.ids[slot] = id
+        return slot
+
+    def release(self, slot):
+        """
+        Returns a slot to the store so it can be reused.
+
+        Args:
+            slot (int): The slot to release.
+        """
+        self.ids[slot] = -1
+        self.free.append(slot)
+
+    def get_slots(self, items) -> np.ndarray:
+        """
+        Gathers the slots of a list of hitboxes, sources or mediums, to index the arrays with.
+
+        Args:
+            items (list): Hitbox, Source or Medium objects stored in this store.
+
+        Returns:
+            np.ndarray: The slot of each item, in order.
+        """
+        return np.fromiter(
+            (getattr(item, "hitbox", item).slot for item in items),
+            dtype=np.intp,
+            count=len(items),
+        )
+
+    def get_corners(self, slots) -> np.ndarray:
+        """
+        Rotates the boxes in the given slots about their centres, all in one call.
+
+        Args:
+            slots (np.ndarray): The slots to rotate.
+
+        Returns:
+            np.ndarray: An (N, 4, 2) array of corners, in the order of Medium.get_rotated.
+        """
+        return rotate_boxes(self.pos[slots], self.size[slots], self.rot[slots])
+
+
+# The store used by hitboxes created without one
+DEFAULT_STORE = SceneStore()
 
 
 class Hitbox:
     """
     A class representing a hitbox, used to detect collisions and manage position/size.
 
+    The position and size live in a slot of a SceneStore, so the hitbox itself is only a view.
+
     Attributes:
-        pos (tuple): Position of the hitbox (x, y).
-        size (tuple): Size of the hitbox (width, height).
+        pos (list): Position of the hitbox (x, y).
+        size (list): Size of the hitbox (width, height).
         id (int): Unique identifier for the hitbox.
+        store (SceneStore): The store holding the hitbox.
+        slot (int): The slot of the hitbox in the store.
     """
 
-    def __init__(self, pos, size, id):
+    __slots__ = ("id", "store", "slot")
+
+    def __init__(self, pos, size, id, store=None):
         """
         Initializes the Hitbox object.
 
@@ -20,11 +159,34 @@ class Hitbox:
             pos (tuple): Position of the hitbox (x, y).
             size (tuple): Size of the hitbox (width, height).
             id (int): Unique identifier for the hitbox.
+            store (SceneStore, optional): The store to keep the hitbox in. Defaults to DEFAULT_STORE.
         """
+        self.store = DEFAULT_STORE if store is None else store
+        self.slot = self.store.allocate(id)
         self.pos = pos
         self.size = size
         self.id = id
 
+    def __del__(self):
+        # Returns the slot to the store once nothing refers to the hitbox any more.
+        self.store.release(self.slot)
+
+    @property
+    def pos(self):
+        return self.store.pos[self.slot].tolist()
+
+    @pos.setter
+    def pos(self, pos):
+        self.store.pos[self.slot] = pos
+
+    @property
+    def size(self):
+        return self.store.size[self.slot].tolist()
+
+    @size.setter
+    def size(self, size):
+        self.store.size[self.slot] = size
+
     def get_id(self):
         # Returns the ID of the hitbox.
         return self.id
@@ -79,6 +241,17 @@ class Hitbox:
         # Sets the size of the hitbox.
         self.size = size
 
+    def get_corners(self):
+        """
+        Returns the corners of the hitbox, in the same order as Medium.get_rotated.
+
+        Returns:
+            list: The (x, y) corners of the hitbox.
+        """
+        x, y = self.get_pos()
+        w, h = self.get_size()
+        return [(x, y), (x, y + h), (x + w, y + h), (x + w, y)]
+
     def get_centre(self):
         """
         Calculates and returns the center of the hitbox.
@@ -86,10 +259,10 @@ class Hitbox:
         Returns:
             tuple: The center coordinates (x, y) of the hitbox.
         """
-        centre = self.get_pos()
+        centre = list(self.get_pos())  # Copy, so the stored position is left unchanged
         half = [x / 2 for x in self.get_size()]
         centre[0] += half[0]
-        centre[1] -= half[1]
+        centre[1] += half[1]
         return centre
 
 
@@ -97,12 +270,18 @@ class Medium:
     """
     A class representing a medium, with a refractive index and rotation.
 
+    The rotation and refractive index are kept in the slot of the hitbox in its SceneStore. The
+    refractive index is a wave-speed factor, from 0 (a wall) to 1 (free space), and values outside
+    that range are clamped so the simulation stays stable.
+
     Attributes:
         hitbox (Hitbox): The hitbox associated with this medium.
-        refractive_index (float): The refractive index of the medium.
+        refractive_index (float): The refractive index of the medium, between 0 and 1.
         rotation (float): The rotation angle of the medium in degrees.
     """
 
+    __slots__ = ("hitbox",)
+
     def __init__(self, hitbox, rot, n):
         """
         Initializes the Medium object.
@@ -116,38 +295,34 @@ class Medium:
         self.refractive_index = n
         self.rotation = rot
 
+    @property
+    def rotation(self):
+        return float(self.hitbox.store.rot[self.hitbox.slot])
+
+    @rotation.setter
+    def rotation(self, rot):
+        self.hitbox.store.rot[self.hitbox.slot] = rot
+
+    @property
+    def refractive_index(self):
+        return float(self.hitbox.store.n[self.hitbox.slot])
+
+    @refractive_index.setter
+    def refractive_index(self, n):
+        self.hitbox.store.n[self.hitbox.slot] = clamp_refractive_index(n)
+
     def get_rotated(self):
         """
         Returns the vertices of the hitbox after rotation.
 
-        This method applies the rotation to the corners of the hitbox.
+        This method applies the rotation to the corners of the hitbox, about its centre.
+        Use SceneStore.get_corners to rotate many mediums at once.
 
         Returns:
             list: List of the rotated vertices of the hitbox.
         """
-        p = self.hitbox.get_pos()
-        s = self.hitbox.get_size()
-        r = self.get_rot()
-        c = self.hitbox.get_centre()
-        verts = [
-            (p[0], p[1]),
-            (p[0] + s[0], p[1]),
-            (p[0], p[1] + s[1]),
-            (p[0] + s[0], p[1] + s[1]),
-        ]
-        verts = [(x - c[0], y - c[1]) for (x, y) in verts]
-        r = np.pi * r / 180
-        mat = np.matrix([[np.cos(r), -np.sin(r)], [np.sin(r), np.cos(r)]])
-        verts = [coord * mat for coord in verts]
-
-        # Convert the rotated coordinates back to the original position
-        v = []
-        for coord in verts:
-            coord = coord.A1
-            v.append(coord)
-
-        v = [(x + c[0], y + c[1]) for (x, y) in v]
-        return [v[0], v[2], v[3], v[1]]
+        corners = self.hitbox.store.get_corners([self.hitbox.slot])[0]
+        return [tuple(corner) for corner in corners]
 
     def set_rot(self, rot):
         # Sets the rotation angle of the medium.
@@ -155,18 +330,18 @@ class Medium:
 
     def set_pos(self, pos):
         # Sets the position of the hitbox associated with the medium.
-        self.pos = pos
+        self.hitbox.set_pos(pos)
 
     def set_size(self, size):
         # Sets the size of the hitbox associated with the medium.
-        self.size = size
+        self.hitbox.set_size(size)
 
     def get_refractive_index(self):
         # Returns the refractive index of the medium.
         return self.refractive_index
 
     def set_refractive_index(self, n):
-        # Sets the refractive index of the medium.
+        # Sets the refractive index of the medium, clamped to between 0 and 1.
         self.refractive_index = n
 
     def get_id(self):
@@ -185,15 +360,20 @@ class Medium:
 class Source:
     """
     A class representing a source, which can oscillate and interact with mediums.
+    The frequency, amplitude, start time and phase are kept in the slot of the hitbox in its
+    SceneStore.
 
     Attributes:
         hitbox (Hitbox): The hitbox associated with the source.
         frequency (float): The frequency of oscillation.
         amplitude (float): The amplitude of the oscillation.
         zerot (float): The time at which the source starts oscillating.
+        phase (float): The phase offset of the oscillation in radians.
     """
 
-    def __init__(self, hitbox, frequency, amplitude):
+    __slots__ = ("hitbox",)
+
+    def __init__(self, hitbox, frequency, amplitude, phase=0):
         """
         Initializes the Source object.
 
@@ -201,11 +381,45 @@ class Source:
             hitbox (Hitbox): The hitbox associated with the source.
             frequency (float): The frequency of oscillation.
             amplitude (float): The amplitude of the oscillation.
+            phase (float, optional): The phase offset in radians. Defaults to 0.
         """
         self.hitbox = hitbox
         self.freq = frequency
         self.amp = amplitude
         self.zerot = 0
+        self.phase = phase
+
+    @property
+    def freq(self):
+        return float(self.hitbox.store.freq[self.hitbox.slot])
+
+    @freq.setter
+    def freq(self, freq):
+        self.hitbox.store.freq[self.hitbox.slot] = freq
+
+    @property
+    def amp(self):
+        return float(self.hitbox.store.amp[self.hitbox.slot])
+
+    @amp.setter
+    def amp(self, amp):
+        self.hitbox.store.amp[self.hitbox.slot] = amp
+
+    @property
+    def zerot(self):
+        return float(self.hitbox.store.zerot[self.hitbox.slot])
+
+    @zerot.setter
+    def zerot(self, time):
+        self.hitbox.store.zerot[self.hitbox.slot] = time
+
+    @property
+    def phase(self):
+        return float(self.hitbox.store.phase[self.hitbox.slot])
+
+    @phase.setter
+    def phase(self, phase):
+        self.hitbox.store.phase[self.hitbox.slot] = phase
 
     def get_amp(self):
         # Returns the amplitude of the source.
@@ -231,6 +445,18 @@ class Source:
         # Sets the time at which the source starts oscillating.
         self.zerot = time
 
+    def get_phase(self):
+        # Returns the phase offset of the source in radians.
+        return self.phase
+
+    def set_phase(self, phase):
+        # Sets the phase offset of the source in radians.
+        self.phase = phase
+
+    def get_id(self):
+        # Returns the ID of the hitbox associated with the source.
+        return self.hitbox.get_id()
+
     def get_disp(self, time):
         """
         Calculates and returns the displacement of the source at a given time.
@@ -244,5 +470,106 @@ class Source:
         z = self.get_zerot()
         f = self.get_freq()
         a = self.get_amp()
-        disp = np.sin((time - z) * f) * a
+        disp = np.sin((time - z) * f + self.get_phase()) * a
         return disp
+
+
+class SourceBank:
+    """
+    The parameters of many sources held as arrays, for evaluating every source displacement at once.
+
+    Each displacement is sin((time - zerot) * freq + phase) * amp. The start time and phase are
+    folded into a single precomputed offset, so evaluating the bank at a time is one multiply-add,
+    one sine and one multiply over the whole array, whether it holds one source or thousands.
+
+    Attributes:
+        freq (np.ndarray): Frequency of each source.
+        amp (np.ndarray): Amplitude of each source.
+        zerot (np.ndarray): Start time of each source.
+        phase (np.ndarray): Phase offset of each source in radians.
+        offset (np.ndarray): The precomputed phase - zerot * freq of each source.
+    """
+
+    def __init__(self, sources=()):
+        """
+        Initializes the SourceBank object.
+
+        Args:
+            sources (list, optional): The sources to gather. Defaults to none.
+        """
+        self.set_sources(sources)
+
+    def set_sources(self, sources):
+        """
+        Gathers the parameters of the sources from the SceneStore they share. Must be called again
+        after the sources are edited.
+
+        Args:
+            sources (list): The sources to gather.
+        """
+        n = len(sources)
+        if n:
+            store = sources[0].hitbox.store
+            slots = store.get_slots(sources)
+            self.set_params(
+                store.freq[slots],
+                store.amp[slots],
+                store.zerot[slots],
+                store.phase[slots],
+            )
+        else:
+            self.set_params(np.zeros(0), np.zeros(0), np.zeros(0), np.zeros(0))
+
+    def set_params(self, freq, amp, zerot, phase=None):
+        """
+        Sets the parameters of the bank directly from arrays.
+
+        Args:
+            freq (np.ndarray): Frequency of each source.
+            amp (np.ndarray): Amplitude of each source.
+            zerot (np.ndarray): Start time of each source.
+            phase (np.ndarray, optional): Phase offset of each source. Defaults to zeros.
+        """
+        self.freq = np.array(freq, dtype=np.float64)
+        self.amp = np.array(amp, dtype=np.float64)
+        self.zerot = np.array(zerot, dtype=np.float64)
+        if phase is None:
+            phase = np.zeros_like(self.freq)
+        self.phase = np.array(phase, dtype=np.float64)
+        self.offset = self.phase - self.zerot * self.freq
+
+    def evaluate(self, time, out=None) -> np.ndarray:
+        """
+        Calculates the displacement of every source at one time, or at a block of times.
+
+        Args:
+            time (float or np.ndarray): A time, or a (K,) array of times such as the substeps of a frame.
+            out (np.ndarray, optional): A (N,) or (K, N) array to write the result into.
+
+        Returns:
+            np.ndarray: The (N,) displacements at a single time, or the (K, N) displacements at each time.
+        """
+        time = np.asarray(time, dtype=np.float64)
+        if time.ndim:
+            time = time[:, np.newaxis]
+        result = np.multiply(time, self.freq, out=out)
+        np.add(result, self.offset, out=result)
+        np.sin(result, out=result)
+        np.multiply(result, self.amp, out=result)
+        return result
+
+    def get_phases(self, time) -> np.ndarray:
+        """
+        Calculates the phase of every source at one time, wrapped to [0, 2pi) in float64, so that
+        sources can be evaluated in float32 relative to that time without losing precision.
+
+        Args:
+            time (float): The time to take the phases at.
+
+        Returns:
+            np.ndarray: The (N,) phase of each source at the time.
+        """
+        return np.mod(float(time) * self.freq + self.offset, 2 * np.pi)
+
+    def __len__(self):
+        return len(self.freq)
@@ -0,0 +1,607 @@
+import warnings
+import numpy as np
+from typing import Tuple
+from OpenGL.GL import (
+    glBindFramebuffer,
+    glReadPixels,
+    glTextureSubImage2D,
+    GL_FRAMEBUFFER,
+    GL_RG,
+    GL_FLOAT,
+)
+from material import MaterialGrid
+from sim_classes import SourceBank
+
+SPONGE_WIDTH = 16  # Width of the absorbing layer around the edge of the grid, in texels
+SPONGE_STRENGTH = (
+    0.3  # How much of the velocity the outermost texel of the layer removes each step
+)
+DEFAULT_DT = 16  # Simulation time advanced by every stencil step, in milliseconds
+# Most sources simulated on either backend, the size of the Sources uniform block in the shaders
+MAX_SOURCES = 1024
+
+
+def sponge_profile(
+    size: Tuple[int, int],
+    width: float = SPONGE_WIDTH,
+    strength: float = SPONGE_STRENGTH,
+) -> np.ndarray:
+    """
+    Build the graded absorbing layer (sponge) around the edge of the grid.
+
+    Each texel holds the factor its velocity is multiplied by every step, on top of the global
+    damping. It is 1 in the interior and falls quadratically across the `width` texels nearest the
+    edge to `1 - strength` at the outermost simulated texel. Absorbing gradually rather than at a
+    sudden step stops the layer itself reflecting waves, so a thin layer is enough.
+
+    Args:
+        size (Tuple[int, int]): The size of the simulation grid (width, height).
+        width (float, optional): Width of the layer in texels. Defaults to SPONGE_WIDTH.
+        strength (float, optional): Velocity removed per step at the edge. Defaults to SPONGE_STRENGTH.
+
+    Returns:
+        np.ndarray: A float32 array of shape (height, width) holding the factor of each texel.
+    """
+
+    def depth(n):
+        # Texels between each texel and the outermost simulated texel (texel 1 or n - 2)
+        i = np.arange(n, dtype=np.float32)
+        return np.minimum(i, n - 1 - i) - 1
+
+    if width <= 0:
+        return np.ones((size[1], size[0]), dtype=np.float32)
+    d = np.minimum(depth(size[0])[np.newaxis, :], depth(size[1])[:, np.newaxis])
+    ramp = np.clip((width - d) / width, 0, 1)
+    return (1 - strength * ramp**2).astype(np.float32)
+
+
+def sim_geometry(size: Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Build the two triangles the simulation shaders are drawn over, with matching texture coordinates.
+    They cover every texel inside the outermost ring, which is never drawn, so it keeps its wall
+    value and bounds the simulation.
+
+    Args:
+        size (Tuple[int, int]): The size of the simulation grid (width, height).
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The float32 vertex positions in normalized device space (6, 2)
+        and texture coordinates (6, 2).
+    """
+    width, height = size
+    x1, y1, x2, y2 = 1, 1, width - 1, height - 1
+    texel = np.array(
+        [[x2, y1], [x1, y1], [x2, y2], [x1, y1], [x2, y2], [x1, y2]], dtype=np.float64
+    )
+
+    # Texture coordinates of the same texels, so each fragment samples its own texel
+    texCoord = texel / np.array([width, height], dtype=np.float64)
+    pos = 2 * texCoord - 1
+    return pos.astype(np.float32), texCoord.astype(np.float32)
+
+
+def source_texel(source, size: Tuple[int, int]) -> Tuple[int, int]:
+    """
+    Work out which texel of the grid a source injects into. Sources are kept off the outermost ring
+    of texels, which is never simulated.
+
+    Args:
+        source (Source): The source to locate.
+        size (Tuple[int, int]): The size of the simulation grid (width, height).
+
+    Returns:
+        Tuple[int, int]: The (x, y) texel the source writes to.
+    """
+    x, y = source.hitbox.get_centre()
+    x = int(min(max(x, 1), size[0] - 2))
+    y = int(min(max(y, 1), size[1] - 2))
+    return x, y
+
+
+def source_texels(sources, size: Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Work out the texel of every source at once, reading their hitboxes straight from the SceneStore
+    they share. Matches source_texel for each source.
+
+    Args:
+        sources (list): The sources to locate, all held by the same SceneStore.
+        size (Tuple[int, int]): The size of the simulation grid (width, height).
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The x and y texel of each source.
+    """
+    if not len(sources):
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+    store = sources[0].hitbox.store
+    slots = store.get_slots(sources)
+    centre = store.pos[slots] + store.size[slots] / 2
+    x = np.clip(centre[:, 0], 1, size[0] - 2).astype(np.intp)
+    y = np.clip(centre[:, 1], 1, size[1] - 2).astype(np.intp)
+    return x, y
+
+
+def simulated_sources(sources) -> list:
+    """
+    Pick the sources both backends simulate: all of them up to MAX_SOURCES, otherwise the
+    MAX_SOURCES placed first (lowest id) in their original order, so deleting or moving a source
+    never changes which of the others are kept. Warns the first time any are left out.
+
+    Args:
+        sources (list): The sources in the scene, all held by the same SceneStore.
+
+    Returns:
+        list: The sources to simulate.
+    """
+    sources = list(sources)
+    if len(sources) <= MAX_SOURCES:
+        return sources
+    warnings.warn(f"Only the first {MAX_SOURCES} sources placed are simulated")
+    store = sources[0].hitbox.store
+    ids = store.ids[store.get_slots(sources)]
+    kept = np.sort(np.argsort(ids, kind="stable")[:MAX_SOURCES])
+    return [sources[i] for i in kept]
+
+
+class SimClock:
+    """
+    The simulation time, advanced by a fixed dt for every stencil step regardless of wall time.
+
+    The time is always worked out as start + step * dt from the integer step count, so no rounding
+    error builds up, and the time of each step is the same on every machine however the steps are
+    split between frames or batches. Step k (counting from 1) injects the sources at start + k * dt.
+
+    Attributes:
+        dt (float): The simulation time advanced by each step, in milliseconds.
+        start (float): The time before the first step.
+        step (int): The number of steps taken since start.
+    """
+
+    def __init__(self, dt=DEFAULT_DT, start=0.0):
+        """
+        Initializes the SimClock object.
+
+        Args:
+            dt (float, optional): Milliseconds of simulation time per step. Defaults to DEFAULT_DT.
+            start (float, optional): The time before the first step. Defaults to 0.
+        """
+        self.dt = float(dt)
+        self.start = float(start)
+        self.step = 0
+
+    @property
+    def time(self) -> float:
+        # The time of the most recent step
+        return self.start + self.step * self.dt
+
+    def get_times(self, steps) -> np.ndarray:
+        """
+        Returns the times of the next steps without advancing the clock.
+
+        Args:
+            steps (int): The number of steps.
+
+        Returns:
+            np.ndarray: The float64 time of each step, in order.
+        """
+        return self.start + self.dt * np.arange(
+            self.step + 1, self.step + 1 + steps, dtype=np.float64
+        )
+
+    def advance(self, steps=1) -> np.ndarray:
+        """
+        Advances the clock by a number of steps.
+
+        Args:
+            steps (int, optional): The number of steps. Defaults to 1.
+
+        Returns:
+            np.ndarray: The time of each step taken, as passed to Solver.run.
+        """
+        times = self.get_times(steps)
+        self.step += steps
+        return times
+
+    def set_dt(self, dt):
+        # Changes the time per step from now on, without moving the current time
+        if dt == self.dt:
+            return  # Keep the step count, so resumed runs land on exactly the same times
+        self.start = self.time
+        self.step = 0
+        self.dt = float(dt)
+
+    def reset(self, start=0.0):
+        # Moves the clock back to a start time with no steps taken
+        self.start = float(start)
+        self.step = 0
+
+
+class Solver:
+    """
+    The common stepping interface shared by every simulation backend.
+
+    A solver is given a scene of Source and Medium objects, and is then stepped forwards one stencil
+    pass at a time. The field can be read back as a (height, width, 3) float32 array holding the
+    displacement, velocity and material of each texel.
+
+    Attributes:
+        size (tuple): Size of the simulation grid (width, height).
+        damping (float): Global damping factor applied to the velocity every step.
+        reflective (bool): Whether walls reflect waves (True) or absorb them (False).
+        sources (list): The sources currently in the scene.
+        mediums (list): The walls and mediums currently in the scene.
+    """
+
+    def __init__(self, size, damping=1.0, reflective=False):
+        """
+        Initializes the Solver object.
+
+        Args:
+            size (tuple): Size of the simulation grid (width, height).
+            damping (float, optional): Global damping factor. Defaults to 1.0.
+            reflective (bool, optional): Whether walls reflect waves. Defaults to False.
+        """
+        self.size = (int(size[0]), int(size[1]))
+        self.damping = damping
+        self.reflective = reflective
+        self.sources = []
+        self.mediums = []
+
+    def set_scene(self, sources, mediums):
+        """
+        Replaces the scene simulated by the solver. Must be called again after the scene is edited.
+
+        Args:
+            sources (list): The sources in the scene.
+            mediums (list): The walls and mediums in the scene.
+        """
+        self.sources = list(sources)
+        self.mediums = list(mediums)
+
+    def step(self, time):
+        """
+        Advances the field by a single stencil pass, then injects the sources at the given time.
+
+        Args:
+            time (float): The simulation time used to evaluate the source displacements.
+        """
+        raise NotImplementedError
+
+    def run(self, times):
+        """
+        Runs one step at each of a sequence of times.
+
+        Args:
+            times (np.ndarray): The simulation time of each step, in order.
+        """
+        for time in times:
+            self.step(time)
+
+    def get_field(self) -> np.ndarray:
+        """
+        Returns the current state of the field.
+
+        Returns:
+            np.ndarray: A (height, width, 3) float32 array of displacement, velocity and material.
+        """
+        raise NotImplementedError
+
+    def set_field(self, field):
+        """
+        Overwrites the displacement and velocity of the field. The material is left unchanged,
+        since it comes from the scene.
+
+        Args:
+            field (np.ndarray): A (height, width, 2 or 3) array of displacement and velocity.
+        """
+        raise NotImplementedError
+
+    def get_size(self):
+        # Returns the size of the simulation grid.
+        return self.size
+
+    def get_damping(self):
+        # Returns the global damping factor.
+        return self.damping
+
+    def get_reflective(self):
+        # Returns whether walls reflect waves.
+        return self.reflective
+
+    def set_reflective(self, reflective):
+        # Sets whether walls reflect waves.
+        self.reflective = reflective
+
+
+class CPUSolver(Solver):
+    """
+    A NumPy implementation of simulate-absorb-fs.glsl and simulate-reflect-fs.glsl.
+
+    The whole grid is updated with vectorized operations on float32 arrays. Every buffer is allocated
+    when the solver is created, so stepping performs no array allocations. Neighbours outside the grid
+    read as walls, matching the GL_CLAMP_TO_BORDER sampling of the state texture.
+
+    Attributes:
+        sponge (np.ndarray): The absorbing edge layer from sponge_profile, before the global damping.
+        damp (np.ndarray): The factor the velocity of each texel is multiplied by every step.
+        disp (np.ndarray): Displacement of each texel (red channel).
+        vel (np.ndarray): Velocity of each texel (green channel).
+        material (MaterialGrid): The rasterised walls and mediums, shared with the material texture.
+        mat (np.ndarray): Wave-speed coefficient of each texel, 0 for walls and 1 for free space.
+    """
+
+    # Pairs of (neighbour, opposite neighbour) slices into the padded buffers, one for each offset
+    # sampled by getAdjacent in the simulation shaders
+    _RIGHT = (slice(1, -1), slice(2, None))
+    _LEFT = (slice(1, -1), slice(None, -2))
+    _UP = (slice(2, None), slice(1, -1))
+    _DOWN = (slice(None, -2), slice(1, -1))
+    _NEIGHBOURS = ((_RIGHT, _LEFT), (_LEFT, _RIGHT), (_UP, _DOWN), (_DOWN, _UP))
+
+    def __init__(
+        self,
+        size,
+        damping=1.0,
+        reflective=False,
+        spongeWidth=SPONGE_WIDTH,
+        spongeStrength=SPONGE_STRENGTH,
+    ):
+        """
+        Initializes the CPUSolver object and allocates all of its buffers.
+
+        Args:
+            size (tuple): Size of the simulation grid (width, height).
+            damping (float, optional): Global damping factor. Defaults to 1.0.
+            reflective (bool, optional): Whether walls reflect waves. Defaults to False.
+            spongeWidth (float, optional): Width of the absorbing edge layer in texels. Defaults to SPONGE_WIDTH.
+            spongeStrength (float, optional): Absorption at the edge of the layer. Defaults to SPONGE_STRENGTH.
+        """
+        super().__init__(size, damping, reflective)
+        width, height = self.size
+
+        # State of the field, one array per channel of the state texture
+        self.disp = np.zeros((height, width), dtype=np.float32)
+        self.vel = np.zeros((height, width), dtype=np.float32)
+        self.material = MaterialGrid(self.size)
+        self.mat = self.material.mat
+        self.open = np.ones((height, width), dtype=np.float32)  # 1 where mat > 0
+        self.sponge = sponge_profile(self.size, spongeWidth, spongeStrength)
+        self.damp = self.sponge * np.float32(damping)
+
+        # Zero padded copies, so that neighbours outside the grid read as walls
+        self.padDisp = np.zeros((height + 2, width + 2), dtype=np.float32)
+        self.padOpen = np.zeros((height + 2, width + 2), dtype=np.float32)
+
+        # Scratch buffers reused by every step
+        self.adj = np.zeros((height, width), dtype=np.float32)
+        self.tmp = np.zeros((height, width), dtype=np.float32)
+
+        # Source texels and parameters, filled in by set_scene
+        self.srcX = np.zeros(0, dtype=np.intp)
+        self.srcY = np.zeros(0, dtype=np.intp)
+        self.bank = SourceBank()
+        self.srcDisp = np.zeros(0, dtype=np.float64)
+
+        self.set_scene([], [])
+
+    def set_scene(self, sources, mediums):
+        """
+        Replaces the scene, rasterising the mediums into the material array and caching the
+        position and parameters of every source.
+
+        Args:
+            sources (list): The sources in the scene.
+            mediums (list): The walls and mediums in the scene.
+        """
+        super().set_scene(sources, mediums)
+
+        # Free space everywhere, then each rotated medium writes its refractive index (0 for walls),
+        # with the outermost ring of texels left as a wall
+        self.material.rasterise(self.mediums)
+
+        # Cache the texel and parameters of every simulated source, gathered from their SceneStore
+        sources = simulated_sources(self.sources)
+        self.srcX, self.srcY = source_texels(sources, self.size)
+        self.bank.set_sources(sources)
+        self.srcDisp = np.zeros(len(sources), dtype=np.float64)
+
+        np.greater(self.mat, 0, out=self.open)
+        self.padOpen[1:-1, 1:-1] = self.open
+
+    def set_damping(self, damping):
+        """
+        Sets the global damping factor, rescaling the sponge layer into the damping field.
+
+        Args:
+            damping (float): The new damping factor.
+        """
+        self.damping = damping
+        np.multiply(self.sponge, np.float32(damping), out=self.damp)
+
+    def reset(self):
+        # Clears the displacement and velocity of the whole field.
+        self.disp.fill(0)
+        self.vel.fill(0)
+
+    def step(self, time, disp=None):
+        """
+        Advances the field by one stencil pass, then injects the sources at the given time.
+
+        Args:
+            time (float): The simulation time used to evaluate the source displacements.
+            disp (np.ndarray, optional): The source displacements at this time, if already evaluated.
+        """
+        pd = self.padDisp
+        po = self.padOpen
+        adj = self.adj
+        tmp = self.tmp
+
+        # Sum the four neighbours using the absorb or reflect rule of getAdjacent
+        if self.reflective:
+            # A wall neighbour is replaced by the neighbour on the opposite side
+            pd[1:-1, 1:-1] = self.disp
+            adj.fill(0)
+            for near, far in self._NEIGHBOURS:
+                np.subtract(pd[near], pd[far], out=tmp)
+                np.multiply(tmp, po[near], out=tmp)
+                np.add(tmp, pd[far], out=tmp)
+                np.add(adj, tmp, out=adj)
+        else:
+            # A wall neighbour contributes nothing
+            np.multiply(self.disp, self.open, out=pd[1:-1, 1:-1])
+            np.add(pd[self._RIGHT], pd[self._LEFT], out=adj)
+            np.add(adj, pd[self._UP], out=adj)
+            np.add(adj, pd[self._DOWN], out=adj)
+
+        # newVel = mat*(adj-4*disp)*0.375+vel*(damping*sponge)
+        np.multiply(self.disp, 4, out=tmp)
+        np.subtract(adj, tmp, out=tmp)
+        np.multiply(tmp, self.mat, out=tmp)
+        np.multiply(tmp, 0.375, out=tmp)
+        np.multiply(self.vel, self.damp, out=self.vel)
+        np.add(self.vel, tmp, out=self.vel)
+
+        # newDisp = disp+newVel, with walls held at zero
+        np.multiply(self.vel, self.open, out=self.vel)
+        np.add(self.disp, self.vel, out=self.disp)
+        np.multiply(self.disp, self.open, out=self.disp)
+
+        # Inject the sources: disp = sin((time - zerot) * f + phase) * a, vel = 0
+        if len(self.srcDisp):
+            if disp is None:
+                disp = self.bank.evaluate(time, out=self.srcDisp)
+            self.disp[self.srcY, self.srcX] = disp
+            self.vel[self.srcY, self.srcX] = 0
+
+    def run(self, times, block=256):
+        """
+        Runs one step at each of a sequence of times, evaluating the sources for a whole block of
+        steps in a single vectorized call.
+
+        Args:
+            times (np.ndarray): The simulation time of each step, in order.
+            block (int, optional): The number of steps evaluated together. Defaults to 256.
+        """
+        times = np.asarray(times, dtype=np.float64)
+        for start in range(0, len(times), block):
+            chunk = times[start : start + block]
+            disps = self.bank.evaluate(chunk)
+            for time, disp in zip(chunk, disps):
+                self.step(time, disp)
+
+    def set_field(self, field):
+        """
+        Overwrites the displacement and velocity of the field.
+
+        Args:
+            field (np.ndarray): A (height, width, 2 or 3) array of displacement and velocity.
+        """
+        self.disp[...] = field[..., 0]
+        self.vel[...] = field[..., 1]
+
+    def get_field(self) -> np.ndarray:
+        """
+        Returns a copy of the current state of the field.
+
+        Returns:
+            np.ndarray: A (height, width, 3) float32 array of displacement, velocity and material.
+        """
+        return np.stack([self.disp, self.vel, self.mat], axis=-1)
+
+
+class GPUSolver(Solver):
+    """
+    The fragment shader backend, stepping the ping-pong textures owned by an initialised App.
+
+    Attributes:
+        app (App): The application holding the GL context, shaders and textures.
+    """
+
+    def __init__(self, app):
+        """
+        Initializes the GPUSolver object around an App whose on_init has already run.
+
+        Args:
+            app (App): The application to step.
+        """
+        super().__init__(app.size, app.damping, app.reflective)
+        self.app = app
+        self.sources = app.sources
+        self.mediums = app.mediums
+
+    def set_scene(self, sources, mediums):
+        """
+        Replaces the scene simulated by the App, rasterising every medium into the material texture.
+        Sources and mediums the App does not already hold are registered with it.
+
+        Args:
+            sources (list): The sources in the scene.
+            mediums (list): The walls and mediums in the scene.
+        """
+        for item in list(sources) + list(mediums):
+            if self.app.registry.get(item.get_id()) is not item:
+                self.app.add_item(item)
+        self.sources = self.app.sources
+        self.mediums = self.app.mediums
+        self.app.sourcesDirty = True
+        self.app.wallsDirty = True
+        self.app.update_material((0, 0, self.size[0], self.size[1]))
+
+    def set_damping(self, damping):
+        # Sets the global damping factor, which the App passes to the shader as a uniform.
+        self.damping = damping
+        self.app.damping = damping
+
+    def set_reflective(self, reflective):
+        # Sets whether walls reflect waves, switching the App's simulation shader.
+        self.reflective = reflective
+        self.app.reflective = reflective
+
+    def step(self, time):
+        """
+        Runs one stencil pass of the App's simulation shader at the given time.
+
+        Args:
+            time (float): The simulation time used to evaluate the source displacements.
+        """
+        self.app.simulate(1, [time])
+
+    def run(self, times):
+        """
+        Runs one stencil pass at each of a sequence of times, setting up the stencil state once.
+
+        Args:
+            times (np.ndarray): The simulation time of each step, in order.
+        """
+        self.app.simulate(len(times), times)
+
+    def set_field(self, field):
+        """
+        Uploads the displacement and velocity of the field into both ping-pong textures.
+
+        Args:
+            field (np.ndarray): A (height, width, 2 or 3) array of displacement and velocity.
+        """
+        width, height = self.size
+        data = np.ascontiguousarray(field[..., :2], dtype=np.float32)
+        for texture in (self.app.renderTexture1, self.app.renderTexture2):
+            glTextureSubImage2D(
+                texture.get_id(), 0, 0, 0, width, height, GL_RG, GL_FLOAT, data
+            )
+
+    def get_field(self) -> np.ndarray:
+        """
+        Reads the most recently written state texture back from the GPU, alongside the App's copy
+        of the material texture.
+
+        Returns:
+            np.ndarray: A (height, width, 3) float32 array of displacement, velocity and material.
+        """
+        width, height = self.size
+        pixels = np.empty((height, width, 2), dtype=np.float32)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.app.renderTexture1.framebuffer.get_id())
+        glReadPixels(0, 0, width, height, GL_RG, GL_FLOAT, pixels)
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+        field = np.empty((height, width, 3), dtype=np.float32)
+        field[..., :2] = pixels
+        field[..., 2] = self.app.material.mat
+        return field
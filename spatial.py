@@ -0,0 +1,132 @@
+import math
+
+
+def point_in_polygon(point, corners) -> bool:
+    """
+    Checks whether a point lies inside (or on the edge of) a convex polygon.
+
+    Args:
+        point (tuple): The (x, y) point to test.
+        corners (tuple): The (x, y) vertices of the polygon in order, either winding.
+
+    Returns:
+        bool: True if the point is inside the polygon.
+    """
+    px, py = point
+    sign = 0
+    for i in range(len(corners)):
+        ax, ay = corners[i - 1]
+        bx, by = corners[i]
+        cross = (bx - ax) * (py - ay) - (by - ay) * (px - ax)
+        if cross != 0:
+            if sign == 0:
+                sign = 1 if cross > 0 else -1
+            elif (cross > 0) != (sign > 0):
+                return False
+    return True
+
+
+class SpatialGrid:
+    """
+    A uniform grid over the outlines of the draggable items, used to pick the item under the mouse.
+
+    Each item is stored with its corners (rotated for mediums) and is registered in every cell its
+    bounding box overlaps. Picking only tests the items in the cell under the point, first against
+    their bounding box and then exactly against their oriented outline, so it stays fast however
+    many items are in the scene. When items overlap, the one with the highest id (the most
+    recently added) is picked, matching the order they are drawn in.
+
+    Attributes:
+        cellSize (float): Width and height of each cell, in pixels.
+        cells (dict): Maps each (column, row) cell to the set of ids overlapping it.
+        items (dict): Maps each id to its (corners, bounds, cells).
+    """
+
+    def __init__(self, cellSize=64):
+        """
+        Initializes an empty SpatialGrid object.
+
+        Args:
+            cellSize (float, optional): Width and height of each cell, in pixels. Defaults to 64.
+        """
+        self.cellSize = cellSize
+        self.cells = {}
+        self.items = {}
+
+    def get_cells(self, bounds):
+        # Returns the (column, row) of every cell overlapped by a bounding box.
+        x0, y0, x1, y1 = bounds
+        c0, r0 = math.floor(x0 / self.cellSize), math.floor(y0 / self.cellSize)
+        c1, r1 = math.floor(x1 / self.cellSize), math.floor(y1 / self.cellSize)
+        return [(c, r) for c in range(c0, c1 + 1) for r in range(r0, r1 + 1)]
+
+    def insert(self, id, corners):
+        """
+        Adds an item to the grid, replacing it if it is already present.
+
+        Args:
+            id (int): The id of the item (its index in App.dragItems).
+            corners (list): The (x, y) corners of the item's outline in order.
+        """
+        if id in self.items:
+            self.remove(id)
+        corners = tuple((float(x), float(y)) for x, y in corners)
+        xs = [x for x, _ in corners]
+        ys = [y for _, y in corners]
+        bounds = (min(xs), min(ys), max(xs), max(ys))
+        cells = self.get_cells(bounds)
+        for cell in cells:
+            self.cells.setdefault(cell, set()).add(id)
+        self.items[id] = (corners, bounds, cells)
+
+    def update(self, id, corners):
+        """
+        Moves an item after its position, size or rotation has changed.
+
+        Args:
+            id (int): The id of the item.
+            corners (list): The new (x, y) corners of the item's outline in order.
+        """
+        self.insert(id, corners)
+
+    def remove(self, id):
+        """
+        Removes an item from the grid. Removing an item that is not present does nothing.
+
+        Args:
+            id (int): The id of the item.
+        """
+        item = self.items.pop(id, None)
+        if item is None:
+            return
+        for cell in item[2]:
+            ids = self.cells[cell]
+            ids.discard(id)
+            if not ids:
+                del self.cells[cell]
+
+    def pick(self, point):
+        """
+        Finds the item under a point.
+
+        Args:
+            point (tuple): The (x, y) point, in the same space as the corners.
+
+        Returns:
+            int or None: The id of the topmost item containing the point, or None if there is none.
+        """
+        x, y = point
+        cell = (math.floor(x / self.cellSize), math.floor(y / self.cellSize))
+        picked = None
+        for id in self.cells.get(cell, ()):
+            if picked is not None and id < picked:
+                continue
+            corners, (x0, y0, x1, y1), _ = self.items[id]
+            if x0 <= x <= x1 and y0 <= y <= y1 and point_in_polygon(point, corners):
+                picked = id
+        return picked
+
+    def clear(self):
+        # Removes every item from the grid.
+        self.cells.clear()
+        self.items.clear()
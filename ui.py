@@ -0,0 +1,71 @@
+from collections import OrderedDict
+
+
+class TextCache:
+    """
+    Rendered text surfaces and text sizes for one font, so a label is only rasterised the first
+    time it is drawn rather than every frame.
+
+    The least recently used entries are dropped once more than `limit` are held, so text that keeps
+    changing (such as timings) cannot grow the cache without bound.
+
+    Attributes:
+        font (pygame.font.Font): The font text is rendered with.
+        limit (int): The most surfaces, and the most sizes, kept at once.
+        surfaces (OrderedDict): Maps (text, antialias, colour) to its rendered surface.
+        sizes (OrderedDict): Maps text to its (width, height) in pixels.
+    """
+
+    def __init__(self, font, limit=256):
+        """
+        Initializes an empty TextCache object.
+
+        Args:
+            font (pygame.font.Font): The font text is rendered with.
+            limit (int, optional): The most surfaces and sizes kept at once. Defaults to 256.
+        """
+        self.font = font
+        self.limit = limit
+        self.surfaces = OrderedDict()
+        self.sizes = OrderedDict()
+
+    def get(self, cache, key, make):
+        # Returns the cached value for a key, making and storing it first if it is missing.
+        value = cache.get(key)
+        if value is None:
+            value = make()
+            cache[key] = value
+            if len(cache) > self.limit:
+                cache.popitem(last=False)
+        else:
+            cache.move_to_end(key)
+        return value
+
+    def render(self, text, antialias, colour):
+        """
+        Returns the surface of a piece of text, as pygame.font.Font.render would.
+
+        Args:
+            text (str): The text to render.
+            antialias (bool): Whether the text is antialiased.
+            colour (pygame.Color): The colour of the text.
+
+        Returns:
+            pygame.Surface: The rendered text. It is shared, so it must not be drawn on.
+        """
+        key = (text, antialias, tuple(colour))
+        return self.get(
+            self.surfaces, key, lambda: self.font.render(text, antialias, colour)
+        )
+
+    def size(self, text):
+        """
+        Returns the size of a piece of text, as pygame.font.Font.size would.
+
+        Args:
+            text (str): The text to measure.
+
+        Returns:
+            tuple: The (width, height) of the text in pixels.
+        """
+        return self.get(self.sizes, text, lambda: self.font.size(text))